@@ -0,0 +1,71 @@
+import copy
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+from .caches import LRUCache
+from .metrics import timer
+
+# Проверенные access-токены (ключ - сам токен) живут до своего exp
+token_cache = LRUCache(settings.AUTH_TOKEN_CACHE_SIZE)
+# Пользователи по id; срок жизни короткий, т.к. другие процессы
+# узнают об изменении пользователя только по его истечении
+user_cache = LRUCache(settings.AUTH_USER_CACHE_SIZE, ttl=settings.AUTH_USER_CACHE_TTL)
+
+
+def invalidate_user(user_id):
+    user_cache.pop(str(user_id))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication с кэшем проверенных токенов и пользователей.
+
+    JWTAuthMiddleware аутентифицирует запрос один раз и сохраняет результат
+    в request.jwt_auth, DRF затем берёт его оттуда без повторной проверки.
+    """
+
+    def authenticate(self, request):
+        result = getattr(getattr(request, '_request', request), 'jwt_auth', None)
+        if result is not None:
+            return result
+        with timer('auth'):
+            return super().authenticate(request)
+
+    async def aauthenticate(self, request):
+        """authenticate для async-кода: в базу идёт только промах кэша пользователей."""
+        with timer('auth'):
+            header = self.get_header(request)
+            if header is None:
+                return None
+            raw_token = self.get_raw_token(header)
+            if raw_token is None:
+                return None
+            validated_token = self.get_validated_token(raw_token)
+            return await self.aget_user(validated_token), validated_token
+
+    def get_validated_token(self, raw_token):
+        key = raw_token.decode() if isinstance(raw_token, bytes) else raw_token
+        validated_token = token_cache.get(key)
+        if validated_token is None:
+            validated_token = super().get_validated_token(raw_token)
+            token_cache.set(key, validated_token, expires_at=validated_token['exp'])
+        return validated_token
+
+    def get_user(self, validated_token):
+        # В токене id может быть как числом, так и строкой
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        user = user_cache.get(str(user_id)) if user_id is not None else None
+        if user is None:
+            user = super().get_user(validated_token)
+            user_cache.set(str(user_id), user)
+        # Копия, чтобы изменения в одном запросе не попали в кэш
+        return copy.copy(user)
+
+    async def aget_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        user = user_cache.get(str(user_id)) if user_id is not None else None
+        if user is None:
+            return await sync_to_async(self.get_user)(validated_token)
+        return copy.copy(user)
@@ -0,0 +1,121 @@
+"""Проверка черного списка refresh-токенов без запроса к базе.
+
+При ротации каждый refresh-токен попадает в черный список, и
+стандартная проверка simplejwt ходит в базу при каждом обновлении.
+Здесь в памяти процесса держится bloom-фильтр по jti из черного
+списка: если jti в фильтре нет и его нет среди недавно добавленных в
+общем кэше, токен точно не в черном списке. Иначе решает база.
+
+Фильтр перестраивается из базы раз в TOKEN_BLACKLIST_BLOOM_REBUILD
+секунд; токены, добавленные в черный список между перестроениями,
+хранятся в кэше 'default'. Если этот кэш виден только своему процессу
+(LocMemCache, DummyCache), другие процессы о них не узнают, поэтому
+фильтр не используется и каждый токен проверяется в базе.
+"""
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .caches import is_process_local
+
+# Меньшего размера фильтр не строится, чтобы не перестраивать его на каждой сотне токенов
+MIN_CAPACITY = 10000
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        self.size = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        # Двойное хеширование: k позиций из двух половин одного дайджеста
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class BlacklistFilter:
+    recent_key = 'jwt:blacklisted:{}'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bloom = None
+        self._built_at = 0
+
+    def load(self):
+        from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+        # Истёкшие токены отклоняются по exp, в фильтре они не нужны
+        return list(
+            BlacklistedToken.objects.filter(token__expires_at__gt=timezone.now())
+            .values_list('token__jti', flat=True)
+            .iterator()
+        )
+
+    def rebuild(self):
+        started = time.monotonic()
+        jtis = self.load()
+        bloom = BloomFilter(max(MIN_CAPACITY, 2 * len(jtis)), settings.TOKEN_BLACKLIST_BLOOM_ERROR_RATE)
+        for jti in jtis:
+            bloom.add(jti)
+        self._bloom = bloom
+        self._built_at = started
+
+    def _ensure_fresh(self):
+        if self._bloom is not None and time.monotonic() - self._built_at < settings.TOKEN_BLACKLIST_BLOOM_REBUILD:
+            return
+        with self._lock:
+            if self._bloom is None or time.monotonic() - self._built_at >= settings.TOKEN_BLACKLIST_BLOOM_REBUILD:
+                self.rebuild()
+
+    def might_contain(self, jti):
+        """False - токена точно нет в черном списке, True - нужно проверить в базе."""
+        if is_process_local():
+            return True
+        self._ensure_fresh()
+        return jti in self._bloom or cache.get(self.recent_key.format(jti)) is not None
+
+    def add(self, jti):
+        if self._bloom is not None:
+            self._bloom.add(jti)
+        # Другие процессы узнают о токене из кэша, пока не перестроят фильтр;
+        # запись живёт два периода, чтобы её застало перестроение в каждом процессе
+        timeout = 2 * settings.TOKEN_BLACKLIST_BLOOM_REBUILD
+        transaction.on_commit(lambda: cache.set(self.recent_key.format(jti), 1, timeout))
+
+    def clear(self):
+        with self._lock:
+            self._bloom = None
+
+
+blacklist_filter = BlacklistFilter()
+
+
+class BloomRefreshToken(RefreshToken):
+    """RefreshToken, который обращается к черному списку в базе, только если jti есть в фильтре."""
+
+    def check_blacklist(self):
+        if blacklist_filter.might_contain(self.payload[api_settings.JTI_CLAIM]):
+            super().check_blacklist()
+
+    def blacklist(self):
+        result = super().blacklist()
+        blacklist_filter.add(self.payload[api_settings.JTI_CLAIM])
+        return result
@@ -0,0 +1,141 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+# Кэши, содержимое которых не видно другим процессам
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def is_process_local(alias='default'):
+    return settings.CACHES[alias]['BACKEND'] in PROCESS_LOCAL_CACHES
+
+
+class LRUCache:
+    """Потокобезопасный LRU-кэш с ограничением размера и сроком жизни записей."""
+
+    def __init__(self, max_size, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires_at=None):
+        if expires_at is None and self.ttl is not None:
+            expires_at = time.time() + self.ttl
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class ReferenceCache:
+    """Справочник, который держится в памяти процесса.
+
+    Версия справочника лежит в общем кэше (CACHES['default']): после
+    изменения данных она меняется, и каждый процесс при следующем
+    обращении перечитывает справочник из базы.
+    """
+    version_key = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._items = []
+
+    def load(self):
+        raise NotImplementedError
+
+    def index(self, items):
+        pass
+
+    def all(self):
+        self._ensure_fresh()
+        return self._items
+
+    def invalidate(self):
+        # Все процессы, включая свой, перечитают справочник после фиксации
+        # транзакции: перечитанный раньше мог бы сохранить под прежней
+        # версией данные, которые ещё откатятся
+        transaction.on_commit(self._reset)
+
+    def _reset(self):
+        cache.set(self.version_key, uuid.uuid4().hex, None)
+        self._version = None
+
+    def _shared_version(self):
+        version = cache.get(self.version_key)
+        if version is None:
+            cache.add(self.version_key, uuid.uuid4().hex, None)
+            version = cache.get(self.version_key)
+        return version
+
+    def _ensure_fresh(self):
+        version = self._shared_version()
+        if version == self._version:
+            return
+        with self._lock:
+            if version != self._version:
+                items = self.load()
+                self.index(items)
+                self._items = items
+                self._version = version
+
+
+class CategoryCache(ReferenceCache):
+    version_key = 'reference:category:version'
+
+    def __init__(self):
+        super().__init__()
+        self._by_id = {}
+        self._names = frozenset()
+
+    def load(self):
+        from .models import Category
+
+        # Справочник читается и внутри replica_reads(); снимок отставшей
+        # реплики остался бы в кэше под новой версией до следующей записи
+        return list(Category.objects.using('default').order_by('category_id'))
+
+    def index(self, items):
+        self._by_id = {category.category_id: category for category in items}
+        self._names = frozenset(category.name.lower() for category in items)
+
+    def get(self, category_id):
+        self._ensure_fresh()
+        return self._by_id.get(category_id)
+
+    def name_exists(self, name):
+        self._ensure_fresh()
+        return name.lower() in self._names
+
+
+category_cache = CategoryCache()
@@ -0,0 +1,122 @@
+import math
+from collections import namedtuple
+
+# Сетка для пространственного индекса: ячейки 0.01° (~1.1 км по широте)
+GRID_CELL_DEGREES = 0.01
+GRID_ROWS = int(round(180 / GRID_CELL_DEGREES))
+GRID_COLUMNS = int(round(360 / GRID_CELL_DEGREES))
+
+# Если bbox захватывает больше строк сетки, перечислять диапазоны ячеек
+# дороже, чем просто пройти по индексу (latitude, longitude)
+MAX_BBOX_GRID_ROWS = 64
+
+# Кластеры маркеров: ячейка кластера занимает 1/CLUSTER_CELLS_PER_TILE
+# ширины тайла карты на данном масштабе
+CLUSTER_CELLS_PER_TILE = 4
+# Масштабы, для которых кластеры хранятся в таблице EventCluster
+CLUSTER_ZOOM_LEVELS = (4, 6, 8, 10)
+CLUSTER_SAMPLE_SIZE = 5
+MAX_ZOOM = 21
+
+# Предел широты проекции Web Mercator, в которой нумеруются тайлы z/x/y
+MAX_TILE_LATITUDE = 85.0511287798
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+BBox = namedtuple('BBox', ['min_lat', 'min_lon', 'max_lat', 'max_lon'])
+
+
+def _clamp(value, low, high):
+    return max(low, min(high, value))
+
+
+def grid_row(lat):
+    return _clamp(int(math.floor((float(lat) + 90) / GRID_CELL_DEGREES)), 0, GRID_ROWS - 1)
+
+
+def grid_column(lon):
+    return _clamp(int(math.floor((float(lon) + 180) / GRID_CELL_DEGREES)), 0, GRID_COLUMNS - 1)
+
+
+def grid_cell(lat, lon):
+    return grid_row(lat) * GRID_COLUMNS + grid_column(lon)
+
+
+def grid_cell_ranges(bbox):
+    """Диапазоны номеров ячеек (по одному на строку сетки), покрывающие bbox."""
+    first_column = grid_column(bbox.min_lon)
+    last_column = grid_column(bbox.max_lon)
+    return [
+        (row * GRID_COLUMNS + first_column, row * GRID_COLUMNS + last_column)
+        for row in range(grid_row(bbox.min_lat), grid_row(bbox.max_lat) + 1)
+    ]
+
+
+def parse_bbox(value):
+    """Разбирает строку вида 'min_lat,min_lon,max_lat,max_lon'."""
+    try:
+        parts = [float(part) for part in value.split(',')]
+    except (AttributeError, ValueError):
+        raise ValueError('bbox должен иметь вид min_lat,min_lon,max_lat,max_lon')
+    if len(parts) != 4 or not all(math.isfinite(part) for part in parts):
+        raise ValueError('bbox должен иметь вид min_lat,min_lon,max_lat,max_lon')
+
+    bbox = BBox(*parts)
+    if bbox.min_lat > bbox.max_lat or bbox.min_lon > bbox.max_lon:
+        raise ValueError('Минимальные координаты bbox должны быть меньше максимальных')
+    return bbox
+
+
+def cluster_cell_degrees(zoom):
+    return 360 / (2 ** zoom) / CLUSTER_CELLS_PER_TILE
+
+
+def cluster_cell(lat, lon, zoom):
+    size = cluster_cell_degrees(zoom)
+    return int(math.floor((float(lon) + 180) / size)), int(math.floor((float(lat) + 90) / size))
+
+
+def cluster_cell_bbox(cell_x, cell_y, zoom):
+    size = cluster_cell_degrees(zoom)
+    return BBox(cell_y * size - 90, cell_x * size - 180, (cell_y + 1) * size - 90, (cell_x + 1) * size - 180)
+
+
+def tile_xy(lat, lon, zoom):
+    """Номер тайла карты (x, y), в который попадает точка, в схеме z/x/y (OSM)."""
+    count = 2 ** zoom
+    lat = math.radians(_clamp(float(lat), -MAX_TILE_LATITUDE, MAX_TILE_LATITUDE))
+    x = int(math.floor((float(lon) + 180) / 360 * count))
+    y = int(math.floor((1 - math.asinh(math.tan(lat)) / math.pi) / 2 * count))
+    return _clamp(x, 0, count - 1), _clamp(y, 0, count - 1)
+
+
+def tile_bbox(x, y, zoom):
+    count = 2 ** zoom
+
+    def latitude(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / count))))
+
+    return BBox(latitude(y + 1), x / count * 360 - 180, latitude(y), (x + 1) / count * 360 - 180)
+
+
+def radius_bbox(lat, lon, radius_km):
+    """bbox, в который гарантированно попадает круг радиуса radius_km вокруг точки."""
+    lat_delta = radius_km / KM_PER_DEGREE
+    cos_lat = math.cos(math.radians(lat))
+    # У полюса круг охватывает все долготы
+    if cos_lat < 1e-6 or radius_km / (KM_PER_DEGREE * cos_lat) >= 180:
+        lon_delta = 180
+    else:
+        lon_delta = radius_km / (KM_PER_DEGREE * cos_lat)
+    return BBox(
+        max(-90.0, lat - lat_delta), max(-180.0, lon - lon_delta),
+        min(90.0, lat + lat_delta), min(180.0, lon + lon_delta),
+    )
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (float(lat1), float(lon1), float(lat2), float(lon2)))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
@@ -0,0 +1,122 @@
+"""Хеширование паролей в отдельном пуле процессов.
+
+PBKDF2 занимает CPU на сотни миллисекунд, поэтому при всплеске входов
+рабочие процессы сервера перестают обслуживать остальной API. Хеши
+считаются в пуле из PASSWORD_HASHING_WORKERS процессов; одновременно
+ожидать могут не больше PASSWORD_HASHING_QUEUE задач, остальные сразу
+получают HashingBusy (503), а не встают в очередь.
+
+Место в очереди освобождается, когда задача в пуле завершилась или
+отменена, а не когда её перестали ждать: зависшие хеши тоже занимают
+очередь. Async-версии (amake_password, acheck_password) ждут пул, не
+занимая поток; без пула (PASSWORD_HASHING_WORKERS = 0) хеш считается в
+потоке, а не в цикле событий.
+"""
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import hashers
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class HashingBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Сервер перегружен входами, повторите попытку позже'
+    default_code = 'hashing_busy'
+
+
+_executor = None
+_slots = None
+_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor, _slots
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _slots = threading.BoundedSemaphore(settings.PASSWORD_HASHING_QUEUE)
+                # spawn: дочерние процессы не наследуют соединения с базой и потоки
+                _executor = ProcessPoolExecutor(
+                    max_workers=settings.PASSWORD_HASHING_WORKERS,
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+    return _executor
+
+
+def _submit(function, *args):
+    executor = _get_executor()
+    slots = _slots
+    if not slots.acquire(blocking=False):
+        raise HashingBusy()
+    try:
+        future = executor.submit(function, *args)
+    except BaseException:
+        slots.release()
+        raise
+    future.add_done_callback(lambda future: slots.release())
+    return future
+
+
+def _run(function, *args):
+    if not settings.PASSWORD_HASHING_WORKERS:
+        return function(*args)
+    future = _submit(function, *args)
+    try:
+        return future.result(timeout=settings.PASSWORD_HASHING_TIMEOUT)
+    except TimeoutError:
+        # Ещё не начатая задача снимается с очереди; начатая держит место, пока не завершится
+        future.cancel()
+        raise HashingBusy()
+
+
+async def _arun(function, *args):
+    if not settings.PASSWORD_HASHING_WORKERS:
+        # Хеш не должен останавливать цикл событий на сотни миллисекунд
+        return await sync_to_async(function, thread_sensitive=False)(*args)
+    try:
+        # Отмена asyncio-future при таймауте отменяет и задачу в пуле
+        return await asyncio.wait_for(
+            asyncio.wrap_future(_submit(function, *args)), settings.PASSWORD_HASHING_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        raise HashingBusy()
+
+
+def make_password(password):
+    if password is None:
+        # Непригодный пароль хешировать не нужно
+        return hashers.make_password(None)
+    return _run(hashers.make_password, password)
+
+
+async def amake_password(password):
+    if password is None:
+        return hashers.make_password(None)
+    return await _arun(hashers.make_password, password)
+
+
+def check_password(password, encoded):
+    """Возвращает (пароль верен, хеш нужно пересчитать текущим хешером)."""
+    if password is None or not hashers.is_password_usable(encoded):
+        return False, False
+    return _checked(_run(hashers.check_password, password, encoded), encoded)
+
+
+async def acheck_password(password, encoded):
+    if password is None or not hashers.is_password_usable(encoded):
+        return False, False
+    return _checked(await _arun(hashers.check_password, password, encoded), encoded)
+
+
+def _checked(valid, encoded):
+    if not valid:
+        return False, False
+    # Сменился хешер или его параметры (например, число итераций PBKDF2)
+    hasher = hashers.identify_hasher(encoded)
+    return True, hasher.algorithm != hashers.get_hasher().algorithm or hasher.must_update(encoded)
@@ -0,0 +1,126 @@
+import csv
+import io
+import json
+from itertools import islice
+
+from django.db import connections, transaction
+from django.utils import timezone
+
+from . import tiles
+from .models import Event, EventCluster
+from .serializers import EventSerializer
+
+IMPORT_FORMATS = ('csv', 'ndjson')
+# Поля мероприятия в порядке столбцов COPY
+COPY_COLUMNS = ('title', 'description', 'latitude', 'longitude', 'datetime', 'category_id', 'creator_id',
+                'grid_cell', 'going_count', 'updated_at', 'version')
+
+
+def read_rows(lines, format):
+    """Построчно разбирает поток строк, возвращает пары (номер строки, данные или ошибка)."""
+    if format == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            # Пустая ячейка означает отсутствующее значение
+            yield reader.line_num, {key: value for key, value in row.items() if key and value != ''}
+    elif format == 'ndjson':
+        for number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield number, ValueError('Некорректный JSON')
+                continue
+            yield number, row if isinstance(row, dict) else ValueError('Ожидается JSON-объект')
+    else:
+        raise ValueError(f"Неизвестный формат: {format}, допустимые: {', '.join(IMPORT_FORMATS)}")
+
+
+class EventImporter:
+    """Загружает мероприятия пачками по batch_size строк.
+
+    Каждая строка проверяется EventSerializer, ошибочные строки передаются
+    в on_error и не прерывают загрузку. Пачка записывается одним
+    bulk_create (COPY на PostgreSQL) в своей транзакции, поэтому память
+    ограничена размером пачки, а не файла.
+    """
+
+    def __init__(self, creator, batch_size=1000, on_error=None, on_progress=None, using='default'):
+        self.creator = creator
+        self.batch_size = batch_size
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self.using = using
+        self.processed = self.created = self.failed = 0
+
+    def run(self, rows, update_clusters=True):
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, self.batch_size))
+            if not chunk:
+                break
+            events = [event for event in (self.build(number, row) for number, row in chunk) if event is not None]
+            self.write(events, update_clusters)
+            self.processed += len(chunk)
+            self.created += len(events)
+            if self.on_progress:
+                self.on_progress(self)
+        return self
+
+    def build(self, number, row):
+        if isinstance(row, Exception):
+            self.error(number, {'non_field_errors': [str(row)]})
+            return None
+        serializer = EventSerializer(data=row)
+        if not serializer.is_valid():
+            self.error(number, serializer.errors)
+            return None
+        return Event(creator=self.creator, **serializer.validated_data)
+
+    def error(self, number, errors):
+        self.failed += 1
+        if self.on_error:
+            self.on_error(number, errors)
+
+    def write(self, events, update_clusters=True):
+        if not events:
+            return
+        with transaction.atomic(using=self.using):
+            if connections[self.using].vendor == 'postgresql':
+                self.copy(events)
+            else:
+                Event.objects.using(self.using).bulk_create(events)
+            # bulk_create не вызывает сигналы: кластеры обновляются по
+            # ячейкам, затронутым пачкой, а не пересчётом всей таблицы
+            if update_clusters:
+                EventCluster.objects.using(self.using).add_events(events)
+            tiles.invalidate_points(((event.latitude, event.longitude) for event in events), using=self.using)
+
+    def copy(self, events):
+        now = timezone.now()
+        buffer = io.StringIO()
+        # В CSV формате COPY NULL - только пустое значение без кавычек. Всё,
+        # кроме None, берётся в кавычки: пустой description записывается
+        # пустой строкой, как у bulk_create, а None - NULL
+        writer = csv.writer(buffer, quoting=csv.QUOTE_NOTNULL)
+        for event in events:
+            event.grid_cell = Event._meta.get_field('grid_cell').pre_save(event, True)
+            writer.writerow([
+                event.title, event.description, event.latitude, event.longitude, event.datetime.isoformat(),
+                event.category_id, event.creator_id, event.grid_cell, 0, now.isoformat(), 1,
+            ])
+        sql = f"COPY {Event._meta.db_table} ({', '.join(COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)"
+        with connections[self.using].cursor() as cursor:
+            raw = cursor.cursor
+            if hasattr(raw, 'copy'):
+                # psycopg 3
+                with raw.copy(sql) as copy:
+                    copy.write(buffer.getvalue())
+            else:
+                buffer.seek(0)
+                raw.copy_expert(sql, buffer)
+
+
+def format_errors(errors):
+    return json.dumps(errors, ensure_ascii=False, default=str)
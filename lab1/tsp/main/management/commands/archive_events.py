@@ -0,0 +1,76 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from main import tiles
+from main.models import (
+    Event, EventArchive, EventCluster, EventTombstone, EventToCategory, Reaction, ReactionArchive,
+)
+
+EVENT_FIELDS = ('event_id', 'title', 'description', 'latitude', 'longitude', 'datetime',
+                'category_id', 'creator_id', 'going_count')
+REACTION_FIELDS = ('reaction_id', 'user_id', 'event_id', 'type')
+
+
+class Command(BaseCommand):
+    help = 'Переносит прошедшие мероприятия вместе с реакциями в архивные таблицы'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            help='Архивировать мероприятия, прошедшие больше N дней назад '
+                                 '(по умолчанию EVENT_ARCHIVE_AFTER)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Мероприятий за одну транзакцию')
+        parser.add_argument('--limit', type=int, help='Не больше N мероприятий за запуск')
+
+    def handle(self, *args, **options):
+        after = timedelta(days=options['days']) if options['days'] is not None else settings.EVENT_ARCHIVE_AFTER
+        cutoff = timezone.now() - after
+        limit = options['limit']
+        total = 0
+
+        while limit is None or total < limit:
+            size = options['batch_size'] if limit is None else min(options['batch_size'], limit - total)
+            # Индекс main_event_datetime_id_idx: старые мероприятия выбираются диапазоном
+            ids = list(
+                Event.objects.filter(datetime__lt=cutoff)
+                .order_by('datetime', 'event_id')
+                .values_list('event_id', flat=True)[:size]
+            )
+            if not ids:
+                break
+            self.archive(ids)
+            total += len(ids)
+            self.stdout.write(f'Перенесено мероприятий: {total}')
+
+        self.stdout.write(self.style.SUCCESS(f'Архивировано мероприятий: {total}'))
+
+    @staticmethod
+    def archive(ids):
+        with transaction.atomic():
+            events = list(Event.objects.filter(event_id__in=ids).values(*EVENT_FIELDS))
+            EventArchive.objects.bulk_create([EventArchive(**event) for event in events], ignore_conflicts=True)
+            ReactionArchive.objects.bulk_create(
+                [ReactionArchive(**reaction)
+                 for reaction in Reaction.objects.filter(event_id__in=ids).values(*REACTION_FIELDS)],
+                ignore_conflicts=True,
+            )
+            EventTombstone.objects.bulk_create(
+                EventTombstone(event_id=event['event_id'], latitude=event['latitude'], longitude=event['longitude'])
+                for event in events
+            )
+            tiles.invalidate_points((event['latitude'], event['longitude']) for event in events)
+
+            Reaction.objects.filter(event_id__in=ids).delete()
+            EventToCategory.objects.filter(event_id__in=ids).delete()
+            # Один DELETE вместо Event.delete() по одному объекту: обработчики
+            # post_delete (кластеры, tombstone) заменены действиями выше и ниже
+            placeholders = ', '.join(['%s'] * len(ids))
+            with connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {Event._meta.db_table} WHERE event_id IN ({placeholders})', ids)
+            # Только ячейки этой пачки; после DELETE образец дополняется оставшимися
+            EventCluster.objects.remove_events(
+                (event['event_id'], event['latitude'], event['longitude']) for event in events
+            )
@@ -0,0 +1,113 @@
+import json
+import math
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
+
+from main.models import User
+
+# Параметры запросов для действий, которым они обязательны
+ACTION_PARAMS = {
+    'events-clusters': {'zoom': 8},
+}
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+class Command(BaseCommand):
+    help = 'Замеряет задержку и число SQL-запросов GET-эндпоинтов API, результат выводит в JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help='Запросов на эндпоинт')
+        parser.add_argument('--warmup', type=int, default=3, help='Запросов на прогрев, не входят в результат')
+        parser.add_argument('--user', help='Имя пользователя для авторизации (по умолчанию первый)')
+        parser.add_argument('--endpoint', action='append', help='Только указанные эндпоинты (имя url)')
+        parser.add_argument('--bbox', help="Добавить bbox 'min_lat,min_lon,max_lat,max_lon' к спискам мероприятий")
+        parser.add_argument('--output', help='Файл для JSON (по умолчанию стандартный вывод)')
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('pk')
+        if options['user']:
+            users = users.filter(username=options['user'])
+        user = users.first()
+        if user is None:
+            raise CommandError('Нет пользователя для авторизации, создайте данные командой seed')
+
+        client = Client(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        endpoints = self.endpoints(user, options['bbox'])
+        if options['endpoint']:
+            endpoints = [endpoint for endpoint in endpoints if endpoint[0] in options['endpoint']]
+
+        results = {}
+        for name, url, params in endpoints:
+            for _ in range(options['warmup']):
+                client.get(url, params)
+            results[name] = self.measure(client, url, params, options['requests'])
+            self.stderr.write(f"{name}: p50 {results[name]['p50_ms']} мс, запросов к БД {results[name]['queries']}")
+
+        report = json.dumps({
+            'database': connection.vendor,
+            'requests_per_endpoint': options['requests'],
+            'endpoints': results,
+        }, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(report)
+        else:
+            self.stdout.write(report)
+
+    def endpoints(self, user, bbox):
+        """GET-эндпоинты всех viewset'ов роутера: список, объект и действия."""
+        from tsp.urls import router
+
+        endpoints = []
+        for prefix, viewset, basename in router.registry:
+            list_params = {'bbox': bbox} if bbox and basename == 'events' else {}
+            endpoints.append((f'{basename}-list', reverse(f'{basename}-list'), list_params))
+
+            model = viewset.queryset.model
+            objects = model.objects.order_by('pk')
+            # Реакции доступны только их автору
+            if any(field.name == 'user' for field in model._meta.fields):
+                objects = objects.filter(user=user)
+            obj = objects.first()
+            if obj is not None:
+                endpoints.append((f'{basename}-detail', reverse(f'{basename}-detail', args=[obj.pk]), {}))
+
+            for action in viewset.get_extra_actions():
+                if action.detail or 'get' not in action.mapping:
+                    continue
+                name = f'{basename}-{action.url_name}'
+                endpoints.append((name, reverse(name), {**list_params, **ACTION_PARAMS.get(name, {})}))
+        return endpoints
+
+    def measure(self, client, url, params, count):
+        timings, statuses, queries = [], set(), 0
+        started = time.perf_counter()
+        for _ in range(count):
+            with CaptureQueriesContext(connection) as captured:
+                begin = time.perf_counter()
+                response = client.get(url, params)
+                timings.append((time.perf_counter() - begin) * 1000)
+            statuses.add(response.status_code)
+            queries = max(queries, len(captured))
+        elapsed = time.perf_counter() - started
+
+        return {
+            'url': url,
+            'params': params,
+            'status': sorted(statuses),
+            'throughput_rps': round(count / elapsed, 1),
+            'p50_ms': round(percentile(timings, 50), 2),
+            'p95_ms': round(percentile(timings, 95), 2),
+            'p99_ms': round(percentile(timings, 99), 2),
+            'queries': queries,
+        }
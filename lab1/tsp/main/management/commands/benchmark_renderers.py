@@ -0,0 +1,73 @@
+import json
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from main import renderers
+from main.serializers import EventSerializer
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает скорость рендереров на ответе со списком мероприятий, результат выводит в JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=10000, help='Мероприятий в ответе')
+        parser.add_argument('--repeat', type=int, default=20, help='Повторов на рендерер')
+
+    def handle(self, *args, **options):
+        data = self.build_response(options['events'])
+        candidates = {'drf-json': JSONRenderer(), 'fast-json': renderers.FastJSONRenderer()}
+        if renderers.msgpack is not None:
+            candidates['msgpack'] = renderers.MessagePackRenderer()
+
+        results = {}
+        for name, renderer in candidates.items():
+            renderer.render(data)
+            started = time.perf_counter()
+            for _ in range(options['repeat']):
+                body = renderer.render(data)
+            elapsed = (time.perf_counter() - started) / options['repeat']
+            results[name] = {
+                'ms_per_response': round(elapsed * 1000, 2),
+                'events_per_second': round(options['events'] / elapsed),
+                'megabytes_per_second': round(len(body) / elapsed / 2 ** 20, 1),
+                'bytes': len(body),
+            }
+
+        self.stdout.write(json.dumps({
+            'events': options['events'],
+            'orjson': renderers.orjson is not None,
+            'renderers': results,
+        }, indent=2))
+
+    @staticmethod
+    def build_response(count):
+        """Данные страницы списка в том виде, в каком их отдаёт EventSerializer (без базы)."""
+        fields = {
+            name: field for name, field in EventSerializer().fields.items()
+            if name not in ('going_users', 'user_reaction')
+        }
+        start = timezone.now()
+        rows = []
+        for i in range(count):
+            values = {
+                'event_id': i + 1,
+                'title': f'Мероприятие {i}',
+                'description': f'Описание мероприятия {i}',
+                'latitude': Decimal('53.19587300') + Decimal(i) / 10 ** 6,
+                'longitude': Decimal('50.10019300'),
+                'datetime': start + timedelta(minutes=i),
+                'category': None,
+                'creator': None,
+                'going_count': i % 50,
+            }
+            row = {name: field.to_representation(values[name]) if values[name] is not None else None
+                   for name, field in fields.items()}
+            row['going_users'] = ['attendee1', 'attendee2']
+            row['user_reaction'] = 'going' if i % 3 else None
+            rows.append(row)
+        return {'next': None, 'results': rows}
@@ -0,0 +1,64 @@
+import csv
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.importing import IMPORT_FORMATS, EventImporter, format_errors, read_rows
+from main.models import User
+
+
+class Command(BaseCommand):
+    help = 'Загружает мероприятия из CSV или NDJSON пачками, ошибочные строки пишет в отдельный файл'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Файл с мероприятиями ('-' - стандартный ввод)")
+        parser.add_argument('--format', choices=IMPORT_FORMATS,
+                            help='Формат файла (по умолчанию по расширению)')
+        parser.add_argument('--creator', required=True, help='Имя пользователя - создателя мероприятий')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Строк в одной пачке')
+        parser.add_argument('--errors', help='CSV-файл для строк с ошибками (line, errors)')
+        parser.add_argument('--no-update-clusters', action='store_true',
+                            help='Не обновлять кластеры при загрузке')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if format == 'jsonl':
+            format = 'ndjson'
+        if format not in IMPORT_FORMATS:
+            raise CommandError('Не удалось определить формат файла, укажите --format')
+
+        try:
+            creator = User.objects.get(username=options['creator'])
+        except User.DoesNotExist:
+            raise CommandError(f"Пользователь {options['creator']} не найден")
+
+        errors_file = open(options['errors'], 'w', newline='', encoding='utf-8') if options['errors'] else None
+        errors_writer = csv.writer(errors_file) if errors_file else None
+        if errors_writer:
+            errors_writer.writerow(['line', 'errors'])
+
+        def on_error(number, errors):
+            if errors_writer:
+                errors_writer.writerow([number, format_errors(errors)])
+
+        def on_progress(importer):
+            self.stdout.write(
+                f'Обработано строк: {importer.processed}, загружено: {importer.created}, ошибок: {importer.failed}'
+            )
+
+        source = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        try:
+            importer = EventImporter(creator, options['batch_size'], on_error, on_progress).run(
+                read_rows(source, format), update_clusters=not options['no_update_clusters']
+            )
+        finally:
+            if source is not sys.stdin:
+                source.close()
+            if errors_file:
+                errors_file.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено мероприятий: {importer.created}, строк с ошибками: {importer.failed}'
+        ))
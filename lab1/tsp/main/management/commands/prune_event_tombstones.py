@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from main.models import EventTombstone
+
+
+class Command(BaseCommand):
+    help = 'Удаляет записи об удалённых мероприятиях старше EVENT_CHANGES_RETENTION'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000, help='Записей за одно удаление')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - settings.EVENT_CHANGES_RETENTION
+        total = 0
+        while True:
+            ids = list(
+                EventTombstone.objects.filter(deleted_at__lt=cutoff)
+                .values_list('pk', flat=True)[:options['batch_size']]
+            )
+            if not ids:
+                break
+            total += EventTombstone.objects.filter(pk__in=ids).delete()[0]
+        self.stdout.write(self.style.SUCCESS(f'Удалено записей: {total}'))
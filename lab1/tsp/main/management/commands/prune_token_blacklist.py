@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+
+class Command(BaseCommand):
+    help = 'Удаляет истёкшие refresh-токены из списков выданных токенов и черного списка'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000, help='Токенов за одно удаление')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        outstanding = blacklisted = 0
+        while True:
+            # На expires_at индекса нет, но старые токены лежат в начале
+            # первичного ключа, поэтому обход по id находит их быстро
+            ids = list(
+                OutstandingToken.objects.filter(expires_at__lt=now)
+                .order_by('id')
+                .values_list('id', flat=True)[:options['batch_size']]
+            )
+            if not ids:
+                break
+            with transaction.atomic():
+                blacklisted += BlacklistedToken.objects.filter(token_id__in=ids).delete()[0]
+                outstanding += OutstandingToken.objects.filter(id__in=ids).delete()[0]
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено выданных токенов: {outstanding}, из черного списка: {blacklisted}'
+        ))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from main import geo
+from main.models import EventCluster
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает таблицу кластеров мероприятий для стандартных масштабов карты'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--zoom', type=int, action='append', choices=geo.CLUSTER_ZOOM_LEVELS,
+                            help='Масштаб для пересчёта (по умолчанию все)')
+
+    def handle(self, *args, **options):
+        zooms = options['zoom'] or geo.CLUSTER_ZOOM_LEVELS
+        EventCluster.objects.rebuild(zooms)
+        for zoom in zooms:
+            self.stdout.write(f'Масштаб {zoom}: {EventCluster.objects.filter(zoom=zoom).count()} кластеров')
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+from django.utils import timezone
+
+from main import tiles
+from main.models import Event
+
+
+class Command(BaseCommand):
+    help = 'Сверяет Event.going_count с таблицей реакций и исправляет расхождения'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Мероприятий за один проход')
+        parser.add_argument('--dry-run', action='store_true', help='Только показать расхождения')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        checked = drifted = 0
+        last_id = 0
+
+        while True:
+            ids = list(
+                Event.objects.filter(event_id__gt=last_id)
+                .order_by('event_id')
+                .values_list('event_id', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            last_id = ids[-1]
+            checked += len(ids)
+
+            stale = list(Event.objects.filter(event_id__in=ids).going_count_drift().only('event_id', 'going_count', 'latitude', 'longitude'))
+            for event in stale:
+                self.stdout.write(f'Мероприятие {event.event_id}: {event.going_count} -> {event.actual_going_count}')
+            drifted += len(stale)
+
+            if stale and not options['dry_run']:
+                # Счётчик пересчитывается в самом UPDATE под блокировкой строк, а не
+                # записывается прочитанным выше: иначе F-инкременты реакций, пришедших
+                # между чтением и записью, потерялись бы. version и updated_at меняются
+                # там же, чтобы ETag и /changes/ отдали исправленное значение
+                Event.objects.filter(event_id__in=[event.event_id for event in stale]).recount_going(
+                    version=F('version') + 1, updated_at=timezone.now(),
+                )
+                tiles.invalidate_points((event.latitude, event.longitude) for event in stale)
+
+        action = 'найдено' if options['dry_run'] else 'исправлено'
+        self.stdout.write(self.style.SUCCESS(f'Проверено мероприятий: {checked}, {action} расхождений: {drifted}'))
@@ -0,0 +1,132 @@
+import bisect
+import random
+import secrets
+from datetime import timedelta
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from main.models import Category, Event, EventCluster, Reaction, User
+
+CATEGORY_NAMES = ['Концерты', 'Выставки', 'Спорт', 'Образование', 'Фестивали']
+# Область, в которой выбираются центры скоплений мероприятий (европейская часть России)
+HOTSPOT_AREA = ((43.0, 30.0), (60.0, 60.0))
+HOTSPOT_RADIUS = 0.05  # стандартное отклонение координат вокруг центра, градусы
+
+
+def zipf_weights(count, exponent):
+    return [1 / rank ** exponent for rank in range(1, count + 1)]
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class Command(BaseCommand):
+    help = 'Создаёт синтетические данные: пользователей, мероприятия в скоплениях и реакции с популярностью по Ципфу'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--events', type=int, default=10000)
+        parser.add_argument('--reactions-per-user', type=int, default=20)
+        parser.add_argument('--hotspots', type=int, default=20, help='Число городов-скоплений мероприятий')
+        parser.add_argument('--zipf', type=float, default=1.1, help='Показатель распределения популярности')
+        parser.add_argument('--going-share', type=float, default=0.7, help="Доля реакций 'going'")
+        parser.add_argument('--password', default='password123', help='Пароль всех созданных пользователей')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--random-seed', type=int, help='Для воспроизводимых данных')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['random_seed'])
+        self.batch_size = options['batch_size']
+        # Префикс не даёт повторному запуску столкнуться с уникальными именами
+        prefix = f'seed_{secrets.token_hex(3)}'
+
+        categories = [Category.objects.get_or_create(name=name)[0].category_id for name in CATEGORY_NAMES]
+        user_ids = self.create_users(prefix, options['users'], options['password'])
+        event_ids = self.create_events(rng, prefix, options['events'], options['hotspots'], user_ids, categories)
+        reactions = self.create_reactions(
+            rng, user_ids, event_ids,
+            options['reactions_per_user'], options['zipf'], options['going_share'],
+        )
+
+        if event_ids:
+            # Диапазон, а не список id: у SQLite ограничено число параметров запроса
+            Event.objects.filter(event_id__range=(min(event_ids), max(event_ids))).recount_going()
+        EventCluster.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано пользователей: {len(user_ids)}, мероприятий: {len(event_ids)}, реакций: {reactions}'
+        ))
+
+    def create_users(self, prefix, count, password):
+        # Хеширование пароля дорогое, поэтому хеш один на всех
+        password = make_password(password)
+        users = (
+            User(username=f'{prefix}_{i}', email=f'{prefix}_{i}@example.com', password=password)
+            for i in range(count)
+        )
+        ids = []
+        for batch in batched(users, self.batch_size):
+            ids.extend(user.pk for user in User.objects.bulk_create(batch))
+        return ids
+
+    def create_events(self, rng, prefix, count, hotspot_count, user_ids, categories):
+        (min_lat, min_lon), (max_lat, max_lon) = HOTSPOT_AREA
+        hotspots = [(rng.uniform(min_lat, max_lat), rng.uniform(min_lon, max_lon)) for _ in range(hotspot_count)]
+        # Крупные города собирают больше мероприятий
+        hotspot_weights = list(accumulate(zipf_weights(hotspot_count, 1.0)))
+        now = timezone.now()
+
+        def events():
+            for i in range(count):
+                lat, lon = rng.choices(hotspots, cum_weights=hotspot_weights)[0]
+                yield Event(
+                    title=f'Мероприятие {prefix} {i}',
+                    description=f'Описание мероприятия {i}',
+                    latitude=round(rng.gauss(lat, HOTSPOT_RADIUS), 8),
+                    longitude=round(rng.gauss(lon, HOTSPOT_RADIUS), 8),
+                    datetime=now + timedelta(minutes=rng.randint(-30 * 24 * 60, 90 * 24 * 60)),
+                    category_id=rng.choice(categories),
+                    creator_id=rng.choice(user_ids),
+                )
+
+        ids = []
+        for batch in batched(events(), self.batch_size):
+            ids.extend(event.pk for event in Event.objects.bulk_create(batch))
+        return ids
+
+    def create_reactions(self, rng, user_ids, event_ids, per_user, exponent, going_share):
+        if not event_ids:
+            return 0
+        per_user = min(per_user, len(event_ids))
+        # Популярность мероприятия не связана с порядком создания
+        ranked = event_ids[:]
+        rng.shuffle(ranked)
+        cum_weights = list(accumulate(zipf_weights(len(ranked), exponent)))
+        total = cum_weights[-1]
+
+        def reactions():
+            for user_id in user_ids:
+                chosen = set()
+                # Ограничиваем число попыток: редкие мероприятия из хвоста
+                # распределения могут долго не выпадать
+                for _ in range(per_user * 20):
+                    if len(chosen) == per_user:
+                        break
+                    index = bisect.bisect(cum_weights, rng.random() * total)
+                    chosen.add(ranked[min(index, len(ranked) - 1)])
+                for event_id in chosen:
+                    reaction_type = 'going' if rng.random() < going_share else 'not_going'
+                    yield Reaction(user_id=user_id, event_id=event_id, type=reaction_type)
+
+        created = 0
+        with transaction.atomic():
+            for batch in batched(reactions(), self.batch_size):
+                Reaction.objects.bulk_create(batch, ignore_conflicts=True)
+                created += len(batch)
+        return created
@@ -0,0 +1,220 @@
+import contextvars
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+from django.urls import Resolver404, resolve
+
+# Метрики текущего запроса (None, если запрос не попал в выборку)
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# Имя метрики -> (описание, границы корзин)
+HISTOGRAMS = {
+    'tsp_request_duration_seconds': ('Время обработки запроса', DURATION_BUCKETS),
+    'tsp_auth_duration_seconds': ('Время аутентификации', DURATION_BUCKETS),
+    'tsp_db_duration_seconds': ('Время SQL-запросов', DURATION_BUCKETS),
+    'tsp_db_queries': ('Число SQL-запросов', QUERY_BUCKETS),
+    'tsp_serializer_duration_seconds': ('Время сериализации', DURATION_BUCKETS),
+    'tsp_response_size_bytes': ('Размер ответа', SIZE_BUCKETS),
+}
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Гистограммы по маршрутам в памяти процесса.
+
+    При нескольких рабочих процессах у каждого своя копия, Prometheus
+    опрашивает их по отдельности.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = defaultdict(dict)
+
+    def observe(self, route, values):
+        with self._lock:
+            for name, value in values.items():
+                histograms = self._histograms[name]
+                if route not in histograms:
+                    histograms[route] = Histogram(HISTOGRAMS[name][1])
+                histograms[route].observe(value)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, (description, buckets) in HISTOGRAMS.items():
+                lines.append(f'# HELP {name} {description}')
+                lines.append(f'# TYPE {name} histogram')
+                for route, histogram in sorted(self._histograms.get(name, {}).items()):
+                    cumulative = 0
+                    for bound, count in zip(buckets + ('+Inf',), histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{route="{route}",le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_sum{{route="{route}"}} {histogram.sum}')
+                    lines.append(f'{name}_count{{route="{route}"}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.durations = defaultdict(float)
+        self.queries = 0
+        self.active = set()
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.durations['db'] += time.perf_counter() - start
+            self.queries += 1
+
+
+def record_query(execute, sql, params, many, context):
+    # Контекстные переменные копируются в потоки sync_to_async, поэтому
+    # запросы async-представлений тоже попадают в метрики своего запроса
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics.record_query(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    # Обёртки хранятся в DatabaseWrapper и переживают переподключение
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def timer(name):
+    """Добавляет время блока к метрике name текущего запроса; вложенные блоки не суммируются."""
+    metrics = _current.get()
+    if metrics is None or name in metrics.active:
+        yield
+        return
+    metrics.active.add(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.durations[name] += time.perf_counter() - start
+        metrics.active.discard(name)
+
+
+class TimedSerializerMixin:
+    """Учитывает время to_representation в метрике serialize."""
+
+    def to_representation(self, instance):
+        with timer('serialize'):
+            return super().to_representation(instance)
+
+
+class PerformanceMiddleware:
+    """Замеряет запросы и отдаёт результат в Server-Timing и /metrics.
+
+    В выборку попадает доля METRICS_SAMPLE_RATE запросов, остальные
+    проходят без замеров.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if random.random() >= settings.METRICS_SAMPLE_RATE:
+            return self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        if random.random() >= settings.METRICS_SAMPLE_RATE:
+            return await self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, time.perf_counter() - start)
+
+    def finish(self, request, response, metrics, total):
+        durations = metrics.durations
+        values = {
+            'tsp_request_duration_seconds': total,
+            'tsp_auth_duration_seconds': durations['auth'],
+            'tsp_db_duration_seconds': durations['db'],
+            'tsp_db_queries': metrics.queries,
+            'tsp_serializer_duration_seconds': durations['serialize'],
+        }
+        if not response.streaming:
+            values['tsp_response_size_bytes'] = len(response.content)
+        registry.observe(self.route(request), values)
+
+        response['Server-Timing'] = ', '.join([
+            f'total;dur={total * 1000:.1f}',
+            f"auth;dur={durations['auth'] * 1000:.1f}",
+            f"db;dur={durations['db'] * 1000:.1f};desc=\"{metrics.queries} queries\"",
+            f"serialize;dur={durations['serialize'] * 1000:.1f}",
+        ])
+        return response
+
+    @staticmethod
+    def route(request):
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            # Ответ отдан до разрешения URL (например, 401 из JWTAuthMiddleware)
+            try:
+                match = resolve(request.path_info)
+            except Resolver404:
+                return 'unresolved'
+        return match.view_name or 'unresolved'
+
+
+def metrics_view(request):
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,17 +1,26 @@
 import re
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
 from django.http import JsonResponse, HttpResponseRedirect
+from whitenoise.middleware import WhiteNoiseMiddleware
 from django.shortcuts import redirect
-from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.exceptions import InvalidToken, AuthenticationFailed
 
+from .authentication import CachedJWTAuthentication
+
 from django.shortcuts import redirect
 from rest_framework_simplejwt.exceptions import InvalidToken
 
 
 # middleware.py
 class JWTAuthMiddleware:
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
         self.exempt_paths = [
             '/login/',
             '/register/',
@@ -21,29 +30,76 @@ class JWTAuthMiddleware:
             '/api/login/',
         ]
 
-    def __call__(self, request):
-        path = request.path
-
+    def requires_token(self, path):
         if any(path.startswith(exempt) for exempt in self.exempt_paths):
-            return self.get_response(request)
+            return False
 
         # Для /api/map/ используем сессионную аутентификацию
         if path == '/api/map/':
-            return self.get_response(request)
+            return False
 
         # Для API-эндпоинтов проверяем JWT
-        if path.startswith('/api/'):
+        return path.startswith('/api/')
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        if self.requires_token(request.path):
             auth_header = request.headers.get('Authorization', '')
             if not auth_header.startswith('Bearer '):
                 return JsonResponse({'error': 'Token required'}, status=401)
             try:
-                token = auth_header.split(' ')[1]
-                JWTAuthentication().get_validated_token(token)
+                # Результат используется CachedJWTAuthentication в DRF
+                request.jwt_auth = CachedJWTAuthentication().authenticate(request)
             except Exception:
                 return JsonResponse({'error': 'Invalid token'}, status=401)
+            if request.jwt_auth is None:
+                return JsonResponse({'error': 'Invalid token'}, status=401)
 
         return self.get_response(request)
 
+    async def __acall__(self, request):
+        if self.requires_token(request.path):
+            auth_header = request.headers.get('Authorization', '')
+            if not auth_header.startswith('Bearer '):
+                return JsonResponse({'error': 'Token required'}, status=401)
+            try:
+                request.jwt_auth = await CachedJWTAuthentication().aauthenticate(request)
+            except Exception:
+                return JsonResponse({'error': 'Invalid token'}, status=401)
+            if request.jwt_auth is None:
+                return JsonResponse({'error': 'Invalid token'}, status=401)
+
+        return await self.get_response(request)
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """WhiteNoise, который под ASGI не переводит остальную цепочку в синхронный режим."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
+
 
 class PasswordChangeMiddleware:
     def __init__(self, get_response):
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:20
+
+import main.models
+from django.db import migrations, models
+
+from main import geo
+
+
+def fill_grid_cells(apps, schema_editor):
+    Event = apps.get_model('main', 'Event')
+    events = list(Event.objects.using(schema_editor.connection.alias).only('latitude', 'longitude'))
+    for event in events:
+        event.grid_cell = geo.grid_cell(event.latitude, event.longitude)
+    Event.objects.using(schema_editor.connection.alias).bulk_update(events, ['grid_cell'], batch_size=1000)
+
+
+def create_gist_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS main_event_location_gist ON main_event '
+        'USING gist (point(longitude::float8, latitude::float8))'
+    )
+
+
+def drop_gist_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS main_event_location_gist')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0011_alter_event_creator'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='grid_cell',
+            field=main.models.GridCellField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['latitude', 'longitude'], name='main_event_lat_lon_idx'),
+        ),
+        migrations.RunPython(fill_grid_cells, migrations.RunPython.noop),
+        migrations.RunPython(create_gist_index, drop_gist_index),
+    ]
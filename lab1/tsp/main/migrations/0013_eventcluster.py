@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:21
+
+from django.db import migrations, models
+
+from main import geo
+
+
+def fill_clusters(apps, schema_editor):
+    Event = apps.get_model('main', 'Event')
+    EventCluster = apps.get_model('main', 'EventCluster')
+    db = schema_editor.connection.alias
+
+    clusters = {}
+    for event_id, latitude, longitude in Event.objects.using(db).values_list('event_id', 'latitude', 'longitude').iterator():
+        for zoom in geo.CLUSTER_ZOOM_LEVELS:
+            cell_x, cell_y = geo.cluster_cell(latitude, longitude, zoom)
+            cluster = clusters.setdefault(
+                (zoom, cell_x, cell_y),
+                EventCluster(zoom=zoom, cell_x=cell_x, cell_y=cell_y, sample_ids=[]),
+            )
+            cluster.count += 1
+            cluster.latitude_sum += float(latitude)
+            cluster.longitude_sum += float(longitude)
+            if len(cluster.sample_ids) < geo.CLUSTER_SAMPLE_SIZE:
+                cluster.sample_ids.append(event_id)
+    EventCluster.objects.using(db).bulk_create(clusters.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0012_event_grid_cell'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventCluster',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('zoom', models.PositiveSmallIntegerField()),
+                ('cell_x', models.IntegerField()),
+                ('cell_y', models.IntegerField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('latitude_sum', models.FloatField(default=0)),
+                ('longitude_sum', models.FloatField(default=0)),
+                ('sample_ids', models.JSONField(default=list)),
+            ],
+            options={
+                'unique_together': {('zoom', 'cell_y', 'cell_x')},
+            },
+        ),
+        migrations.RunPython(fill_clusters, migrations.RunPython.noop),
+    ]
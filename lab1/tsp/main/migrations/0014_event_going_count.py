@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:23
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_going_counts(apps, schema_editor):
+    Event = apps.get_model('main', 'Event')
+    Reaction = apps.get_model('main', 'Reaction')
+    going = (
+        Reaction.objects.filter(event=OuterRef('pk'), type='going')
+        .order_by().values('event').annotate(total=Count('pk')).values('total')
+    )
+    Event.objects.using(schema_editor.connection.alias).update(
+        going_count=Coalesce(Subquery(going), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0013_eventcluster'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='going_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_going_counts, migrations.RunPython.noop),
+    ]
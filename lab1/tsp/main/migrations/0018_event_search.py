@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:31
+
+from django.db import migrations
+
+from main import search
+
+
+def create_search_index(apps, schema_editor):
+    search.create_search_index(schema_editor.connection)
+
+
+def drop_search_index(apps, schema_editor):
+    search.drop_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0017_event_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0018_event_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventArchive',
+            fields=[
+                ('event_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=255)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('latitude', models.DecimalField(decimal_places=8, max_digits=10)),
+                ('longitude', models.DecimalField(decimal_places=8, max_digits=11)),
+                ('datetime', models.DateTimeField(db_index=True)),
+                ('category_id', models.IntegerField(null=True)),
+                ('creator_id', models.IntegerField(db_index=True)),
+                ('going_count', models.PositiveIntegerField(default=0)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ReactionArchive',
+            fields=[
+                ('reaction_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('user_id', models.IntegerField(db_index=True)),
+                ('event_id', models.IntegerField(db_index=True)),
+                ('type', models.CharField(choices=[('going', 'Going'), ('not_going', 'Not Going')], max_length=10)),
+            ],
+        ),
+    ]
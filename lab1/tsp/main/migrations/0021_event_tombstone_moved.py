@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0020_reaction_event_type_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eventtombstone',
+            name='moved',
+            field=models.BooleanField(default=False),
+        ),
+    ]
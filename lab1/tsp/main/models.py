@@ -1,8 +1,17 @@
+import math
+
+from django.conf import settings
 from django.contrib.auth.base_user import AbstractBaseUser, BaseUserManager
-from django.contrib.auth.hashers import make_password, check_password
 from django.contrib.auth.models import PermissionsMixin
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models
+from django.db import IntegrityError, connections, models, router, transaction
+from django.db.models import (
+    Avg, Case, Count, F, FloatField, OuterRef, Prefetch, Q, Subquery, Value, When, Window,
+)
+from django.db.models.functions import ASin, Cast, Coalesce, Cos, Floor, Power, Radians, RowNumber, Sin, Sqrt
+from django.utils import timezone
+
+from . import geo, hashing, search, tiles
 
 
 class Category(models.Model):
@@ -15,12 +24,16 @@ class Category(models.Model):
 
 
 class UserManager(BaseUserManager):
-    def create_user(self, username, email, password=None, **extra_fields):
+    def create_user(self, username, email, password=None, encoded_password=None, **extra_fields):
         if not email:
             raise ValueError('The Email field must be set')
         email = self.normalize_email(email)
         user = self.model(username=username, email=email, **extra_fields)
-        user.set_password(password)
+        if encoded_password is None:
+            user.set_password(password)
+        else:
+            # Хеш уже посчитан в пуле main.hashing (async-регистрация)
+            user.password = encoded_password
         user.save(using=self._db)
         return user
 
@@ -55,6 +68,187 @@ class User(AbstractBaseUser, PermissionsMixin):
     def __str__(self):
         return self.username
 
+    # Хеширование вынесено в пул процессов main.hashing
+
+    def set_password(self, raw_password):
+        self.password = hashing.make_password(raw_password)
+        self._password = raw_password
+
+    def check_password(self, raw_password):
+        valid, must_update = hashing.check_password(raw_password, self.password)
+        if must_update:
+            self.set_password(raw_password)
+            self._password = None
+            self.save(update_fields=['password'])
+        return valid
+
+class GridCellField(models.IntegerField):
+    """Номер ячейки сетки geo.grid_cell, вычисляется из координат при сохранении."""
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('editable', False)
+        kwargs.setdefault('default', 0)
+        super().__init__(*args, **kwargs)
+
+    def pre_save(self, model_instance, add):
+        value = geo.grid_cell(model_instance.latitude, model_instance.longitude)
+        setattr(model_instance, self.attname, value)
+        return value
+
+
+class EventQuerySet(models.QuerySet):
+    def in_bbox(self, bbox):
+        if connections[self.db].vendor == 'postgresql':
+            # GiST-индекс main_event_location_gist (см. миграцию 0012)
+            return self.extra(
+                where=['point("main_event"."longitude"::float8, "main_event"."latitude"::float8) '
+                       '<@ box(point(%s, %s), point(%s, %s))'],
+                params=[bbox.min_lon, bbox.min_lat, bbox.max_lon, bbox.max_lat],
+            )
+
+        queryset = self
+        ranges = geo.grid_cell_ranges(bbox)
+        if len(ranges) <= geo.MAX_BBOX_GRID_ROWS:
+            cells = Q()
+            for first, last in ranges:
+                cells |= Q(grid_cell__range=(first, last))
+            queryset = queryset.filter(cells)
+
+        return queryset.filter(
+            latitude__range=(bbox.min_lat, bbox.max_lat),
+            longitude__range=(bbox.min_lon, bbox.max_lon),
+        )
+
+    def nearby(self, lat, lon, radius_km):
+        """Мероприятия в радиусе radius_km от точки, с расстоянием distance (км), ближние первыми.
+
+        Кандидаты отбираются по bbox круга (индекс), точное расстояние по
+        формуле гаверсинусов считается в базе только для них.
+        """
+        latitude = Radians(Cast('latitude', FloatField()))
+        longitude = Radians(Cast('longitude', FloatField()))
+        lat0, lon0 = math.radians(lat), math.radians(lon)
+        a = (
+            Power(Sin((latitude - lat0) / 2), 2)
+            + math.cos(lat0) * Cos(latitude) * Power(Sin((longitude - lon0) / 2), 2)
+        )
+        return (
+            self.in_bbox(geo.radius_bbox(lat, lon, radius_km))
+            .annotate(distance=2 * geo.EARTH_RADIUS_KM * ASin(Sqrt(a)))
+            .filter(distance__lte=radius_km)
+            .order_by('distance', 'event_id')
+        )
+
+    def search(self, query):
+        """Мероприятия, в названии или описании которых есть все слова запроса.
+
+        Каждое слово ищется по префиксу - для подсказок при наборе.
+        Результат отсортирован по релевантности (поле rank, по убыванию).
+        """
+        terms = search.search_terms(query)
+        if not terms:
+            return self.none()
+
+        vendor = connections[self.db].vendor
+        if vendor == 'postgresql':
+            tsquery = ' & '.join(f'{term}:*' for term in terms)
+            queryset = self.extra(
+                select={'rank': 'ts_rank("main_event"."search_vector", to_tsquery(%s::regconfig, %s))'},
+                select_params=[search.SEARCH_CONFIG, tsquery],
+                where=['"main_event"."search_vector" @@ to_tsquery(%s::regconfig, %s)'],
+                params=[search.SEARCH_CONFIG, tsquery],
+            )
+        elif vendor == 'sqlite':
+            match = ' '.join(f'"{term}"*' for term in terms)
+            queryset = self.extra(
+                # bm25 тем меньше, чем лучше совпадение; название весомее описания
+                select={'rank': '-bm25("main_event_fts", 10.0, 1.0)'},
+                tables=['main_event_fts'],
+                where=['"main_event_fts"."rowid" = "main_event"."event_id"', '"main_event_fts" MATCH %s'],
+                params=[match],
+            )
+        else:
+            queryset = self.extra(select={'rank': '0'})
+            for term in terms:
+                queryset = queryset.filter(Q(title__icontains=term) | Q(description__icontains=term))
+        return queryset.order_by('-rank', 'event_id')
+
+    def with_going_users(self):
+        """Первые EVENT_GOING_USERS_PREVIEW реакций 'going' с пользователями в going_reactions.
+
+        Срез в Prefetch выполняется оконной функцией, поэтому популярное
+        мероприятие не тянет в список всех своих участников.
+        """
+        # Реакции читаются из той же базы, что и мероприятия: иначе внутри
+        # replica_reads() using('default') не распространился бы на Prefetch
+        going = Reaction.objects.using(self._db).filter(type='going').select_related('user').order_by('user_id')
+        return self.prefetch_related(
+            Prefetch('reactions', queryset=going[:settings.EVENT_GOING_USERS_PREVIEW], to_attr='going_reactions')
+        )
+
+    def going_count_drift(self):
+        """Мероприятия, у которых going_count расходится с числом реакций."""
+        return (
+            self.annotate(actual_going_count=Count('reactions', filter=Q(reactions__type='going')))
+            .exclude(going_count=F('actual_going_count'))
+        )
+
+    def recount_going(self, **fields):
+        """Пересчитывает going_count одним UPDATE (после массовой вставки реакций).
+
+        fields дописываются в тот же UPDATE, например version и updated_at.
+        """
+        going = (
+            Reaction.objects.filter(event=OuterRef('pk'), type='going')
+            .order_by().values('event').annotate(total=Count('pk')).values('total')
+        )
+        return self.update(going_count=Coalesce(Subquery(going), 0), **fields)
+
+    def with_cells(self, zoom):
+        """Номер ячейки кластера (cell_x, cell_y) каждого мероприятия на масштабе zoom."""
+        size = geo.cluster_cell_degrees(zoom)
+        return self.order_by().annotate(
+            cell_x=Floor((Cast('longitude', FloatField()) + 180.0) / size),
+            cell_y=Floor((Cast('latitude', FloatField()) + 90.0) / size),
+        )
+
+    def cell_samples(self, zoom, size=geo.CLUSTER_SAMPLE_SIZE):
+        """{(cell_x, cell_y): [event_id, ...]} - не больше size мероприятий каждой ячейки.
+
+        Образец отбирается в базе оконной функцией: список всех id ячейки
+        на мелком масштабе растёт вместе с таблицей.
+        """
+        rows = (
+            self.with_cells(zoom)
+            .annotate(position=Window(RowNumber(), partition_by=[F('cell_x'), F('cell_y')], order_by=F('event_id').asc()))
+            .filter(position__lte=size)
+            .values_list('cell_x', 'cell_y', 'event_id')
+        )
+        samples = {}
+        for cell_x, cell_y, event_id in rows:
+            samples.setdefault((int(cell_x), int(cell_y)), []).append(event_id)
+        return samples
+
+    def clusters(self, zoom):
+        latitude = Cast('latitude', FloatField())
+        longitude = Cast('longitude', FloatField())
+        rows = (
+            self.with_cells(zoom)
+            .values('cell_x', 'cell_y')
+            .annotate(count=Count('event_id'), lat=Avg(latitude), lon=Avg(longitude))
+        )
+        samples = self.cell_samples(zoom)
+        return [
+            {
+                'count': row['count'],
+                'latitude': row['lat'],
+                'longitude': row['lon'],
+                'event_ids': samples.get((int(row['cell_x']), int(row['cell_y'])), []),
+            }
+            for row in rows
+        ]
+
+
 class Event(models.Model):
     event_id = models.AutoField(primary_key=True)
     title = models.CharField(max_length=255)
@@ -68,10 +262,222 @@ class Event(models.Model):
     datetime = models.DateTimeField()
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, related_name='auth')
     creator = models.ForeignKey(User, on_delete=models.CASCADE, related_name='created_events', verbose_name='Создатель')
+    grid_cell = GridCellField(db_index=True)
+    # Число реакций 'going'; поддерживается Reaction.apply_change
+    going_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # Растёт при каждом изменении мероприятия или реакций на него (для ETag)
+    version = models.PositiveIntegerField(default=1)
+
+    objects = EventQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['latitude', 'longitude'], name='main_event_lat_lon_idx'),
+            models.Index(fields=['datetime', 'event_id'], name='main_event_datetime_id_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем исходные координаты, чтобы при переносе события
+        # обновить кластеры без дополнительного запроса
+        instance._loaded_coords = (instance.__dict__.get('latitude'), instance.__dict__.get('longitude'))
+        return instance
+
+
+class EventTombstone(models.Model):
+    """Запись об удалённом мероприятии для /api/events/changes/.
+
+    moved=True - мероприятие не удалено, а перенесено с координат
+    latitude, longitude: клиент, смотревший на старое место, убирает метку.
+    """
+    event_id = models.IntegerField()
+    latitude = models.DecimalField(max_digits=10, decimal_places=8)
+    longitude = models.DecimalField(max_digits=11, decimal_places=8)
+    deleted_at = models.DateTimeField(default=timezone.now, db_index=True)
+    moved = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f"{self.event_id} ({self.deleted_at})"
+
+
+class EventClusterQuerySet(models.QuerySet):
+    @property
+    def write_db(self):
+        # База для изменения кластеров: self.db внутри replica_reads() указал бы на реплику
+        return self._db or router.db_for_write(self.model, **self._hints)
+
+    def in_bbox(self, zoom, bbox):
+        min_x, min_y = geo.cluster_cell(bbox.min_lat, bbox.min_lon, zoom)
+        max_x, max_y = geo.cluster_cell(bbox.max_lat, bbox.max_lon, zoom)
+        return self.filter(zoom=zoom, cell_y__range=(min_y, max_y), cell_x__range=(min_x, max_x))
+
+    def add_event(self, event_id, latitude, longitude):
+        with transaction.atomic(using=self.write_db):
+            for zoom in geo.CLUSTER_ZOOM_LEVELS:
+                cell_x, cell_y = geo.cluster_cell(latitude, longitude, zoom)
+                cluster = self._locked_cluster(zoom, cell_x, cell_y)
+                cluster.count += 1
+                cluster.latitude_sum += float(latitude)
+                cluster.longitude_sum += float(longitude)
+                if len(cluster.sample_ids) < geo.CLUSTER_SAMPLE_SIZE:
+                    cluster.sample_ids.append(event_id)
+                cluster.save()
+
+    def add_events(self, events):
+        """Добавляет пачку мероприятий (bulk_create и COPY не вызывают сигналы).
+
+        Мероприятия группируются по ячейкам, и каждая затронутая ячейка
+        блокируется и пишется один раз. Без event_id (после COPY) образец
+        дополняется из базы.
+        """
+        with transaction.atomic(using=self.write_db):
+            for zoom in geo.CLUSTER_ZOOM_LEVELS:
+                cells = {}
+                for event in events:
+                    cells.setdefault(geo.cluster_cell(event.latitude, event.longitude, zoom), []).append(event)
+                # Ячейки блокируются в одном порядке, чтобы параллельные загрузки не взаимоблокировались
+                for (cell_x, cell_y), members in sorted(cells.items(), key=lambda item: item[0][::-1]):
+                    cluster = self._locked_cluster(zoom, cell_x, cell_y)
+                    cluster.count += len(members)
+                    cluster.latitude_sum += sum(float(event.latitude) for event in members)
+                    cluster.longitude_sum += sum(float(event.longitude) for event in members)
+                    free = max(0, geo.CLUSTER_SAMPLE_SIZE - len(cluster.sample_ids))
+                    cluster.sample_ids.extend([event.pk for event in members if event.pk is not None][:free])
+                    cluster.refill_sample()
+                    cluster.save()
+
+    def remove_event(self, event_id, latitude, longitude):
+        with transaction.atomic(using=self.write_db):
+            for zoom in geo.CLUSTER_ZOOM_LEVELS:
+                cell_x, cell_y = geo.cluster_cell(latitude, longitude, zoom)
+                cluster = self.select_for_update().filter(zoom=zoom, cell_x=cell_x, cell_y=cell_y).first()
+                if cluster is None:
+                    continue
+                cluster.count -= 1
+                if cluster.count <= 0:
+                    cluster.delete()
+                    continue
+                cluster.latitude_sum -= float(latitude)
+                cluster.longitude_sum -= float(longitude)
+                if event_id in cluster.sample_ids:
+                    cluster.sample_ids.remove(event_id)
+                    cluster.refill_sample(exclude=event_id)
+                cluster.save()
+
+    def remove_events(self, points):
+        """Убирает пачку мероприятий [(event_id, latitude, longitude)] - пара к add_events.
+
+        Вызывается после удаления строк мероприятий, чтобы образец
+        дополнялся только оставшимися.
+        """
+        points = list(points)
+        with transaction.atomic(using=self.write_db):
+            for zoom in geo.CLUSTER_ZOOM_LEVELS:
+                cells = {}
+                for event_id, latitude, longitude in points:
+                    cells.setdefault(geo.cluster_cell(latitude, longitude, zoom), []).append(
+                        (event_id, latitude, longitude)
+                    )
+                for (cell_x, cell_y), members in sorted(cells.items(), key=lambda item: item[0][::-1]):
+                    cluster = self.select_for_update().filter(zoom=zoom, cell_x=cell_x, cell_y=cell_y).first()
+                    if cluster is None:
+                        continue
+                    cluster.count -= len(members)
+                    if cluster.count <= 0:
+                        cluster.delete()
+                        continue
+                    cluster.latitude_sum -= sum(float(latitude) for _, latitude, _ in members)
+                    cluster.longitude_sum -= sum(float(longitude) for _, _, longitude in members)
+                    removed = {event_id for event_id, _, _ in members}
+                    cluster.sample_ids = [event_id for event_id in cluster.sample_ids if event_id not in removed]
+                    cluster.refill_sample()
+                    cluster.save()
+
+    def rebuild(self, zooms=geo.CLUSTER_ZOOM_LEVELS):
+        with transaction.atomic(using=self.write_db):
+            for zoom in zooms:
+                self.filter(zoom=zoom).delete()
+                events = Event.objects.using(self.write_db)
+                rows = (
+                    events.with_cells(zoom)
+                    .values('cell_x', 'cell_y')
+                    .annotate(
+                        count=Count('event_id'),
+                        latitude_sum=models.Sum(Cast('latitude', FloatField())),
+                        longitude_sum=models.Sum(Cast('longitude', FloatField())),
+                    )
+                )
+                samples = events.cell_samples(zoom)
+                self.bulk_create(
+                    (
+                        EventCluster(
+                            zoom=zoom,
+                            cell_x=int(row['cell_x']),
+                            cell_y=int(row['cell_y']),
+                            count=row['count'],
+                            latitude_sum=row['latitude_sum'],
+                            longitude_sum=row['longitude_sum'],
+                            sample_ids=samples.get((int(row['cell_x']), int(row['cell_y'])), []),
+                        )
+                        for row in rows.iterator()
+                    ),
+                    batch_size=1000,
+                )
+
+    def _locked_cluster(self, zoom, cell_x, cell_y):
+        cluster = self.select_for_update().filter(zoom=zoom, cell_x=cell_x, cell_y=cell_y).first()
+        if cluster is not None:
+            return cluster
+        try:
+            with transaction.atomic(using=self.write_db):
+                return self.create(zoom=zoom, cell_x=cell_x, cell_y=cell_y)
+        except IntegrityError:
+            # Ячейку параллельно создал другой запрос
+            return self.select_for_update().get(zoom=zoom, cell_x=cell_x, cell_y=cell_y)
+
+
+class EventCluster(models.Model):
+    zoom = models.PositiveSmallIntegerField()
+    cell_x = models.IntegerField()
+    cell_y = models.IntegerField()
+    count = models.PositiveIntegerField(default=0)
+    latitude_sum = models.FloatField(default=0)
+    longitude_sum = models.FloatField(default=0)
+    sample_ids = models.JSONField(default=list)
+
+    objects = EventClusterQuerySet.as_manager()
+
+    class Meta:
+        unique_together = ('zoom', 'cell_y', 'cell_x')
+
+    def __str__(self):
+        return f"z{self.zoom} ({self.cell_x}, {self.cell_y}): {self.count}"
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'latitude': self.latitude_sum / self.count,
+            'longitude': self.longitude_sum / self.count,
+            'event_ids': self.sample_ids,
+        }
+
+    def refill_sample(self, exclude=None):
+        missing = min(self.count, geo.CLUSTER_SAMPLE_SIZE) - len(self.sample_ids)
+        if missing <= 0:
+            return
+        # Из той же базы, что и кластер: вне её транзакции новых мероприятий не видно
+        candidates = (
+            Event.objects.using(self._state.db).in_bbox(geo.cluster_cell_bbox(self.cell_x, self.cell_y, self.zoom))
+            .exclude(event_id__in=self.sample_ids + [exclude])
+            .values_list('event_id', flat=True)[:missing]
+        )
+        self.sample_ids.extend(candidates)
+
 
 class EventToCategory(models.Model):
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='event_categories')
@@ -84,6 +490,57 @@ class EventToCategory(models.Model):
         return f"{self.event.title} -> {self.category.name}"
 
 
+class ReactionQuerySet(models.QuerySet):
+    def upsert(self, user_id, reactions):
+        """Записывает реакции пользователя {event_id: type} одним запросом.
+
+        Возвращает {event_id: (reaction_id, previous_type)}; previous_type
+        равен None для новой реакции и новому типу, если реакция не изменилась.
+        """
+        if connections[self.db].vendor == 'postgresql':
+            return self._upsert_postgresql(user_id, reactions)
+
+        # SQLite пишет транзакции последовательно, поэтому чтение старых
+        # типов и вставка с ON CONFLICT в одной транзакции не гоняются
+        with transaction.atomic(using=self.db):
+            previous = dict(self.filter(user_id=user_id, event_id__in=reactions).values_list('event_id', 'type'))
+            written = self.bulk_create(
+                [Reaction(user_id=user_id, event_id=event_id, type=reaction_type)
+                 for event_id, reaction_type in reactions.items()],
+                update_conflicts=True,
+                unique_fields=['user', 'event'],
+                update_fields=['type'],
+            )
+        return {reaction.event_id: (reaction.reaction_id, previous.get(reaction.event_id)) for reaction in written}
+
+    def _upsert_postgresql(self, user_id, reactions):
+        table = self.model._meta.db_table
+        values = ', '.join(['(%s, %s, %s)'] * len(reactions))
+        params = [value for event_id, reaction_type in reactions.items() for value in (user_id, event_id, reaction_type)]
+        # Неизменённые строки не переписываются (WHERE), xmax = 0 отличает
+        # вставку от обновления. Обновлённая строка сменила тип, а типов два,
+        # значит прежний тип - второй из них
+        sql = (
+            f'INSERT INTO "{table}" ("user_id", "event_id", "type") VALUES {values} '
+            f'ON CONFLICT ("user_id", "event_id") DO UPDATE SET "type" = EXCLUDED."type" '
+            f'WHERE "{table}"."type" <> EXCLUDED."type" '
+            f'RETURNING "event_id", "reaction_id", xmax = 0'
+        )
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+
+        result = {}
+        for event_id, reaction_id, inserted in rows:
+            result[event_id] = (reaction_id, None if inserted else Reaction.other_type(reactions[event_id]))
+        unchanged = [event_id for event_id in reactions if event_id not in result]
+        if unchanged:
+            for event_id, reaction_id in self.filter(user_id=user_id, event_id__in=unchanged).values_list(
+                    'event_id', 'reaction_id'):
+                result[event_id] = (reaction_id, reactions[event_id])
+        return result
+
+
 class Reaction(models.Model):
     REACTION_TYPES = [
         ('going', 'Going'),
@@ -95,16 +552,98 @@ class Reaction(models.Model):
     event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='reactions')
     type = models.CharField(max_length=10, choices=REACTION_TYPES)
 
+    objects = ReactionQuerySet.as_manager()
+
     class Meta:
         unique_together = ('user', 'event')
+        indexes = [
+            models.Index(fields=['user', 'reaction_id'], name='main_reaction_user_id_idx'),
+            # Участники мероприятия по порядку user_id (/api/events/<id>/attendees/)
+            # читаются только из индекса
+            models.Index(fields=['event', 'type', 'user'], name='main_reaction_event_type_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} -> {self.event.title} ({self.type})"
 
     @staticmethod
     def get_going_count(event_id):
-        return Reaction.objects.filter(event_id=event_id, type='going').count()
+        return Event.objects.filter(event_id=event_id).values_list('going_count', flat=True).first() or 0
+
+    @staticmethod
+    def other_type(reaction_type):
+        return 'not_going' if reaction_type == 'going' else 'going'
+
+    @staticmethod
+    def apply_change(event_id, old_type, new_type, point=None):
+        """Обновляет счётчики мероприятия после создания, смены или удаления реакции.
+
+        Вызывается в той же транзакции, что и запись самой реакции. point -
+        (latitude, longitude) мероприятия, если оно уже загружено.
+        """
+        Reaction.apply_changes({event_id: (old_type, new_type)}, None if point is None else {event_id: point})
+
+    @staticmethod
+    def apply_changes(changes, points=None):
+        """То же для нескольких мероприятий {event_id: (old_type, new_type)} одним UPDATE.
+
+        points - {event_id: (latitude, longitude)} уже загруженных мероприятий;
+        без них координаты для сброса тайлов читаются отдельным запросом.
+        """
+        if not changes:
+            return
+        deltas = {
+            event_id: (new_type == 'going') - (old_type == 'going')
+            for event_id, (old_type, new_type) in changes.items()
+        }
+        if len(set(deltas.values())) == 1:
+            delta = Value(next(iter(deltas.values())))
+        else:
+            delta = Case(
+                *(When(event_id=event_id, then=Value(value)) for event_id, value in deltas.items()),
+                default=Value(0),
+            )
+        # updated_at меняется и без изменения счётчика: у автора реакции
+        # поменялось поле user_reaction
+        Event.objects.filter(event_id__in=deltas).update(
+            going_count=F('going_count') + delta,
+            version=F('version') + 1,
+            updated_at=timezone.now(),
+        )
+        # В тайлах нет user_reaction, они меняются только вместе с going
+        changed = [event_id for event_id, value in deltas.items() if value]
+        if points is None:
+            tiles.invalidate_events(changed)
+        else:
+            tiles.invalidate_points(points[event_id] for event_id in changed)
 
     @staticmethod
     def get_going_users(event_id):
-        return User.objects.filter(reactions__event_id=event_id, reactions__type='going')
\ No newline at end of file
+        return User.objects.filter(reactions__event_id=event_id, reactions__type='going')
+
+class EventArchive(models.Model):
+    """Прошедшее мероприятие, перенесённое командой archive_events из main_event."""
+    event_id = models.IntegerField(primary_key=True)
+    title = models.CharField(max_length=255)
+    description = models.TextField(blank=True, null=True)
+    latitude = models.DecimalField(max_digits=10, decimal_places=8)
+    longitude = models.DecimalField(max_digits=11, decimal_places=8)
+    datetime = models.DateTimeField(db_index=True)
+    category_id = models.IntegerField(null=True)
+    creator_id = models.IntegerField(db_index=True)
+    going_count = models.PositiveIntegerField(default=0)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return self.title
+
+
+class ReactionArchive(models.Model):
+    """Реакция на архивное мероприятие."""
+    reaction_id = models.IntegerField(primary_key=True)
+    user_id = models.IntegerField(db_index=True)
+    event_id = models.IntegerField(db_index=True)
+    type = models.CharField(max_length=10, choices=Reaction.REACTION_TYPES)
+
+    def __str__(self):
+        return f"{self.user_id} -> {self.event_id} ({self.type})"
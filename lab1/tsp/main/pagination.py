@@ -0,0 +1,136 @@
+import base64
+import json
+from collections import OrderedDict
+from types import SimpleNamespace
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Постраничная выдача по ключу сортировки вместо OFFSET.
+
+    Курсор хранит значения полей ordering последней записи страницы,
+    следующая страница выбирается условием (a, b) > (a0, b0), поэтому
+    стоимость любой страницы одинакова при наличии индекса по ordering.
+    """
+    ordering = ('pk',)
+    page_size = 100
+    max_page_size = 1000
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Некорректный курсор'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.get_page(list(self.page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        return self.get_page([obj async for obj in self.page_queryset(queryset, request)])
+
+    def page_queryset(self, queryset, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.fields = [self.get_field(queryset.model, name) for name in self.ordering]
+
+        queryset = queryset.order_by(*(field.attname for field in self.fields))
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self.after(self.fields, position))
+        return queryset[:self.page_size + 1]
+
+    def get_page(self, results):
+        self.has_next = len(results) > self.page_size
+        page = results[:self.page_size]
+        self.last = page[-1] if page else None
+        return page
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        values = [field.value_to_string(self.last) for field in self.fields]
+        cursor = base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_previous_link(self):
+        return None
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if len(values) != len(self.fields):
+                raise ValueError
+            return [field.to_python(value) for field, value in zip(self.fields, values)]
+        except (TypeError, ValueError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def get_field(model, name):
+        return model._meta.pk if name == 'pk' else model._meta.get_field(name)
+
+    @classmethod
+    def after(cls, fields, values):
+        # (a, b) > (a0, b0)  <=>  a >= a0 AND (a > a0 OR b > b0);
+        # ведущее условие a >= a0 позволяет пройти по индексу диапазоном
+        name, value = fields[0].attname, values[0]
+        if len(fields) == 1:
+            return Q(**{f'{name}__gt': value})
+        return Q(**{f'{name}__gte': value}) & (
+            Q(**{f'{name}__gt': value}) | cls.after(fields[1:], values[1:])
+        )
+
+
+class EventPagination(KeysetPagination):
+    ordering = ('datetime', 'event_id')
+
+
+class PrimaryKeyPagination(KeysetPagination):
+    ordering = ('pk',)
+
+
+class AttendeePagination(KeysetPagination):
+    # Реакции одного мероприятия и типа: (event, type, user) уникально по user
+    ordering = ('user',)
+
+
+class MarkerPagination(KeysetPagination):
+    """Метки карты: строки values_list, первые столбцы которых - поля ordering."""
+    ordering = ('event_id',)
+    page_size = 5000
+    max_page_size = 20000
+
+    def get_page(self, results):
+        page = super().get_page(results)
+        # Курсор строится через value_to_string, которому нужен объект с атрибутами
+        if self.last is not None:
+            self.last = SimpleNamespace(**{field.attname: value for field, value in zip(self.fields, self.last)})
+        return page
@@ -0,0 +1,164 @@
+import abc
+import asyncio
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Паузы между попытками переподключиться к Redis, секунд: удваиваются до максимума
+RECONNECT_DELAY = 1
+RECONNECT_MAX_DELAY = 30
+
+
+class Subscription:
+    """Очередь сообщений одного клиента потока /stream/events/."""
+
+    def __init__(self, bbox=None):
+        self.bbox = bbox
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=settings.REALTIME_QUEUE_SIZE)
+        self.overflowed = False
+
+    def matches(self, message):
+        if self.bbox is None or message.get('latitude') is None:
+            return True
+        return (self.bbox.min_lat <= message['latitude'] <= self.bbox.max_lat
+                and self.bbox.min_lon <= message['longitude'] <= self.bbox.max_lon)
+
+    def deliver(self, message):
+        # Медленный клиент не должен копить память: отмечаем переполнение,
+        # и клиент перезагрузит данные целиком
+        if self.queue.full():
+            self.overflowed = True
+            return
+        self.queue.put_nowait(message)
+
+    def reset(self):
+        # Сообщения могли потеряться: клиент получит reset и перезагрузит данные
+        self.overflowed = True
+        if not self.queue.full():
+            self.queue.put_nowait({})
+
+
+class BaseBroker(abc.ABC):
+    @abc.abstractmethod
+    def publish(self, message):
+        pass
+
+    @abc.abstractmethod
+    def subscribe(self, bbox=None):
+        pass
+
+    @abc.abstractmethod
+    def unsubscribe(self, subscription):
+        pass
+
+
+class InMemoryBroker(BaseBroker):
+    """Рассылка внутри одного процесса."""
+
+    def __init__(self):
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+
+    def publish(self, message):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            if not subscription.matches(message):
+                continue
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, message)
+            except RuntimeError:
+                # Цикл событий подписчика уже закрыт
+                self.unsubscribe(subscription)
+
+    def subscribe(self, bbox=None):
+        subscription = Subscription(bbox)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def reset(self):
+        """Отправляет всем подписчикам reset."""
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.reset)
+            except RuntimeError:
+                self.unsubscribe(subscription)
+
+
+class RedisBroker(InMemoryBroker):
+    """Рассылка между процессами через Redis pub/sub (нужен пакет redis)."""
+    channel = 'tsp:events'
+
+    def __init__(self):
+        super().__init__()
+        import redis
+
+        self._redis = redis.Redis.from_url(settings.REALTIME_REDIS_URL)
+        self._listener = None
+
+    def publish(self, message):
+        self._redis.publish(self.channel, json.dumps(message))
+
+    def subscribe(self, bbox=None):
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, daemon=True)
+                self._listener.start()
+        return super().subscribe(bbox)
+
+    def _listen(self):
+        import redis
+
+        delay = RECONNECT_DELAY
+        while True:
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                delay = RECONNECT_DELAY
+                for item in pubsub.listen():
+                    super().publish(json.loads(item['data']))
+            except redis.RedisError:
+                logger.warning('Соединение с Redis потеряно, повтор через %s с', delay, exc_info=True)
+            # Сообщения, пришедшие без соединения, потеряны
+            self.reset()
+            time.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(settings.REALTIME_BROKER)()
+    return _broker
+
+
+def publish_change(kind, event):
+    """Отправляет подписчикам сообщение после фиксации транзакции."""
+    message = {
+        'type': kind,
+        'event_id': event.event_id,
+        'latitude': float(event.latitude),
+        'longitude': float(event.longitude),
+    }
+    transaction.on_commit(lambda: get_broker().publish(message))
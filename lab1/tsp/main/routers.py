@@ -0,0 +1,88 @@
+"""Чтение с реплик базы данных.
+
+Все запросы идут в основную базу, кроме чтения внутри replica_reads():
+его представления мероприятий и категорий открывают на время GET и HEAD.
+После собственной записи пользователь DATABASE_REPLICA_PIN секунд
+читает из основной базы, чтобы не увидеть отставшую реплику.
+
+Закрепление хранится в кэше 'default'. Если этот кэш виден только своему
+процессу (LocMemCache, DummyCache), другие процессы о записи не узнают,
+поэтому реплики не используются и все запросы идут в основную базу.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .caches import is_process_local
+
+# Псевдоним реплики для чтения в текущем запросе (None - основная база)
+_replica = ContextVar('replica', default=None)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PIN_KEY = 'db:primary-pin:{}'
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _replica.get() or 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная база
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема приходит на реплики репликацией
+        return db not in settings.DATABASE_REPLICAS
+
+
+def request_user_id(request):
+    auth = getattr(request, 'jwt_auth', None)
+    if auth is not None:
+        return auth[0].pk
+    user = getattr(request, 'user', None)
+    return user.pk if user is not None and user.is_authenticated else None
+
+
+def is_pinned(user_id):
+    return user_id is not None and cache.get(PIN_KEY.format(user_id)) is not None
+
+
+def pin_to_primary(user_id):
+    if user_id is not None and settings.DATABASE_REPLICAS:
+        cache.set(PIN_KEY.format(user_id), 1, settings.DATABASE_REPLICA_PIN)
+
+
+@contextmanager
+def replica_reads(request):
+    """Чтение в блоке - со случайной реплики, если запрос безопасный и пользователь не закреплён."""
+    replicas = settings.DATABASE_REPLICAS
+    if not replicas or request.method not in SAFE_METHODS or is_process_local() \
+            or is_pinned(request_user_id(request)):
+        yield
+        return
+    token = _replica.set(random.choice(replicas))
+    try:
+        yield
+    finally:
+        _replica.reset(token)
+
+
+class ReplicaRoutingMixin:
+    """Для DRF-представлений: чтение с реплики, успешная запись закрепляет пользователя за основной базой."""
+    read_from_replica = True
+
+    def dispatch(self, request, *args, **kwargs):
+        if self.read_from_replica:
+            with replica_reads(request):
+                response = super().dispatch(request, *args, **kwargs)
+        else:
+            response = super().dispatch(request, *args, **kwargs)
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            pin_to_primary(request_user_id(request))
+        return response
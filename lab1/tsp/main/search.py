@@ -0,0 +1,85 @@
+"""Полнотекстовый поиск по названию и описанию мероприятий.
+
+На PostgreSQL в main_event хранится генерируемый столбец search_vector
+с GIN-индексом, на SQLite - внешняя FTS5-таблица main_event_fts,
+которую поддерживают триггеры. Модель Event об этих объектах не знает,
+запросы к ним строит EventQuerySet.search.
+"""
+import re
+
+# Конфигурация текстового поиска PostgreSQL (стемминг русского языка)
+SEARCH_CONFIG = 'russian'
+MAX_SEARCH_TERMS = 8
+
+POSTGRESQL_CREATE = [
+    f"""ALTER TABLE main_event ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(title, '')), 'A')
+        || setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(description, '')), 'B')
+    ) STORED""",
+    'CREATE INDEX IF NOT EXISTS main_event_search_gin ON main_event USING gin (search_vector)',
+]
+POSTGRESQL_DROP = [
+    'DROP INDEX IF EXISTS main_event_search_gin',
+    'ALTER TABLE main_event DROP COLUMN IF EXISTS search_vector',
+]
+
+SQLITE_TABLE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS main_event_fts USING fts5("
+    "title, description, content='main_event', content_rowid='event_id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+)
+SQLITE_TRIGGERS = {
+    'main_event_fts_insert': (
+        'CREATE TRIGGER main_event_fts_insert AFTER INSERT ON main_event BEGIN '
+        'INSERT INTO main_event_fts(rowid, title, description) VALUES (new.event_id, new.title, new.description); '
+        'END'
+    ),
+    'main_event_fts_delete': (
+        'CREATE TRIGGER main_event_fts_delete AFTER DELETE ON main_event BEGIN '
+        "INSERT INTO main_event_fts(main_event_fts, rowid, title, description) "
+        "VALUES ('delete', old.event_id, old.title, old.description); "
+        'END'
+    ),
+    'main_event_fts_update': (
+        'CREATE TRIGGER main_event_fts_update AFTER UPDATE OF title, description ON main_event BEGIN '
+        "INSERT INTO main_event_fts(main_event_fts, rowid, title, description) "
+        "VALUES ('delete', old.event_id, old.title, old.description); "
+        'INSERT INTO main_event_fts(rowid, title, description) VALUES (new.event_id, new.title, new.description); '
+        'END'
+    ),
+}
+
+
+def search_terms(query):
+    return re.findall(r'\w+', query.lower())[:MAX_SEARCH_TERMS]
+
+
+def create_search_index(connection):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            for sql in POSTGRESQL_CREATE:
+                cursor.execute(sql)
+        elif connection.vendor == 'sqlite':
+            cursor.execute(SQLITE_TABLE)
+            existing = {
+                row[0] for row in cursor.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'main_event'"
+                )
+            }
+            missing = [sql for name, sql in SQLITE_TRIGGERS.items() if name not in existing]
+            for sql in missing:
+                cursor.execute(sql)
+            if missing:
+                # Пока триггеров не было, индекс мог отстать от таблицы
+                cursor.execute("INSERT INTO main_event_fts(main_event_fts) VALUES ('rebuild')")
+
+
+def drop_search_index(connection):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            for sql in POSTGRESQL_DROP:
+                cursor.execute(sql)
+        elif connection.vendor == 'sqlite':
+            for name in SQLITE_TRIGGERS:
+                cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+            cursor.execute('DROP TABLE IF EXISTS main_event_fts')
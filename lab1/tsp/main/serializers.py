@@ -1,7 +1,11 @@
+from django.conf import settings
 from rest_framework import permissions, serializers
+from .caches import category_cache
+from .metrics import TimedSerializerMixin
 from .models import User, Event, Category, Reaction
 import re
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from .blacklist import BloomRefreshToken
 from django.contrib.auth.hashers import make_password
 from django.core.validators import ValidationError
 from rest_framework.validators import UniqueValidator
@@ -43,13 +47,14 @@ class CanChangePassword(permissions.BasePermission):
         return obj.id == request.user.id
 
 
-class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
-    def validate(self, attrs):
-        data = super().validate(attrs)
-        return {
-            'refresh': data['refresh'],
-            'access': data['access']
-        }
+class LoginSerializer(serializers.Serializer):
+    """Поля входа /api/auth/login/, пароль проверяет LoginAsyncView."""
+    username = serializers.CharField()
+    password = serializers.CharField(trim_whitespace=False, style={'input_type': 'password'})
+
+
+class BloomTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = BloomRefreshToken
 
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
@@ -80,25 +85,17 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError({"password": "Пароли не совпадают"})
         return data
 
-    def create(self, validated_data):
-        validated_data.pop('password2')
-        user = User.objects.create_user(
-            username=validated_data['username'],
-            email=validated_data['email'],
-            password=validated_data['password']
-        )
-        return user
-
     def create(self, validated_data):
         return User.objects.create_user(
             username=validated_data['username'],
             email=validated_data['email'],
             password=validated_data['password'],
+            encoded_password=validated_data.get('encoded_password'),
             avatar=validated_data.get('avatar')
         )
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     email = serializers.EmailField(
         validators=[UniqueValidator(queryset=User.objects.all(), message="Email уже занят")],
         required=False
@@ -191,7 +188,7 @@ class UserSerializer(serializers.ModelSerializer):
         return ret
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(TimedSerializerMixin, serializers.ModelSerializer):
     name = serializers.CharField(
         max_length=100,
         error_messages={
@@ -209,16 +206,35 @@ class CategorySerializer(serializers.ModelSerializer):
         if self.instance and self.instance.name == value:
             return value
 
-        if Category.objects.filter(name__iexact=value).exists():
+        if category_cache.name_exists(value):
             raise serializers.ValidationError('Категория с таким названием уже существует')
         return value
 
 
-class EventSerializer(serializers.ModelSerializer):
-    going_count = serializers.SerializerMethodField()
+class CachedCategoryField(serializers.PrimaryKeyRelatedField):
+    """Категория по id из category_cache, без запроса к базе."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            category_id = int(data)
+            # int() отбрасывает дробную часть: 1.9 - не категория 1
+            if category_id != data and str(category_id) != str(data).strip():
+                raise ValueError
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+        category = category_cache.get(category_id)
+        if category is None:
+            self.fail('does_not_exist', pk_value=data)
+        return category
+
+
+class EventSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     going_users = serializers.SerializerMethodField()
 
-    category = serializers.PrimaryKeyRelatedField(queryset=Category.objects.all())
+    category = CachedCategoryField(queryset=Category.objects.all())
     creator = serializers.PrimaryKeyRelatedField(read_only=True)
     user_reaction = serializers.SerializerMethodField()
 
@@ -226,7 +242,7 @@ class EventSerializer(serializers.ModelSerializer):
         model = Event
         fields = ['event_id', 'title', 'description', 'latitude', 'longitude',
               'datetime', 'category', 'creator', 'going_users', 'going_count', 'user_reaction']
-        read_only_fields = ['creator']
+        read_only_fields = ['creator', 'going_count']
         extra_kwargs = {
             'title': {
                 'error_messages': {
@@ -235,15 +251,41 @@ class EventSerializer(serializers.ModelSerializer):
             }
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # ?fields= у EventApiView: отдаём только запрошенные поля
+        fields = self.context.get('fields')
+        if fields is not None:
+            for name in set(self.fields) - fields:
+                self.fields.pop(name)
+
+    def update(self, instance, validated_data):
+        # going_count меняется только F-выражением в Reaction.apply_changes;
+        # сохранение всех полей затёрло бы прибавки, зафиксированные после
+        # чтения мероприятия
+        for name, value in validated_data.items():
+            setattr(instance, name, value)
+        instance.save(update_fields=[*validated_data, 'grid_cell', 'updated_at'])
+        return instance
+
+    # EventApiView.get_queryset заранее добавляет user_reaction аннотацией,
+    # а going_reactions - через Prefetch, поэтому сериализация списка
+    # не делает запросов на каждое мероприятие. going_users - только первые
+    # EVENT_GOING_USERS_PREVIEW участников, полный список - /attendees/
+
     def get_user_reaction(self, obj):
+        if hasattr(obj, 'user_reaction'):
+            return obj.user_reaction
         user = self.context['request'].user
         reaction = obj.reactions.filter(user=user).first()
         return reaction.type if reaction else None
-    def get_going_count(self, obj):
-        return obj.reactions.filter(type='going').count()
 
     def get_going_users(self, obj):
-        return [reaction.user.username for reaction in obj.reactions.filter(type='going')]
+        reactions = getattr(obj, 'going_reactions', None)
+        if reactions is None:
+            reactions = obj.reactions.filter(type='going').select_related('user').order_by('user_id')
+            reactions = reactions[:settings.EVENT_GOING_USERS_PREVIEW]
+        return [reaction.user.username for reaction in reactions]
 
 class SimpleUserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -251,7 +293,7 @@ class SimpleUserSerializer(serializers.ModelSerializer):
         fields = ('id', 'username', 'avatar')
         read_only_fields = ['id', 'username', 'avatar']
 
-class ReactionSerializer(serializers.ModelSerializer):
+class ReactionSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     user = serializers.HiddenField(default=serializers.CurrentUserDefault())
     event = serializers.PrimaryKeyRelatedField(
         queryset=Event.objects.all(),
@@ -282,13 +324,16 @@ class ReactionSerializer(serializers.ModelSerializer):
             if data['event'] != self.instance.event:
                 raise serializers.ValidationError({"event": "Нельзя изменять мероприятие для существующей реакции"})
 
-        if self.instance is None and Reaction.objects.filter(
-                user=data.get('user', self.context['request'].user),
-                event=data['event']
-        ).exists():
-            raise serializers.ValidationError({"error": "Вы уже оставили реакцию на это мероприятие"})
-
         return data
 
 
+class ReactionWriteSerializer(serializers.Serializer):
+    """Входные данные создания реакции: существующая реакция на мероприятие заменяется."""
+    event = serializers.IntegerField(min_value=1)
+    type = serializers.ChoiceField(
+        choices=Reaction.REACTION_TYPES,
+        error_messages={'invalid_choice': 'Допустимые значения: going, not_going'}
+    )
+
+
 
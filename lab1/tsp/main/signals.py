@@ -0,0 +1,98 @@
+from django.db import connections
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import search, tiles
+
+from .authentication import invalidate_user
+from .caches import category_cache
+from .models import Category, Event, EventCluster, EventTombstone, Reaction, User
+
+
+# Должен идти до update_clusters_on_save, который обновляет _loaded_coords
+@receiver(post_save, sender=Event)
+def invalidate_tiles_on_save(sender, instance, **kwargs):
+    tiles.invalidate_points([
+        (instance.latitude, instance.longitude),
+        getattr(instance, '_loaded_coords', (None, None)),
+    ])
+
+
+@receiver(post_delete, sender=Event)
+def invalidate_tiles_on_delete(sender, instance, **kwargs):
+    tiles.invalidate_points([(instance.latitude, instance.longitude)])
+
+
+# Тоже читает _loaded_coords до update_clusters_on_save
+@receiver(post_save, sender=Event)
+def record_move(sender, instance, created, **kwargs):
+    old_latitude, old_longitude = getattr(instance, '_loaded_coords', (None, None))
+    if created or old_latitude is None or (old_latitude, old_longitude) == (instance.latitude, instance.longitude):
+        return
+    EventTombstone.objects.create(
+        event_id=instance.event_id, latitude=old_latitude, longitude=old_longitude, moved=True,
+    )
+
+
+@receiver(post_save, sender=Event)
+def update_clusters_on_save(sender, instance, created, **kwargs):
+    if created:
+        EventCluster.objects.add_event(instance.event_id, instance.latitude, instance.longitude)
+        instance._loaded_coords = (instance.latitude, instance.longitude)
+        return
+
+    old_latitude, old_longitude = getattr(instance, '_loaded_coords', (None, None))
+    if old_latitude is None or (old_latitude, old_longitude) == (instance.latitude, instance.longitude):
+        return
+    EventCluster.objects.remove_event(instance.event_id, old_latitude, old_longitude)
+    EventCluster.objects.add_event(instance.event_id, instance.latitude, instance.longitude)
+    instance._loaded_coords = (instance.latitude, instance.longitude)
+
+
+@receiver(post_delete, sender=Event)
+def update_clusters_on_delete(sender, instance, **kwargs):
+    EventCluster.objects.remove_event(instance.event_id, instance.latitude, instance.longitude)
+
+
+@receiver(post_delete, sender=Event)
+def create_tombstone(sender, instance, **kwargs):
+    EventTombstone.objects.create(
+        event_id=instance.event_id,
+        latitude=instance.latitude,
+        longitude=instance.longitude,
+    )
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_cache(sender, **kwargs):
+    category_cache.invalidate()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+
+
+@receiver(pre_delete, sender=User)
+def remember_going_reactions(sender, instance, **kwargs):
+    # Реакции удаляются каскадом без Reaction.apply_change
+    instance._going_event_ids = list(
+        Reaction.objects.filter(user=instance, type='going').values_list('event_id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=User)
+def release_going_counts(sender, instance, **kwargs):
+    Reaction.apply_changes({event_id: ('going', None) for event_id in getattr(instance, '_going_event_ids', [])})
+
+
+@receiver(post_migrate)
+def restore_search_triggers(sender, using, **kwargs):
+    # При пересоздании таблицы main_event миграцией SQLite удаляет её
+    # триггеры, без которых main_event_fts перестанет обновляться
+    connection = connections[using]
+    if sender.name == 'main' and connection.vendor == 'sqlite' \
+            and 'main_event_fts' in connection.introspection.table_names():
+        search.create_search_index(connection)
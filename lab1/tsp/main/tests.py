@@ -1,3 +1,1324 @@
-from django.test import TestCase
+import asyncio
+import json
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.test import AsyncClient, SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, APITestCase, APITransactionTestCase, force_authenticate
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from . import authentication, geo, hashing, realtime, renderers, routers, tiles
+from .blacklist import BloomFilter, BloomRefreshToken, blacklist_filter
+from .caches import CategoryCache, category_cache
+from .models import Category, Event, EventArchive, EventCluster, EventTombstone, Reaction, ReactionArchive, User
+from .realtime import InMemoryBroker
+from .views import EventApiView, LogoutApiView, ReactionApiView
+
+
+class EventListQueryCountTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('viewer', 'viewer@example.com', 'password123')
+        cls.attendees = [
+            User.objects.create_user(f'attendee{i}', f'attendee{i}@example.com', 'password123')
+            for i in range(3)
+        ]
+        cls.category = Category.objects.create(name='Концерты')
+
+    def setUp(self):
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        # Пользователь попадает в кэш аутентификации, дальше считаем только запросы списка
+        self.client.get('/api/categories/')
+
+    def add_events(self, count):
+        start = timezone.now() + timedelta(days=1)
+        events = Event.objects.bulk_create(
+            Event(
+                title=f'Мероприятие {i}',
+                latitude=53.2 + i * 1e-6,
+                longitude=50.1,
+                datetime=start + timedelta(minutes=i),
+                category=self.category,
+                creator=self.user,
+                going_count=2,
+            )
+            for i in range(count)
+        )
+        Reaction.objects.bulk_create(
+            Reaction(user=user, event=event, type='going' if i % 2 else 'not_going')
+            for event in events
+            for i, user in enumerate(self.attendees + [self.user])
+        )
+
+    def list_query_count(self, page_size):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/events/', {'page_size': page_size})
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.json()['results']
+
+    def test_list_runs_fixed_number_of_queries(self):
+        counts = []
+        for total in (1, 100, 10_000):
+            self.add_events(total - Event.objects.count())
+            query_count, events = self.list_query_count(page_size=total)
+            self.assertEqual(len(events), min(total, 1000))
+            counts.append(query_count)
+
+        self.assertEqual(counts, [4, 4, 4])
+        self.assertEqual(events[0]['going_count'], 2)
+        self.assertEqual(sorted(events[0]['going_users']), ['attendee1', 'viewer'])
+        self.assertEqual(events[0]['user_reaction'], 'going')
+
+    def test_detail_runs_fixed_number_of_queries(self):
+        self.add_events(1)
+        event = Event.objects.get()
+
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/api/events/{event.event_id}/')
+        self.assertEqual(response.json()['going_count'], 2)
+
+
+class BBoxFilterTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('viewer', 'viewer@example.com', 'password123')
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        moment = timezone.now() + timedelta(days=1)
+        # Сетка 0.01°: точки в разных строках и столбцах сетки, одна на границе bbox
+        for title, latitude, longitude in (
+            ('Центр', 53.2, 50.1), ('Север', 53.218, 50.1), ('Восток', 53.2, 50.119),
+            ('Граница', 53.22, 50.12), ('Снаружи', 53.221, 50.1), ('Москва', 55.75, 37.62),
+        ):
+            Event.objects.create(title=title, latitude=latitude, longitude=longitude, datetime=moment,
+                                 creator=self.user)
+
+    def titles(self, bbox):
+        response = self.client.get('/api/events/', {'bbox': bbox})
+        self.assertEqual(response.status_code, 200)
+        return sorted(event['title'] for event in response.json()['results'])
+
+    def test_bbox_across_grid_cells(self):
+        bbox = geo.parse_bbox('53.195,50.095,53.22,50.12')
+        self.assertEqual(len(geo.grid_cell_ranges(bbox)), 4)
+        self.assertEqual(self.titles('53.195,50.095,53.22,50.12'), ['Восток', 'Граница', 'Север', 'Центр'])
+
+    def test_large_bbox_filters_by_coordinates(self):
+        bbox = geo.parse_bbox('50,30,56,60')
+        self.assertGreater(len(geo.grid_cell_ranges(bbox)), geo.MAX_BBOX_GRID_ROWS)
+        self.assertEqual(len(self.titles('50,30,56,60')), 6)
+        self.assertEqual(self.titles('55,37,56,38'), ['Москва'])
+
+    def test_invalid_bbox(self):
+        for bbox in ('53,50,54', '53,50,54,x', '54,50,53,51', '53,51,54,50', 'nan,50,54,51', '53,50,inf,51'):
+            response = self.client.get('/api/events/', {'bbox': bbox})
+            self.assertEqual(response.status_code, 400, bbox)
+            self.assertIn('bbox', response.json())
+
+
+class ReactionGoingCountTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('guest', 'guest@example.com', 'password123')
+        self.event = Event.objects.create(
+            title='Выставка',
+            latitude=53.2,
+            longitude=50.1,
+            datetime=timezone.now() + timedelta(days=1),
+            creator=self.user,
+        )
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def going_count(self):
+        self.event.refresh_from_db(fields=['going_count'])
+        return self.event.going_count
+
+    def test_going_count_follows_reaction_changes(self):
+        response = self.client.post('/api/reactions/', {'event': self.event.event_id, 'type': 'going'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.going_count(), 1)
+
+        self.client.post('/api/reactions/', {'event': self.event.event_id, 'type': 'not_going'})
+        self.assertEqual(self.going_count(), 0)
+
+        self.client.post('/api/reactions/', {'event': self.event.event_id, 'type': 'going'})
+        reaction = Reaction.objects.get(user=self.user, event=self.event)
+        self.client.delete(f'/api/reactions/{reaction.reaction_id}/')
+        self.assertEqual(self.going_count(), 0)
+
+    def test_concurrent_reaction_writes_apply_once(self):
+        reaction = Reaction.objects.create(user=self.user, event=self.event, type='going')
+        Reaction.apply_change(self.event.event_id, None, 'going')
+        url = f'/api/reactions/{reaction.reaction_id}/'
+
+        def stale_copies():
+            return [Reaction.objects.get(pk=reaction.pk) for _ in range(2)]
+
+        # Оба запроса прочитали реакцию до того, как первый её изменил
+        with mock.patch.object(ReactionApiView, 'get_object', side_effect=stale_copies()):
+            self.assertEqual(self.client.put(url, {'type': 'not_going'}).status_code, 200)
+            self.assertEqual(self.client.put(url, {'type': 'not_going'}).status_code, 200)
+        self.assertEqual(self.going_count(), 0)
+
+        Reaction.objects.filter(pk=reaction.pk).update(type='going')
+        Reaction.apply_change(self.event.event_id, None, 'going')
+        with mock.patch.object(ReactionApiView, 'get_object', side_effect=stale_copies()):
+            self.assertEqual(self.client.delete(url).status_code, 204)
+            self.assertEqual(self.client.delete(url).status_code, 404)
+        self.assertEqual(self.going_count(), 0)
+
+    def test_event_update_keeps_concurrent_going_count(self):
+        other = User.objects.create_user('other', 'other@example.com', 'password123')
+        get_object = EventApiView.get_object
+
+        def get_object_then_react(view):
+            event = get_object(view)
+            # Реакция фиксируется между чтением мероприятия и его сохранением
+            Reaction.objects.create(user=other, event=self.event, type='going')
+            Reaction.apply_change(self.event.event_id, None, 'going')
+            return event
+
+        with mock.patch.object(EventApiView, 'get_object', get_object_then_react):
+            response = self.client.patch(f'/api/events/{self.event.event_id}/', {'title': 'Ярмарка'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.event.refresh_from_db()
+        self.assertEqual((self.event.title, self.event.going_count), ('Ярмарка', 1))
+
+    def test_deleting_user_releases_going_count(self):
+        other = User.objects.create_user('leaver', 'leaver@example.com', 'password123')
+        Reaction.objects.create(user=other, event=self.event, type='going')
+        Reaction.apply_change(self.event.event_id, None, 'going')
+        other.delete()
+        self.assertEqual(self.going_count(), 0)
+
+    def test_reconcile_fixes_drift(self):
+        Reaction.objects.create(user=self.user, event=self.event, type='going')
+        call_command('reconcile_going_counts', '--dry-run', stdout=StringIO())
+        self.assertEqual(self.going_count(), 0)
+        version = Event.objects.get(pk=self.event.pk).version
+        out = StringIO()
+        call_command('reconcile_going_counts', stdout=out)
+        self.assertEqual(self.going_count(), 1)
+        self.assertEqual(Event.objects.get(pk=self.event.pk).version, version + 1)
+        self.assertIn('исправлено расхождений: 1', out.getvalue())
+
+    def test_reconcile_keeps_concurrent_increment(self):
+        Reaction.objects.create(user=self.user, event=self.event, type='going')
+        other = User.objects.create_user('late', 'late@example.com', 'password123')
+        test = self
+
+        class ReactingOutput(StringIO):
+            def write(self, text):
+                # Реакция фиксируется между поиском расхождений и их исправлением
+                if text.startswith('Мероприятие'):
+                    Reaction.objects.create(user=other, event=test.event, type='going')
+                    Reaction.apply_change(test.event.event_id, None, 'going')
+                return super().write(text)
+
+        call_command('reconcile_going_counts', stdout=ReactingOutput())
+        self.assertEqual(self.going_count(), 2)
+
+    def test_repeated_reaction_updates_row_in_place(self):
+        first = self.client.post('/api/reactions/', {'event': self.event.event_id, 'type': 'going'})
+        second = self.client.post('/api/reactions/', {'event': self.event.event_id, 'type': 'not_going'})
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json()['reaction_id'], first.json()['reaction_id'])
+        self.assertEqual(Reaction.objects.get().type, 'not_going')
+
+    def test_batch(self):
+        other = Event.objects.create(
+            title='Лекция', latitude=53.3, longitude=50.2,
+            datetime=timezone.now() + timedelta(days=2), creator=self.user,
+        )
+        Reaction.objects.create(user=self.user, event=other, type='going')
+        Event.objects.filter(pk=other.pk).update(going_count=1)
+
+        response = self.client.post('/api/reactions/batch/', [
+            {'event': self.event.event_id, 'type': 'going'},
+            {'event': other.event_id, 'type': 'not_going'},
+        ], format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.going_count(), 1)
+        self.assertEqual(Event.objects.get(pk=other.pk).going_count, 0)
+
+        response = self.client.post('/api/reactions/batch/', [{'event': 999999, 'type': 'going'}], format='json')
+        self.assertEqual(response.status_code, 404)
+
+
+class ReactionUpsertTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('upserter', 'upserter@example.com', 'password123')
+        self.events = [
+            Event.objects.create(title=f'Событие {i}', latitude=53.2, longitude=50.1,
+                                 datetime=timezone.now(), creator=self.user)
+            for i in range(3)
+        ]
+        first, second, _ = self.events
+        Reaction.objects.create(user=self.user, event=first, type='going')
+        Reaction.objects.create(user=self.user, event=second, type='going')
+
+    def upsert(self):
+        first, second, third = self.events
+        return Reaction.objects.upsert(self.user.pk, {
+            first.pk: 'going', second.pk: 'not_going', third.pk: 'going',
+        })
+
+    def assert_upserted(self, written):
+        first, second, third = self.events
+        reactions = dict(Reaction.objects.filter(user=self.user).values_list('event_id', 'reaction_id'))
+        # previous_type: тот же тип - без изменений, другой - обновлена, None - новая
+        self.assertEqual(written, {
+            first.pk: (reactions[first.pk], 'going'),
+            second.pk: (reactions[second.pk], 'going'),
+            third.pk: (reactions[third.pk], None),
+        })
+        self.assertEqual(Reaction.objects.get(event=second).type, 'not_going')
+
+    def test_upsert_reports_previous_types(self):
+        self.assert_upserted(self.upsert())
+
+    @skipUnless(connection.vendor == 'postgresql', 'INSERT ... ON CONFLICT с xmax есть только в PostgreSQL')
+    def test_postgresql_upsert_is_one_statement(self):
+        with CaptureQueriesContext(connection) as queries:
+            written = self.upsert()
+        statements = [query['sql'] for query in queries.captured_queries]
+        self.assertIn('xmax = 0', statements[0])
+        # Вставка и обновление - одним INSERT, неизменённая реакция дочитывается вторым запросом
+        self.assertEqual(len(statements), 2)
+        self.assert_upserted(written)
+
+    def test_missing_event_writes_nothing(self):
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        response = self.client.post('/api/reactions/batch/', [
+            {'event': self.events[2].pk, 'type': 'going'}, {'event': 999999, 'type': 'going'},
+        ], format='json')
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Reaction.objects.filter(event=self.events[2]).exists())
+
+
+class KeysetPaginationTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('walker', 'walker@example.com', 'password123')
+        moment = timezone.now() + timedelta(days=1)
+        # Одинаковое время у всех мероприятий проверяет второй ключ сортировки
+        Event.objects.bulk_create(
+            Event(title=f'Событие {i}', latitude=53.2, longitude=50.1, datetime=moment, creator=self.user)
+            for i in range(25)
+        )
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_pages_cover_all_events_once(self):
+        seen = []
+        url = '/api/events/?page_size=10'
+        while url:
+            page = self.client.get(url).json()
+            seen.extend(event['event_id'] for event in page['results'])
+            url = page['next']
+
+        self.assertEqual(seen, sorted(Event.objects.values_list('event_id', flat=True)))
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/events/', {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+
+class EventChangesTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('syncer', 'syncer@example.com', 'password123')
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def create_event(self, title):
+        return Event.objects.create(
+            title=title, latitude=53.2, longitude=50.1,
+            datetime=timezone.now() + timedelta(days=1), creator=self.user,
+        )
+
+    def changes(self, cursor):
+        return self.client.get('/api/events/changes/', {'since': cursor}).json()
+
+    def test_changes_since_cursor(self):
+        kept = self.create_event('Остаётся')
+        removed = self.create_event('Удаляется')
+        cursor = self.client.get('/api/events/changes/').json()['cursor']
+
+        Event.objects.filter(pk=kept.pk).update(updated_at=timezone.now() - timedelta(minutes=5))
+        self.client.post('/api/reactions/', {'event': removed.event_id, 'type': 'going'})
+        created = self.create_event('Новое')
+        removed_id = removed.event_id
+        removed.delete()
+
+        page = self.changes(cursor)
+        self.assertFalse(page['reset'])
+        self.assertEqual([event['event_id'] for event in page['updated']], [created.event_id])
+        self.assertEqual(page['deleted'], [removed_id])
+
+    def test_event_moved_out_of_bbox(self):
+        left = self.create_event('Уехало')
+        stayed = self.create_event('Рядом')
+        cursor = self.client.get('/api/events/changes/').json()['cursor']
+
+        left.latitude, left.longitude = 55.75, 37.62
+        left.save()
+        stayed.latitude = 53.21
+        stayed.save()
+
+        page = self.client.get('/api/events/changes/', {'since': cursor, 'bbox': '53,50,54,51'}).json()
+        self.assertEqual([event['event_id'] for event in page['updated']], [stayed.event_id])
+        self.assertEqual((page['deleted'], page['moved']), ([], [left.event_id]))
+        moscow = self.client.get('/api/events/changes/', {'since': cursor, 'bbox': '55,37,56,38'}).json()
+        self.assertEqual(([event['event_id'] for event in moscow['updated']], moscow['moved']), ([left.event_id], []))
+
+    def test_stale_cursor_requests_reset(self):
+        stale = (timezone.now() - timedelta(days=30)).isoformat()
+        self.assertTrue(self.changes(stale)['reset'])
+
+
+class InMemoryBrokerTests(SimpleTestCase):
+    def test_subscribers_receive_messages_in_their_viewport(self):
+        async def scenario():
+            broker = InMemoryBroker()
+            samara = broker.subscribe(geo.parse_bbox('53,50,54,51'))
+            everywhere = broker.subscribe()
+
+            broker.publish({'type': 'event.created', 'event_id': 1, 'latitude': 53.2, 'longitude': 50.1})
+            broker.publish({'type': 'event.created', 'event_id': 2, 'latitude': 55.7, 'longitude': 37.6})
+            await asyncio.sleep(0)
+
+            broker.unsubscribe(everywhere)
+            broker.publish({'type': 'event.deleted', 'event_id': 1, 'latitude': 53.2, 'longitude': 50.1})
+            await asyncio.sleep(0)
+
+            drain = lambda subscription: [
+                subscription.queue.get_nowait()['event_id'] for _ in range(subscription.queue.qsize())
+            ]
+            return drain(samara), drain(everywhere)
+
+        samara, everywhere = asyncio.run(scenario())
+        self.assertEqual(samara, [1, 1])
+        self.assertEqual(everywhere, [1, 2])
+
+    def test_reset_marks_every_subscription(self):
+        async def scenario():
+            broker = InMemoryBroker()
+            subscriptions = [broker.subscribe(), broker.subscribe(geo.parse_bbox('53,50,54,51'))]
+            # Так RedisBroker сообщает о потерянном соединении
+            broker.reset()
+            await asyncio.sleep(0)
+            return [(subscription.overflowed, subscription.queue.qsize()) for subscription in subscriptions]
+
+        self.assertEqual(asyncio.run(scenario()), [(True, 1), (True, 1)])
+
+
+class EventStreamTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('listener', 'listener@example.com', 'password123')
+        self.token = str(AccessToken.for_user(self.user))
+        self.broker = InMemoryBroker()
+        patcher = mock.patch.object(realtime, 'get_broker', return_value=self.broker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def open_stream(self, bbox):
+        response = await AsyncClient().get('/stream/events/', {'token': self.token, 'bbox': bbox})
+        self.assertEqual(response.status_code, 200)
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b'retry: 5000\n\n')
+        return stream
+
+    def message(self, event_id, latitude, longitude):
+        return {'type': 'reaction', 'event_id': event_id, 'latitude': latitude, 'longitude': longitude}
+
+    @override_settings(REALTIME_QUEUE_SIZE=2)
+    async def test_stream_filters_by_bbox_and_resets_on_overflow(self):
+        stream = await self.open_stream('53,50,54,51')
+        self.broker.publish(self.message(1, 55.75, 37.62))
+        self.broker.publish(self.message(2, 53.2, 50.1))
+        self.assertEqual(await anext(stream), f'data: {json.dumps(self.message(2, 53.2, 50.1))}\n\n'.encode())
+
+        # Клиент не успевает читать: очередь из двух сообщений переполняется
+        for event_id in range(3, 6):
+            self.broker.publish(self.message(event_id, 53.2, 50.1))
+        self.assertEqual(await anext(stream), b'event: reset\ndata: {}\n\n')
+        with self.assertRaises(StopAsyncIteration):
+            await anext(stream)
+
+    async def test_invalid_token_and_bbox(self):
+        response = await AsyncClient().get('/stream/events/', {'token': 'bad'})
+        self.assertEqual(response.status_code, 401)
+        response = await AsyncClient().get('/stream/events/', {'token': self.token, 'bbox': '54,50,53,51'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('cacher', 'cacher@example.com', 'password123')
+        self.event = Event.objects.create(
+            title='Фестиваль', latitude=53.2, longitude=50.1,
+            datetime=timezone.now() + timedelta(days=1), creator=self.user,
+        )
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def assert_revalidates(self, url, queries):
+        etag = self.client.get(url)['ETag']
+        # Только валидаторы: пользователь уже в кэше, сериализации нет
+        with self.assertNumQueries(queries):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.client.post('/api/reactions/', {'event': self.event.event_id, 'type': 'going'})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_detail_not_modified(self):
+        self.assert_revalidates(f'/api/events/{self.event.event_id}/', queries=1)
+
+    def test_list_not_modified(self):
+        self.assert_revalidates('/api/events/', queries=2)
+
+    def test_event_leaving_filter_changes_list_etag(self):
+        other = Event.objects.create(
+            title='Ярмарка', latitude=53.21, longitude=50.11,
+            datetime=timezone.now() + timedelta(days=2), creator=self.user,
+        )
+        url = '/api/events/?bbox=53.0,50.0,53.5,50.5'
+        response = self.client.get(url)
+        self.assertNotIn('Last-Modified', response)
+        etag = response['ETag']
+
+        # Мероприятие уходит из bbox: число и время изменений остальных строк прежние
+        other.latitude, other.longitude = 55.75, 37.62
+        other.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([event['event_id'] for event in response.json()['results']], [self.event.event_id])
+
+
+class EventClusterTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('clusterer', 'clusterer@example.com', 'password123')
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def create_event(self, title, latitude, longitude):
+        return Event.objects.create(title=title, latitude=latitude, longitude=longitude,
+                                    datetime=timezone.now(), creator=self.user)
+
+    def clusters(self, zoom):
+        response = self.client.get('/api/events/clusters/', {'zoom': zoom})
+        self.assertEqual(response.status_code, 200)
+        return sorted((cluster['count'], sorted(cluster['event_ids'])) for cluster in response.json())
+
+    def snapshot(self):
+        return {
+            (cluster.zoom, cluster.cell_x, cluster.cell_y): (cluster.count, sorted(cluster.sample_ids))
+            for cluster in EventCluster.objects.all()
+        }
+
+    def assert_matches_rebuild(self):
+        incremental = self.snapshot()
+        EventCluster.objects.rebuild()
+        self.assertEqual(incremental, self.snapshot())
+
+    def test_moving_and_deleting_events(self):
+        first = self.create_event('Первое', 53.2, 50.1)
+        second = self.create_event('Второе', 53.201, 50.101)
+        moscow = self.create_event('Москва', 55.75, 37.62)
+        zoom = geo.CLUSTER_ZOOM_LEVELS[0]
+        self.assertEqual(self.clusters(zoom), [(1, [moscow.pk]), (2, [first.pk, second.pk])])
+        self.assert_matches_rebuild()
+
+        second.latitude, second.longitude = 55.751, 37.621
+        second.save()
+        self.assertEqual(self.clusters(zoom), [(1, [first.pk]), (2, [second.pk, moscow.pk])])
+        self.assert_matches_rebuild()
+
+        first.delete()
+        self.assertEqual(self.clusters(zoom), [(2, [second.pk, moscow.pk])])
+        self.assertFalse(EventCluster.objects.filter(count__lte=0).exists())
+        self.assert_matches_rebuild()
+
+    def test_computed_clusters_keep_only_a_sample(self):
+        events = [self.create_event(f'Точка {i}', 53.2 + i / 1000, 50.1) for i in range(geo.CLUSTER_SAMPLE_SIZE + 2)]
+        zoom = 5
+        self.assertNotIn(zoom, geo.CLUSTER_ZOOM_LEVELS)
+        self.assertEqual(self.clusters(zoom),
+                         [(len(events), [event.pk for event in events[:geo.CLUSTER_SAMPLE_SIZE]])])
+        self.assert_matches_rebuild()
+
+    def test_removed_sample_is_refilled(self):
+        with mock.patch.object(geo, 'CLUSTER_SAMPLE_SIZE', 2):
+            events = [self.create_event(f'Точка {i}', 53.2 + i / 1000, 50.1) for i in range(3)]
+            cluster = EventCluster.objects.get(zoom=geo.CLUSTER_ZOOM_LEVELS[-1])
+            self.assertEqual(cluster.sample_ids, [events[0].pk, events[1].pk])
+            events[0].delete()
+        cluster.refresh_from_db()
+        self.assertEqual((cluster.count, cluster.sample_ids), (2, [events[1].pk, events[2].pk]))
+
+    def test_zoom_is_validated(self):
+        self.create_event('Точка', 53.2, 50.1)
+        self.assertEqual(self.client.get('/api/events/clusters/').status_code, 400)
+        self.assertEqual(self.client.get('/api/events/clusters/', {'zoom': geo.MAX_ZOOM + 1}).status_code, 400)
+        # Масштаб без таблицы кластеров считается запросом
+        self.assertEqual(self.clusters(geo.CLUSTER_ZOOM_LEVELS[0] + 1)[0][0], 1)
+
+
+class EventImportTests(APITestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user('loader', 'loader@example.com', 'password123', is_staff=True)
+        self.category = Category.objects.create(name='Спорт')
+        token = RefreshToken.for_user(self.staff).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_import_csv_skips_invalid_rows(self):
+        body = (
+            'title,description,latitude,longitude,datetime,category\n'
+            f'Забег,,53.2,50.1,2030-05-01T10:00:00Z,{self.category.category_id}\n'
+            f'Без даты,,53.2,50.1,,{self.category.category_id}\n'
+            f'Матч,Финал,53.3,50.2,2030-05-02T18:00:00Z,{self.category.category_id}\n'
+        )
+        response = self.client.generic('POST', '/api/events/import/', body, content_type='text/csv')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['created'], 2)
+        self.assertEqual([error['line'] for error in response.json()['errors']], [3])
+        self.assertEqual(
+            sorted(Event.objects.values_list('title', flat=True)), ['Забег', 'Матч']
+        )
+        self.assertEqual(EventCluster.objects.filter(zoom=geo.CLUSTER_ZOOM_LEVELS[0]).get().count, 2)
+
+    def test_import_updates_only_touched_clusters(self):
+        Event.objects.create(title='Старое', latitude=53.2, longitude=50.1, datetime=timezone.now(), creator=self.staff)
+        body = ''.join(
+            f'{{"title": "Точка {i}", "latitude": "{latitude}", "longitude": "50.1", '
+            f'"datetime": "2030-05-01T10:00:00Z", "category": {self.category.category_id}}}\n'
+            for i, latitude in enumerate(('53.2', '53.21', '55.75'))
+        )
+        with mock.patch.object(EventCluster.objects, 'rebuild') as rebuild:
+            response = self.client.generic('POST', '/api/events/import/', body, content_type='application/x-ndjson')
+        self.assertEqual(response.json()['created'], 3)
+        rebuild.assert_not_called()
+
+        clusters = {
+            (cluster.zoom, cluster.cell_x, cluster.cell_y): (cluster.count, sorted(cluster.sample_ids))
+            for cluster in EventCluster.objects.all()
+        }
+        EventCluster.objects.rebuild()
+        self.assertEqual(clusters, {
+            (cluster.zoom, cluster.cell_x, cluster.cell_y): (cluster.count, sorted(cluster.sample_ids))
+            for cluster in EventCluster.objects.all()
+        })
+
+    def test_import_keeps_empty_description(self):
+        # На PostgreSQL пачка пишется через COPY, иначе через bulk_create: результат одинаков
+        body = ''.join(
+            json.dumps({'title': title, 'latitude': '53.2', 'longitude': '50.1',
+                        'datetime': '2030-05-01T10:00:00Z', 'category': self.category.category_id, **extra}) + '\n'
+            for title, extra in (('Пустое', {'description': ''}), ('Без описания', {}))
+        )
+        response = self.client.generic('POST', '/api/events/import/', body, content_type='application/x-ndjson')
+        self.assertEqual(response.json()['created'], 2)
+        self.assertEqual(dict(Event.objects.values_list('title', 'description')),
+                         {'Пустое': '', 'Без описания': None})
+
+    def test_import_requires_staff(self):
+        user = User.objects.create_user('plain', 'plain@example.com', 'password123')
+        token = RefreshToken.for_user(user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        response = self.client.generic('POST', '/api/events/import/', '{}\n', content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 403)
+
+
+class SeedAndBenchmarkTests(APITestCase):
+    def test_seed_then_benchmark(self):
+        call_command('seed', users=5, events=50, reactions_per_user=4, random_seed=1, stdout=StringIO())
+
+        self.assertEqual(Event.objects.count(), 50)
+        self.assertEqual(Reaction.objects.count(), 20)
+        self.assertFalse(Event.objects.going_count_drift().exists())
+
+        output = StringIO()
+        call_command('benchmark', requests=2, warmup=0, stdout=output, stderr=StringIO())
+        endpoints = json.loads(output.getvalue())['endpoints']
+        self.assertEqual(endpoints['events-list']['status'], [200])
+        self.assertIn('p99_ms', endpoints['reactions-detail'])
+
+
+class PerformanceMetricsTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('meter', 'meter@example.com', 'password123')
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_server_timing_and_metrics(self):
+        response = self.client.get('/api/events/')
+        self.assertIn('db;dur=', response['Server-Timing'])
+
+        metrics = self.client.get('/metrics').content.decode()
+        self.assertIn('tsp_request_duration_seconds_count{route="events-list"}', metrics)
+        self.assertIn('tsp_db_queries_bucket{route="events-list",le="+Inf"}', metrics)
+
+    def test_metrics_are_local_only_by_default(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.7').status_code, 403)
+        with override_settings(METRICS_ALLOWED_IPS=[]):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+        with override_settings(METRICS_ALLOWED_IPS=['203.0.113.7']):
+            self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.7').status_code, 200)
+
+
+class NearbyEventsTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('nearby', 'nearby@example.com', 'password123')
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        moment = timezone.now() + timedelta(days=1)
+        # ~0.5 км, ~1.5 км и ~20 км к северу от точки поиска
+        for title, latitude in (('Рядом', 53.2045), ('Недалеко', 53.2135), ('Далеко', 53.38)):
+            Event.objects.create(title=title, latitude=latitude, longitude=50.1, datetime=moment, creator=self.user)
+
+    def nearby(self, **params):
+        response = self.client.get('/api/events/nearby/', {'lat': 53.2, 'lon': 50.1, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_radius_limits_and_sorts_by_distance(self):
+        results = self.nearby(radius=2)['results']
+        self.assertEqual([event['title'] for event in results], ['Рядом', 'Недалеко'])
+        self.assertAlmostEqual(results[0]['distance'], geo.haversine_km(53.2, 50.1, 53.2045, 50.1), places=3)
+
+    def test_search_expands_until_limit(self):
+        page = self.nearby(limit=3)
+        self.assertEqual(page['results'][-1]['title'], 'Далеко')
+        self.assertGreater(page['radius'], 20)
+
+
+class EventSearchTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('finder', 'finder@example.com', 'password123')
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.sport = Category.objects.create(name='Спорт')
+        moment = timezone.now() + timedelta(days=1)
+        for title, description, category in (
+            ('Джазовый концерт', 'Вечер живой музыки', None),
+            ('Лекция о музыке', 'Концерт после лекции', None),
+            ('Футбольный матч', 'Финал городского турнира', self.sport),
+        ):
+            Event.objects.create(title=title, description=description, latitude=53.2, longitude=50.1,
+                                 datetime=moment, category=category, creator=self.user)
+
+    def search(self, **params):
+        response = self.client.get('/api/events/search/', params)
+        self.assertEqual(response.status_code, 200)
+        return [event['title'] for event in response.json()['results']]
+
+    def test_ranked_prefix_search(self):
+        # Совпадение в названии выше совпадения в описании
+        self.assertEqual(self.search(q='конц'), ['Джазовый концерт', 'Лекция о музыке'])
+        self.assertEqual(self.search(q='музык лекц'), ['Лекция о музыке'])
+
+    def test_search_follows_updates_and_filters(self):
+        Event.objects.filter(title='Футбольный матч').update(title='Хоккейный матч')
+        self.assertEqual(self.search(q='хоккей', category=self.sport.category_id), ['Хоккейный матч'])
+        self.assertEqual(self.search(q='футбол'), [])
+        self.assertEqual(self.search(q='матч', to=timezone.now().isoformat()), [])
+
+
+class EventArchiveTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('archivist', 'archivist@example.com', 'password123')
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        now = timezone.now()
+        self.old, self.recent, self.upcoming = (
+            Event.objects.create(title=title, latitude=53.2, longitude=50.1, datetime=now + shift, creator=self.user)
+            for title, shift in (('Давнее', -timedelta(days=60)), ('Вчерашнее', -timedelta(days=1)),
+                                 ('Завтрашнее', timedelta(days=1)))
+        )
+        Reaction.objects.create(user=self.user, event=self.old, type='going')
+
+    def titles(self, **params):
+        return [event['title'] for event in self.client.get('/api/events/', params).json()['results']]
+
+    def test_time_filters(self):
+        self.assertEqual(self.titles(upcoming=1), ['Завтрашнее'])
+        since = (timezone.now() - timedelta(days=2)).isoformat()
+        self.assertEqual(self.titles(**{'from': since, 'to': timezone.now().isoformat()}), ['Вчерашнее'])
+        self.assertEqual(self.client.get('/api/events/', {'from': 'вчера'}).status_code, 400)
+
+    def test_archive_moves_past_events_with_reactions(self):
+        call_command('archive_events', days=30, batch_size=1, stdout=StringIO())
+
+        self.assertEqual(sorted(Event.objects.values_list('title', flat=True)), ['Вчерашнее', 'Завтрашнее'])
+        self.assertEqual(EventArchive.objects.get().going_count, 0)
+        self.assertEqual(ReactionArchive.objects.get().event_id, self.old.event_id)
+        self.assertFalse(Reaction.objects.exists())
+        self.assertTrue(EventTombstone.objects.filter(event_id=self.old.event_id).exists())
+        cluster = EventCluster.objects.filter(zoom=geo.CLUSTER_ZOOM_LEVELS[0]).get()
+        self.assertEqual((cluster.count, sorted(cluster.sample_ids)),
+                         (2, sorted([self.recent.event_id, self.upcoming.event_id])))
+
+    def test_archive_updates_only_archived_clusters(self):
+        Event.objects.create(title='Москва', latitude=55.75, longitude=37.62,
+                             datetime=timezone.now(), creator=self.user)
+        zoom = geo.CLUSTER_ZOOM_LEVELS[-1]
+        cell_x, cell_y = geo.cluster_cell(55.75, 37.62, zoom)
+        moscow = EventCluster.objects.filter(zoom=zoom, cell_x=cell_x, cell_y=cell_y)
+        # Ячейку вне пачки архивация не трогает, даже если она разошлась с таблицей
+        moscow.update(count=5)
+        call_command('archive_events', days=30, stdout=StringIO())
+        self.assertEqual(moscow.get().count, 5)
+
+
+class EventMarkersTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('mapper', 'mapper@example.com', 'password123')
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.category = Category.objects.create(name='Кино')
+        moment = timezone.now() + timedelta(days=1)
+        self.events = [
+            Event.objects.create(title=f'Показ {i}', latitude=53.2 + i, longitude=50.1, datetime=moment,
+                                 category=self.category, creator=self.user)
+            for i in range(2)
+        ]
+
+    def test_markers_are_columns(self):
+        response = self.client.get('/api/events/markers/', {'bbox': '53,50,53.5,51'})
+        self.assertEqual(response.json(), {
+            'ids': [self.events[0].event_id],
+            'lats': [53.2],
+            'lons': [50.1],
+            'category_ids': [self.category.category_id],
+            'titles': ['Показ 0'],
+            'next': None,
+        })
+
+    def test_markers_are_paginated(self):
+        first = self.client.get('/api/events/markers/', {'page_size': 1}).json()
+        self.assertEqual(first['ids'], [self.events[0].event_id])
+        second = self.client.get(first['next']).json()
+        self.assertEqual((second['ids'], second['next']), ([self.events[1].event_id], None))
+
+    def test_sparse_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/events/', {'fields': 'event_id,title'})
+        self.assertEqual(response.json()['results'][0], {'event_id': self.events[0].event_id, 'title': 'Показ 0'})
+        self.assertNotIn('main_reaction', ' '.join(query['sql'] for query in queries.captured_queries))
+
+        url = f'/api/events/{self.events[0].event_id}/'
+        etag = self.client.get(url)['ETag']
+        sparse = self.client.get(url, {'fields': 'title'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(sparse.json(), {'title': 'Показ 0'})
+        self.assertEqual(self.client.get('/api/events/', {'fields': 'secret'}).status_code, 400)
+
+
+class RendererTests(SimpleTestCase):
+    data = {'latitude': Decimal('53.19587300'), 'moment': timezone.now(), 'title': 'Концерт', 'ids': [1, 2]}
+
+    def test_fast_json_matches_drf(self):
+        self.assertEqual(
+            json.loads(renderers.FastJSONRenderer().render(self.data)),
+            json.loads(JSONRenderer().render(self.data)),
+        )
+
+    @skipUnless(renderers.msgpack, 'msgpack не установлен')
+    def test_msgpack_round_trip(self):
+        body = renderers.MessagePackRenderer().render(self.data)
+        parsed = renderers.MessagePackParser().parse(BytesIO(body))
+        self.assertEqual(parsed['ids'], [1, 2])
+        self.assertEqual(parsed['title'], 'Концерт')
+
+
+class PasswordHashingTests(APITestCase):
+    def test_login_through_hashing_pool(self):
+        User.objects.create_user('hasher', 'hasher@example.com', 'password123')
+        response = self.client.post('/api/auth/login/', {'username': 'hasher', 'password': 'password123'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_register_then_login(self):
+        response = self.client.post('/api/auth/register/', {
+            'username': 'newbie', 'email': 'newbie@example.com', 'password': 'password123', 'password2': 'password123',
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(User.objects.get(username='newbie').password.startswith('pbkdf2_sha256$'))
+        response = self.client.post('/api/auth/login/', {'username': 'newbie', 'password': 'password1234'})
+        self.assertEqual(response.status_code, 401)
+
+    def reset_pool(self):
+        if hashing._executor is not None:
+            hashing._executor.shutdown()
+        hashing._executor = hashing._slots = None
+
+    @override_settings(PASSWORD_HASHING_WORKERS=1, PASSWORD_HASHING_QUEUE=1)
+    def test_timed_out_hash_keeps_its_slot(self):
+        User.objects.create_user('stormy', 'stormy@example.com', 'password123')
+        self.reset_pool()
+        self.addCleanup(self.reset_pool)
+        hashing._get_executor().submit(int).result()
+
+        # Ожидание прервано, но задача в пуле идёт и занимает единственное место
+        with override_settings(PASSWORD_HASHING_TIMEOUT=0.1), self.assertRaises(hashing.HashingBusy):
+            hashing._run(time.sleep, 1)
+        started = time.monotonic()
+        response = self.client.post('/api/auth/login/', {'username': 'stormy', 'password': 'password123'})
+        self.assertEqual(response.status_code, 503)
+        self.assertLess(time.monotonic() - started, 0.5)
+
+        for _ in range(50):
+            if hashing._slots.acquire(blocking=False):
+                hashing._slots.release()
+                break
+            time.sleep(0.1)
+        response = self.client.post('/api/auth/login/', {'username': 'stormy', 'password': 'password123'})
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(PASSWORD_HASHING_WORKERS=0)
+    def test_async_hash_without_pool_leaves_event_loop(self):
+        async def hash_password():
+            with mock.patch('django.contrib.auth.hashers.make_password',
+                            side_effect=lambda password: threading.get_ident()):
+                return threading.get_ident(), await hashing.amake_password('password123')
+
+        loop_thread, hash_thread = asyncio.run(hash_password())
+        self.assertNotEqual(loop_thread, hash_thread)
+
+    @override_settings(
+        PASSWORD_HASHING_WORKERS=0,
+        PASSWORD_HASHERS=['django.contrib.auth.hashers.PBKDF2PasswordHasher',
+                          'django.contrib.auth.hashers.MD5PasswordHasher'],
+    )
+    def test_outdated_hash_is_replaced_on_login(self):
+        user = User.objects.create_user('legacy', 'legacy@example.com')
+        User.objects.filter(pk=user.pk).update(password=make_password('password123', hasher='md5'))
+        user.refresh_from_db()
+
+        self.assertTrue(user.check_password('password123'))
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$'))
+
+
+class AuthenticationCacheTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('cached', 'cached@example.com', 'password123')
+        self.access = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access}')
+
+    def get(self):
+        return self.client.get('/api/categories/').status_code
+
+    def test_cached_token_expires_with_its_exp(self):
+        token = AccessToken.for_user(self.user)
+        token.set_exp(lifetime=timedelta(seconds=2))
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(self.get(), 200)
+        self.assertIsNotNone(authentication.token_cache.get(str(token)))
+
+        time.sleep(max(0, token['exp'] - time.time()) + 0.1)
+        self.assertIsNone(authentication.token_cache.get(str(token)))
+        self.assertEqual(self.get(), 401)
+
+    def test_saving_user_evicts_cached_user(self):
+        self.assertEqual(self.get(), 200)
+        self.assertIsNotNone(authentication.user_cache.get(str(self.user.pk)))
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(authentication.user_cache.get(str(self.user.pk)))
+        self.assertEqual(self.get(), 401)
+
+    def test_logout_evicts_cached_user(self):
+        self.assertEqual(self.get(), 200)
+        self.client.force_login(self.user)
+        self.client.post('/logout/')
+        self.assertIsNone(authentication.user_cache.get(str(self.user.pk)))
+
+        self.assertEqual(self.get(), 200)
+        refresh = BloomRefreshToken.for_user(self.user)
+        request = APIRequestFactory().post('/', {'refresh_token': str(refresh)}, format='json')
+        force_authenticate(request, user=self.user)
+        self.assertEqual(LogoutApiView.as_view()(request).status_code, 200)
+        self.assertIsNone(authentication.user_cache.get(str(self.user.pk)))
+        self.assertTrue(BlacklistedToken.objects.filter(token__jti=refresh['jti']).exists())
+
+
+class TokenBlacklistTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('rotator', 'rotator@example.com', 'password123')
+
+    def setUp(self):
+        blacklist_filter.clear()
+
+    def test_rotated_refresh_token_is_rejected(self):
+        refresh = str(BloomRefreshToken.for_user(self.user))
+        response = self.client.post('/api/auth/refresh/', {'refresh': refresh})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('refresh', response.data)
+
+        response = self.client.post('/api/auth/refresh/', {'refresh': refresh})
+        self.assertEqual(response.status_code, 401)
+
+    def test_clean_token_is_checked_without_queries(self):
+        with tempfile.TemporaryDirectory() as location, self.settings(CACHES={
+            **settings.CACHES,
+            'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location},
+        }):
+            BloomRefreshToken.for_user(self.user).blacklist()
+            refresh = str(BloomRefreshToken.for_user(self.user))
+            blacklist_filter.might_contain('warm-up')
+
+            with self.assertNumQueries(0):
+                BloomRefreshToken(refresh)
+
+    def test_process_local_cache_checks_database(self):
+        blacklist_filter.might_contain('warm-up')
+        refresh = BloomRefreshToken.for_user(self.user)
+        # Токен отозван другим процессом: этот процесс о нём не знает
+        BlacklistedToken.objects.create(token=OutstandingToken.objects.get(jti=refresh['jti']))
+
+        response = self.client.post('/api/auth/refresh/', {'refresh': str(refresh)})
+        self.assertEqual(response.status_code, 401)
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(1000, 0.01)
+        keys = [f'jti-{i}' for i in range(1000)]
+        for key in keys:
+            bloom.add(key)
+        self.assertTrue(all(key in bloom for key in keys))
+        false_positives = sum(f'other-{i}' in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_prune_removes_only_expired_tokens(self):
+        expired = BloomRefreshToken.for_user(self.user)
+        expired.blacklist()
+        live = BloomRefreshToken.for_user(self.user)
+        live.blacklist()
+        OutstandingToken.objects.filter(jti=expired['jti']).update(expires_at=timezone.now() - timedelta(days=1))
+
+        call_command('prune_token_blacklist', batch_size=1, stdout=StringIO())
+
+        self.assertEqual(list(OutstandingToken.objects.values_list('jti', flat=True)), [live['jti']])
+        self.assertEqual(BlacklistedToken.objects.get().token.jti, live['jti'])
+
+
+class AsyncReadViewTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('async', 'async@example.com', 'password123')
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.auth_headers = {'Authorization': f'Bearer {token}'}
+        self.category = Category.objects.create(name='Выставки')
+        self.event = Event.objects.create(
+            title='Вернисаж', latitude=53.2, longitude=50.1, datetime=timezone.now(),
+            category=self.category, creator=self.user,
+        )
+
+    async def test_read_endpoints_under_asgi(self):
+        for url in ('/api/events/', f'/api/events/{self.event.pk}/', '/api/events/markers/',
+                    '/api/categories/', f'/api/categories/{self.category.pk}/'):
+            response = await AsyncClient().get(url, headers=self.auth_headers)
+            self.assertEqual(response.status_code, 200, url)
+
+        response = await AsyncClient().get('/api/events/', headers=self.auth_headers)
+        self.assertEqual(response.json()['results'][0]['title'], 'Вернисаж')
+        response = await AsyncClient().get(
+            '/api/events/', headers={**self.auth_headers, 'If-None-Match': response['ETag']}
+        )
+        self.assertEqual(response.status_code, 304)
+        response = await AsyncClient().get('/api/events/?from=вчера', headers=self.auth_headers)
+        self.assertEqual(response.status_code, 400)
+
+    async def test_token_is_required(self):
+        response = await AsyncClient().get('/api/events/')
+        self.assertEqual(response.status_code, 401)
+
+    def test_writes_are_handled_by_drf(self):
+        response = self.client.post('/api/events/', {
+            'title': 'Лекция', 'latitude': '53.1', 'longitude': '50.1',
+            'datetime': timezone.now().isoformat(), 'category': self.category.pk,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        response = self.client.delete(f'/api/events/{self.event.pk}/')
+        self.assertEqual(response.status_code, 204)
+
+
+class CategoryCacheTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('curator', 'curator@example.com', 'password123')
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.category = Category.objects.create(name='Выставка')
+        with self.captureOnCommitCallbacks(execute=True):
+            category_cache.invalidate()
+        category_cache.all()
+
+    def test_write_is_visible_after_commit_in_every_process(self):
+        other_process = CategoryCache()
+        self.assertEqual(other_process.get(self.category.pk).name, 'Выставка')
+        with self.captureOnCommitCallbacks(execute=True):
+            theatre = Category.objects.create(name='Театр')
+            self.assertIsNone(category_cache.get(theatre.pk))
+        self.assertEqual(category_cache.get(theatre.pk).name, 'Театр')
+        self.assertTrue(other_process.name_exists('театр'))
+
+    def test_rolled_back_write_is_not_cached(self):
+        try:
+            with transaction.atomic():
+                Category.objects.create(name='Откат')
+                category_cache.all()
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertFalse(category_cache.name_exists('Откат'))
+
+    def test_event_category_must_be_integral(self):
+        event = {'title': 'Вернисаж', 'latitude': '53.2', 'longitude': '50.1', 'datetime': timezone.now().isoformat()}
+        for category in (self.category.pk + 0.9, f'{self.category.pk}.9', True):
+            response = self.client.post('/api/events/', {**event, 'category': category}, format='json')
+            self.assertEqual(response.status_code, 400, category)
+        response = self.client.post('/api/events/', {**event, 'category': str(self.category.pk)}, format='json')
+        self.assertEqual(response.json()['category'], self.category.pk)
+
+
+def use_shared_cache(test):
+    """Кэш 'default', общий для процессов: с LocMemCache реплики не используются."""
+    location = test.enterContext(tempfile.TemporaryDirectory())
+    test.enterContext(test.settings(CACHES={
+        **settings.CACHES,
+        'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location},
+    }))
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        use_shared_cache(self)
+
+    def request(self, method, user_id=7):
+        return mock.Mock(method=method, jwt_auth=(mock.Mock(pk=user_id), None))
+
+    def read_alias(self, request):
+        with routers.replica_reads(request):
+            return routers.ReplicaRouter().db_for_read(Event)
+
+    def test_reads_go_to_replica_writes_to_primary(self):
+        self.assertEqual(self.read_alias(self.request('GET')), 'replica')
+        self.assertEqual(self.read_alias(self.request('POST')), 'default')
+        self.assertEqual(routers.ReplicaRouter().db_for_read(Event), 'default')
+        self.assertEqual(routers.ReplicaRouter().db_for_write(Event), 'default')
+        self.assertFalse(routers.ReplicaRouter().allow_migrate('replica', 'main'))
+
+    def test_user_is_pinned_to_primary_after_write(self):
+        routers.pin_to_primary(8)
+        self.assertEqual(self.read_alias(self.request('GET', user_id=8)), 'default')
+        self.assertEqual(self.read_alias(self.request('GET', user_id=9)), 'replica')
+
+    def test_process_local_cache_keeps_reads_on_primary(self):
+        # Закрепление после записи увидел бы только свой процесс
+        with self.settings(CACHES={**settings.CACHES, 'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }}):
+            self.assertEqual(self.read_alias(self.request('GET')), 'default')
+
+
+@skipUnless('replica' in settings.DATABASES, "нужна реплика 'replica' в DATABASES (tsp.test_settings)")
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaReadTests(APITransactionTestCase):
+    # Зеркало - отдельное соединение, оно видит только зафиксированные данные
+    databases = {'default', 'replica'} & set(settings.DATABASES)
+
+    def setUp(self):
+        use_shared_cache(self)
+        self.user = User.objects.create_user('replica', 'replica@example.com', 'password123')
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.category = Category.objects.create(name='Реплика')
+
+    def replica_queries(self, method, url, data=None):
+        with CaptureQueriesContext(connections['replica']) as queries:
+            response = getattr(self.client, method)(url, data, format='json')
+        return response, len(queries)
+
+    def test_reads_use_replica_until_own_write(self):
+        response, queries = self.replica_queries('get', '/api/events/')
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(queries, 0)
+
+        response, queries = self.replica_queries('post', '/api/events/', {
+            'title': 'Запись', 'latitude': '53.1', 'longitude': '50.1',
+            'datetime': timezone.now().isoformat(), 'category': self.category.pk,
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(queries, 0)
+
+        response, queries = self.replica_queries('get', '/api/events/')
+        self.assertEqual(response.json()['results'][0]['title'], 'Запись')
+        self.assertEqual(queries, 0)
+
+    def test_category_cache_reloads_from_primary(self):
+        category_cache.invalidate()
+        response, queries = self.replica_queries('get', '/api/categories/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, 0)
+        self.assertIn('Реплика', [category['name'] for category in response.json()])
+
+    def test_cluster_sample_refills_from_cluster_database(self):
+        events = [Event.objects.create(title=f'Кластер {i}', latitude=53.2, longitude=50.1 + i / 1000,
+                                       datetime=timezone.now(), creator=self.user) for i in range(6)]
+        token = routers._replica.set('replica')
+        try:
+            with CaptureQueriesContext(connections['replica']) as queries:
+                EventCluster.objects.remove_event(events[0].pk, events[0].latitude, events[0].longitude)
+        finally:
+            routers._replica.reset(token)
+        self.assertEqual([query['sql'] for query in queries.captured_queries], [])
+        self.assertIn(events[5].pk, EventCluster.objects.get(zoom=geo.CLUSTER_ZOOM_LEVELS[0]).sample_ids)
+
+    def test_tile_miss_reads_primary(self):
+        event = Event.objects.create(title='Тайл', latitude=53.2, longitude=50.1,
+                                     datetime=timezone.now(), creator=self.user)
+        Reaction.objects.create(user=self.user, event=event, type='going')
+        tiles.tile_cache().clear()
+        x, y = geo.tile_xy(53.2, 50.1, 14)
+        response, queries = self.replica_queries('get', f'/api/tiles/14/{x}/{y}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, 0)
+        self.assertEqual(response.json()['results'][0]['going_users'], ['replica'])
+
+
+class EventTileTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('tiler', 'tiler@example.com', 'password123')
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        # Пользователь попадает в кэш аутентификации, тайл из кэша - без запросов
+        self.client.get('/api/categories/')
+        tiles.tile_cache().clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.event = Event.objects.create(
+                title='Набережная', latitude=53.2, longitude=50.1, datetime=timezone.now(), creator=self.user,
+            )
+        self.x, self.y = geo.tile_xy(53.2, 50.1, 14)
+        self.url = f'/api/tiles/14/{self.x}/{self.y}/'
+
+    def get_tile(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_cached_tile_is_served_without_queries(self):
+        self.assertEqual([event['title'] for event in self.get_tile()], ['Набережная'])
+        self.assertNotIn('user_reaction', self.get_tile()[0])
+        with self.assertNumQueries(0):
+            self.get_tile()
+
+    def test_writes_invalidate_affected_tiles(self):
+        self.get_tile()
+        far_key = tiles.current_key(14, *geo.tile_xy(55.75, 37.62, 14))
+        tiles.tile_cache().set(far_key, {'results': []})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/reactions/', {'event': self.event.pk, 'type': 'going'}, format='json')
+        self.assertEqual(self.get_tile()[0]['going_users'], ['tiler'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Event.objects.create(title='Рядом', latitude=53.2001, longitude=50.1001,
+                                 datetime=timezone.now(), creator=self.user)
+        self.assertEqual(len(self.get_tile()), 2)
+        for zoom in (settings.TILE_MIN_ZOOM, settings.TILE_MAX_ZOOM):
+            self.assertIsNone(tiles.tile_cache().get(tiles.current_key(zoom, *geo.tile_xy(53.2, 50.1, zoom))))
+        self.assertIsNotNone(tiles.tile_cache().get(far_key))
+
+    def test_tile_read_before_write_is_not_served(self):
+        key = tiles.current_key(14, self.x, self.y)
+        with self.captureOnCommitCallbacks(execute=True):
+            Event.objects.create(title='Рядом', latitude=53.2001, longitude=50.1001,
+                                 datetime=timezone.now(), creator=self.user)
+        # Промах, прочитавший строки до записи, кладёт тайл в кэш уже после сброса
+        tiles.tile_cache().set(key, {'results': []})
+        self.assertEqual(len(self.get_tile()), 2)
+
+    def test_reaction_write_reuses_locked_coordinates(self):
+        self.get_tile()
+        # Координаты для сброса тайлов берутся из заблокированного мероприятия, без SELECT
+        with mock.patch.object(tiles, 'invalidate_events') as invalidate_events, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/reactions/', {'event': self.event.pk, 'type': 'going'}, format='json')
+        invalidate_events.assert_not_called()
+        self.assertEqual(self.get_tile()[0]['going_users'], ['tiler'])
+
+    def test_file_based_cache(self):
+        with tempfile.TemporaryDirectory() as location, override_settings(CACHES={
+            **settings.CACHES,
+            'tiles': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location},
+        }):
+            self.get_tile()
+            with self.assertNumQueries(0):
+                self.assertEqual(self.get_tile()[0]['title'], 'Набережная')
+
+    @override_settings(TILE_MAX_EVENTS=1)
+    def test_dense_tile_is_truncated(self):
+        Event.objects.create(title='Рядом', latitude=53.2001, longitude=50.1001,
+                             datetime=timezone.now(), creator=self.user)
+        data = self.client.get(self.url).json()
+        self.assertTrue(data['truncated'])
+        self.assertEqual([event['title'] for event in data['results']], ['Набережная'])
+
+    def test_zoom_and_tile_bounds(self):
+        self.assertEqual(self.client.get(f'/api/tiles/{settings.TILE_MIN_ZOOM - 1}/0/0/').status_code, 400)
+        self.assertEqual(self.client.get('/api/tiles/14/16384/0/').status_code, 404)
+        bbox = geo.tile_bbox(self.x, self.y, 14)
+        self.assertTrue(bbox.min_lat <= 53.2 <= bbox.max_lat and bbox.min_lon <= 50.1 <= bbox.max_lon)
+
+
+@override_settings(EVENT_GOING_USERS_PREVIEW=3)
+class EventAttendeesTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('organizer', 'organizer@example.com', 'password123')
+        cls.event = Event.objects.create(title='Фестиваль', latitude=53.2, longitude=50.1,
+                                         datetime=timezone.now(), creator=cls.user)
+        cls.attendees = User.objects.bulk_create(
+            User(username=f'guest{i:02d}', email=f'guest{i}@example.com') for i in range(7)
+        )
+        Reaction.objects.bulk_create(Reaction(user=user, event=cls.event, type='going') for user in cls.attendees)
+        Reaction.objects.create(user=cls.user, event=cls.event, type='not_going')
+        Event.objects.filter(pk=cls.event.pk).recount_going()
+
+    def setUp(self):
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_list_embeds_bounded_preview(self):
+        event = self.client.get('/api/events/').json()['results'][0]
+        self.assertEqual(event['going_count'], 7)
+        self.assertEqual(event['going_users'], ['guest00', 'guest01', 'guest02'])
+
+    def test_attendees_are_paginated_by_cursor(self):
+        usernames = []
+        url = f'/api/events/{self.event.pk}/attendees/?page_size=3'
+        while url:
+            page = self.client.get(url).json()
+            usernames.extend(user['username'] for user in page['results'])
+            url = page['next']
+        self.assertEqual(usernames, [user.username for user in self.attendees])
+
+    def test_unknown_event(self):
+        self.assertEqual(self.client.get('/api/events/999999/attendees/').status_code, 404)
@@ -0,0 +1,82 @@
+"""Кэш мероприятий по тайлам карты z/x/y.
+
+Тайл - это список мероприятий в его границах без полей, зависящих от
+пользователя, поэтому один закэшированный тайл отдаётся всем. Тайлы
+лежат в кэше TILE_CACHE_ALIAS под ключом с поколением тайла; запись
+мероприятия или реакции после фиксации транзакции меняет поколение
+тайлов с его координатами на всех масштабах от TILE_MIN_ZOOM до
+TILE_MAX_ZOOM. Тайл, прочитанный из базы до записи и положенный в кэш
+уже после неё, остаётся под прежним поколением и больше не отдаётся.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from . import geo
+
+# Поля EventSerializer в тайле: user_reaction у каждого пользователя своё
+TILE_FIELDS = {'event_id', 'title', 'description', 'latitude', 'longitude', 'datetime',
+               'category', 'creator', 'going_users', 'going_count'}
+
+
+def tile_cache():
+    return caches[settings.TILE_CACHE_ALIAS]
+
+
+def generation_key(zoom, x, y):
+    return f'tile:generation:{zoom}:{x}:{y}'
+
+
+def tile_key(zoom, x, y, generation):
+    return f'tile:{zoom}:{x}:{y}:{generation}'
+
+
+def current_key(zoom, x, y):
+    cache, key = tile_cache(), generation_key(zoom, x, y)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        generation = cache.get(key)
+    return tile_key(zoom, x, y, generation)
+
+
+async def acurrent_key(zoom, x, y):
+    cache, key = tile_cache(), generation_key(zoom, x, y)
+    generation = await cache.aget(key)
+    if generation is None:
+        await cache.aadd(key, uuid.uuid4().hex, None)
+        generation = await cache.aget(key)
+    return tile_key(zoom, x, y, generation)
+
+
+def tile_events(zoom, x, y):
+    from .models import Event
+
+    # Тайл закэшируют для всех, поэтому он читается из основной базы, а
+    # не с реплики, которая может ещё не получить запись, сбросившую тайл
+    return (
+        Event.objects.using('default')
+        .in_bbox(geo.tile_bbox(x, y, zoom))
+        .with_going_users()
+        .order_by('event_id')
+    )
+
+
+def invalidate_points(points, using='default'):
+    keys = {
+        generation_key(zoom, *geo.tile_xy(latitude, longitude, zoom))
+        for latitude, longitude in points
+        if latitude is not None and longitude is not None
+        for zoom in range(settings.TILE_MIN_ZOOM, settings.TILE_MAX_ZOOM + 1)
+    }
+    if keys:
+        transaction.on_commit(lambda: tile_cache().set_many(dict.fromkeys(keys, uuid.uuid4().hex), None), using=using)
+
+
+def invalidate_events(event_ids):
+    from .models import Event
+
+    if event_ids:
+        invalidate_points(Event.objects.filter(event_id__in=event_ids).values_list('latitude', 'longitude'))
@@ -1,23 +1,49 @@
+import asyncio
+import codecs
+import hashlib
+
+from asgiref.sync import sync_to_async
 from django.contrib.auth import authenticate, logout, login as auth_login
+from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import JsonResponse
+from django.db import transaction
+from django.db.models import F, FloatField, OuterRef, Subquery, Value
+from django.db.models.functions import Cast
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.middleware.csrf import get_token
 from django.urls import reverse
-from rest_framework import viewsets, generics, status
-from rest_framework.decorators import api_view
-from rest_framework.exceptions import PermissionDenied
-from rest_framework_simplejwt.authentication import JWTAuthentication
-from rest_framework_simplejwt.views import TokenObtainPairView
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from django.utils.dateparse import parse_datetime
+from rest_framework import viewsets, status
+from rest_framework.decorators import action, api_view
+from rest_framework.exceptions import APIException, NotAcceptable, NotAuthenticated, NotFound, PermissionDenied, ValidationError
+from rest_framework_simplejwt.serializers import TokenObtainSerializer
+from rest_framework_simplejwt.views import TokenRefreshView
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated, IsAuthenticatedOrReadOnly
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework_simplejwt.exceptions import TokenError, InvalidToken
-from .models import User, Category, Reaction, Event
-from .serializers import UserSerializer, CategorySerializer, EventSerializer, ReactionSerializer, \
-    CustomTokenObtainPairSerializer, UserRegistrationSerializer, IsAdminOrStaff, CanChangePassword, IsEventCreator
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, TokenError, InvalidToken
+from . import geo, hashing, realtime, tiles
+from .hashing import HashingBusy
+from .importing import EventImporter, read_rows
+from .authentication import CachedJWTAuthentication, invalidate_user
+from .blacklist import BloomRefreshToken
+from .caches import category_cache
+from .models import User, Category, Reaction, Event, EventCluster, EventTombstone
+from .pagination import AttendeePagination, EventPagination, MarkerPagination, PrimaryKeyPagination
+from .routers import ReplicaRoutingMixin, replica_reads
+from .serializers import UserSerializer, CategorySerializer, EventSerializer, ReactionSerializer, ReactionWriteSerializer, \
+    LoginSerializer, BloomTokenRefreshSerializer, UserRegistrationSerializer, SimpleUserSerializer, \
+    IsAdminOrStaff, CanChangePassword, IsEventCreator
 from django.shortcuts import render, redirect
 from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 import json
 
 
@@ -40,7 +66,7 @@ class EventsTemplateView(LoginRequiredMixin, View):
             return redirect(self.login_url)
 
         return render(request, 'events/events.html', {
-            'categories': Category.objects.all(),
+            'categories': category_cache.all(),
             'csrf_token': get_token(request)
         })
 
@@ -55,7 +81,10 @@ class LoginTemplateView(View):
         username = request.POST.get('username')
         password = request.POST.get('password')
 
-        user = authenticate(request, username=username, password=password)
+        try:
+            user = authenticate(request, username=username, password=password)
+        except HashingBusy:
+            return render(request, 'auth/login.html', {'error': HashingBusy.default_detail}, status=503)
 
         if user is not None:
             auth_login(request, user)  # Оставляем сессию для веб-интерфейса
@@ -70,37 +99,6 @@ class LoginTemplateView(View):
             return render(request, 'auth/login.html', {'error': 'Invalid credentials'})
 
 
-class UserRegistrationView(generics.CreateAPIView):
-    queryset = User.objects.all()
-    serializer_class = UserRegistrationSerializer
-    permission_classes = [AllowAny]
-
-    def create(self, request, *args, **kwargs):
-        serializer = self.get_serializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
-        self.perform_create(serializer)
-        headers = self.get_success_headers(serializer.data)
-
-        # Автоматически входим пользователя после регистрации
-        user = authenticate(
-            username=serializer.data['username'],
-            password=request.data['password']
-        )
-
-        if user:
-            refresh = RefreshToken.for_user(user)
-            return Response({
-                "message": "Пользователь успешно зарегистрирован!",
-                "access_token": str(refresh.access_token),
-                "refresh_token": str(refresh)
-            }, status=status.HTTP_201_CREATED, headers=headers)
-
-        return Response(
-            {"message": "Пользователь успешно зарегистрирован! Пожалуйста, войдите."},
-            status=status.HTTP_201_CREATED,
-            headers=headers
-        )
-
 class RegisterTemplateView(View):
     def get(self, request):
         if request.user.is_authenticated:
@@ -110,30 +108,15 @@ class RegisterTemplateView(View):
     def post(self, request):
         return redirect('api-register')
 
-class CustomTokenObtainPairView(TokenObtainPairView):
-    serializer_class = CustomTokenObtainPairSerializer
+class CustomTokenRefreshView(TokenRefreshView):
+    serializer_class = BloomTokenRefreshSerializer
     permission_classes = [AllowAny]
 
-class UserRegistrationView(generics.CreateAPIView):
-    queryset = User.objects.all()
-    serializer_class = UserRegistrationSerializer
-    permission_classes = [AllowAny]
-
-    def create(self, request, *args, **kwargs):
-        serializer = self.get_serializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
-        self.perform_create(serializer)
-        headers = self.get_success_headers(serializer.data)
-        return Response(
-            {"message": "Пользователь успешно зарегистрировался!"},
-            status=status.HTTP_201_CREATED,
-            headers=headers
-        )
-
 class UserApiView(viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = PrimaryKeyPagination
 
     def get_object(self):
         obj = super().get_object()
@@ -149,19 +132,368 @@ class UserApiView(viewsets.ModelViewSet):
             return [CanChangePassword()]
         return [IsAdminOrStaff()]
 
-class CategoryApiView(viewsets.ModelViewSet):
+class CategoryApiView(ReplicaRoutingMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [IsAuthenticated]
 
+    def list(self, request, *args, **kwargs):
+        return Response(self.get_serializer(category_cache.all(), many=True).data)
 
-class EventApiView(viewsets.ModelViewSet):
-    queryset = Event.objects.all().prefetch_related('reactions')
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            category = category_cache.get(int(kwargs['pk']))
+        except ValueError:
+            category = None
+        if category is None:
+            return Response({'detail': 'Категория не найдена'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(self.get_serializer(category).data)
+
+
+class EventApiView(ReplicaRoutingMixin, viewsets.ModelViewSet):
+    queryset = Event.objects.all()
     serializer_class = EventSerializer
     permission_classes = [IsAuthenticated, IsEventCreator]
+    pagination_class = EventPagination
+
+    def get_queryset(self):
+        user = self.request.user
+        fields = self.get_requested_fields()
+        queryset = Event.objects.all()
+
+        if fields is None or 'user_reaction' in fields:
+            user_reaction = Value(None)
+            if user.is_authenticated:
+                user_reaction = Subquery(
+                    Reaction.objects.filter(event=OuterRef('pk'), user=user).values('type')[:1]
+                )
+            queryset = queryset.annotate(user_reaction=user_reaction)
+        if fields is None or 'going_users' in fields:
+            queryset = queryset.with_going_users()
+        if self.action == 'list':
+            queryset = self.filter_list(queryset)
+        return queryset
+
+    def filter_list(self, queryset):
+        return self.filter_by_time(self.filter_by_bbox(queryset))
+
+    def get_requested_fields(self):
+        """Поля из ?fields=id,title,... для list и retrieve; None - все поля."""
+        if self.action not in ('list', 'retrieve') or not self.request.query_params.get('fields'):
+            return None
+        fields = {name.strip() for name in self.request.query_params['fields'].split(',') if name.strip()}
+        unknown = fields - set(EventSerializer.Meta.fields)
+        if unknown:
+            raise ValidationError({'fields': f"Неизвестные поля: {', '.join(sorted(unknown))}"})
+        return fields
+
+    def filter_by_category(self, queryset):
+        category = self.request.query_params.get('category')
+        if not category:
+            return queryset
+        if not category.isdigit():
+            raise ValidationError({'category': 'Ожидается идентификатор категории'})
+        return queryset.filter(category_id=int(category))
+
+    def filter_by_time(self, queryset):
+        """?from= и ?to= (ISO 8601) ограничивают datetime, ?upcoming=1 - только будущие."""
+        params = self.request.query_params
+        for param, lookup in (('from', 'datetime__gte'), ('to', 'datetime__lt')):
+            if not params.get(param):
+                continue
+            moment = parse_datetime(params[param])
+            if moment is None:
+                raise ValidationError({param: 'Ожидается дата и время в формате ISO 8601'})
+            if timezone.is_naive(moment):
+                moment = timezone.make_aware(moment)
+            queryset = queryset.filter(**{lookup: moment})
+        if params.get('upcoming') in ('1', 'true'):
+            queryset = queryset.filter(datetime__gte=timezone.now())
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        etag = self.get_list_validators(self.pagination_class())
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+        return self.set_validators(super().list(request, *args, **kwargs), etag, None)
+
+    def retrieve(self, request, *args, **kwargs):
+        etag, last_modified = self.get_detail_validators()
+        if etag is not None:
+            not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if not_modified is not None:
+                return not_modified
+        return self.set_validators(super().retrieve(request, *args, **kwargs), etag, last_modified)
+
+    # Валидаторы считаются лёгкими запросами до сериализации.
+    # user_reaction зависит от пользователя, поэтому он входит в ETag.
+    #
+    # ETag списка - хеш (event_id, version) строк запрошенной страницы
+    # (page_size + 1 строка, той же выборкой по ключу, что и сама страница)
+    # и последнего надгробия: изменение, появление или уход мероприятия
+    # из фильтра меняет строки страницы, удаление - надгробие. Last-Modified
+    # у списков не отдаётся: по времени нельзя заметить ушедшие из фильтра строки.
+
+    def get_list_validators(self, paginator):
+        rows = list(paginator.page_queryset(self.validator_rows(), self.request))
+        last_tombstone = EventTombstone.objects.order_by('-id').values_list('id', flat=True).first()
+        return self.list_validators(rows, last_tombstone)
+
+    async def aget_list_validators(self, paginator):
+        rows = [row async for row in paginator.page_queryset(self.validator_rows(), self.request)]
+        last_tombstone = await EventTombstone.objects.order_by('-id').values_list('id', flat=True).afirst()
+        return self.list_validators(rows, last_tombstone)
+
+    def validator_rows(self):
+        return self.filter_list(Event.objects.all()).values_list('event_id', 'version')
+
+    def list_validators(self, rows, last_tombstone):
+        key = '|'.join(str(part) for part in (
+            self.request.user.pk, self.request.get_full_path(), last_tombstone, rows,
+        ))
+        return quote_etag(hashlib.md5(key.encode()).hexdigest())
+
+    def get_detail_validators(self):
+        pk = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        try:
+            row = Event.objects.filter(pk=pk).values_list('version', 'updated_at').first()
+        except (TypeError, ValueError):
+            row = None
+        return self.detail_validators(pk, row)
+
+    async def aget_detail_validators(self):
+        pk = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        try:
+            row = await Event.objects.filter(pk=pk).values_list('version', 'updated_at').afirst()
+        except (TypeError, ValueError):
+            row = None
+        return self.detail_validators(pk, row)
+
+    def detail_validators(self, pk, row):
+        if row is None:
+            return None, None
+        version, updated_at = row
+        etag = quote_etag(f"{pk}-{version}-{self.request.user.pk}-{self.request.query_params.get('fields', '')}")
+        return etag, int(updated_at.timestamp())
+
+    @staticmethod
+    def set_validators(response, etag, last_modified):
+        if response.status_code == status.HTTP_200_OK and etag is not None:
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+            # Браузер хранит ответ, но каждый раз перепроверяет его по ETag
+            response['Cache-Control'] = 'private, no-cache'
+            patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def get_bbox(self):
+        bbox = self.request.query_params.get('bbox')
+        if not bbox:
+            return None
+        try:
+            return geo.parse_bbox(bbox)
+        except ValueError as e:
+            raise ValidationError({'bbox': str(e)})
+
+    def filter_by_bbox(self, queryset):
+        bbox = self.get_bbox()
+        return queryset.in_bbox(bbox) if bbox else queryset
+
+    @action(detail=False, methods=['get'])
+    def clusters(self, request):
+        try:
+            zoom = int(request.query_params.get('zoom', ''))
+        except ValueError:
+            raise ValidationError({'zoom': 'Укажите масштаб карты целым числом'})
+        if not 0 <= zoom <= geo.MAX_ZOOM:
+            raise ValidationError({'zoom': f'Масштаб должен быть от 0 до {geo.MAX_ZOOM}'})
+
+        bbox = self.get_bbox()
+        if zoom in geo.CLUSTER_ZOOM_LEVELS:
+            clusters = EventCluster.objects.in_bbox(zoom, bbox) if bbox else EventCluster.objects.filter(zoom=zoom)
+            return Response([cluster.as_dict() for cluster in clusters])
+
+        return Response(self.filter_by_bbox(Event.objects.all()).clusters(zoom))
+
+    @action(detail=False, methods=['get'])
+    def markers(self, request):
+        """Метки карты столбцами: {ids, lats, lons, category_ids, titles, next}.
+
+        Фильтры те же, что у списка (bbox, from, to, upcoming). Строки
+        берутся через values_list, минуя сериализаторы DRF. Ответ не
+        потоковый: метки отдаются страницами по event_id (page_size до
+        MarkerPagination.max_page_size), next - ссылка на следующую.
+        """
+        etag = self.get_list_validators(MarkerPagination())
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+
+        paginator = MarkerPagination()
+        rows = paginator.paginate_queryset(self.marker_rows(), request)
+        return self.set_validators(Response(self.markers_data(rows, paginator)), etag, None)
+
+    def marker_rows(self):
+        return self.filter_list(Event.objects.all()).order_by('event_id').values_list(
+            'event_id', Cast('latitude', FloatField()), Cast('longitude', FloatField()), 'category_id', 'title'
+        )
+
+    @staticmethod
+    def markers_data(rows, paginator):
+        columns = list(zip(*rows)) or [(), (), (), (), ()]
+        data = dict(zip(('ids', 'lats', 'lons', 'category_ids', 'titles'), map(list, columns)))
+        data['next'] = paginator.get_next_link()
+        return data
+
+    @action(detail=False, methods=['get'])
+    def nearby(self, request):
+        """Ближайшие мероприятия: ?lat=&lon=[&radius=км][&limit=][&upcoming=1].
+
+        Без radius поиск начинается с малого круга и расширяется, пока не
+        наберётся limit мероприятий или не будет достигнут максимальный радиус.
+        """
+        params = request.query_params
+        try:
+            lat, lon = float(params['lat']), float(params['lon'])
+            radius = float(params['radius']) if 'radius' in params else None
+            limit = int(params.get('limit', settings.EVENTS_NEARBY_LIMIT))
+        except (KeyError, ValueError):
+            raise ValidationError('Нужны числовые параметры lat и lon, radius и limit необязательны')
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise ValidationError('Координаты вне допустимого диапазона')
+        if radius is not None and not 0 < radius <= settings.EVENTS_NEARBY_MAX_RADIUS_KM:
+            raise ValidationError(f'radius должен быть от 0 до {settings.EVENTS_NEARBY_MAX_RADIUS_KM} км')
+        limit = max(1, min(limit, settings.EVENTS_NEARBY_MAX_LIMIT))
+
+        queryset = self.filter_by_time(self.get_queryset())
+
+        expand = radius is None
+        radius = radius or settings.EVENTS_NEARBY_START_RADIUS_KM
+        while True:
+            events = list(queryset.nearby(lat, lon, radius)[:limit])
+            if not expand or len(events) >= limit or radius >= settings.EVENTS_NEARBY_MAX_RADIUS_KM:
+                break
+            radius = min(radius * 4, settings.EVENTS_NEARBY_MAX_RADIUS_KM)
+
+        results = self.get_serializer(events, many=True).data
+        for item, event in zip(results, events):
+            item['distance'] = round(event.distance, 3)
+        return Response({'radius': radius, 'results': results})
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """Поиск по названию и описанию: ?q=[&limit=][&category=][&from=][&to=][&upcoming=1]."""
+        query = request.query_params.get('q', '')
+        try:
+            limit = int(request.query_params.get('limit', settings.EVENT_SEARCH_LIMIT))
+        except ValueError:
+            raise ValidationError({'limit': 'Ожидается число'})
+        limit = max(1, min(limit, settings.EVENT_SEARCH_MAX_LIMIT))
+
+        queryset = self.filter_by_time(self.filter_by_category(self.get_queryset()))
+        events = queryset.search(query)[:limit]
+        return Response({'results': self.get_serializer(events, many=True).data})
+
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        now = timezone.now()
+        since = request.query_params.get('since')
+        if not since:
+            # Курсор для клиента, который сейчас загрузит полный список
+            return self.changes_reset(now)
+
+        since = parse_datetime(since)
+        if since is None or timezone.is_naive(since):
+            raise ValidationError({'since': 'Некорректный курсор'})
+        if since < now - settings.EVENT_CHANGES_RETENTION:
+            return self.changes_reset(now)
+
+        start = since - settings.EVENT_CHANGES_OVERLAP
+        bbox = self.get_bbox()
+        updated = list(
+            self.filter_by_bbox(self.get_queryset())
+            .filter(updated_at__gte=start)
+            .order_by('updated_at', 'event_id')[:settings.EVENT_CHANGES_LIMIT + 1]
+        )
+        tombstones = EventTombstone.objects.filter(deleted_at__gte=start)
+        deleted = list(
+            tombstones.filter(moved=False).values_list('event_id', flat=True)[:settings.EVENT_CHANGES_LIMIT + 1]
+        )
+        moved = []
+        if bbox:
+            # Перенесённые из bbox наружу: старые координаты внутри, а в updated их нет
+            moved = list(
+                tombstones.filter(
+                    moved=True,
+                    latitude__range=(bbox.min_lat, bbox.max_lat),
+                    longitude__range=(bbox.min_lon, bbox.max_lon),
+                )
+                .exclude(event_id__in=[event.event_id for event in updated])
+                .values_list('event_id', flat=True).distinct()[:settings.EVENT_CHANGES_LIMIT + 1]
+            )
+        if max(len(updated), len(deleted), len(moved)) > settings.EVENT_CHANGES_LIMIT:
+            return self.changes_reset(now)
+
+        return Response({
+            'cursor': now.isoformat(),
+            'reset': False,
+            'updated': self.get_serializer(updated, many=True).data,
+            'deleted': deleted,
+            'moved': moved,
+        })
+
+    @staticmethod
+    def changes_reset(now):
+        return Response({'cursor': now.isoformat(), 'reset': True, 'updated': [], 'deleted': [], 'moved': []})
+
+    @action(detail=True, methods=['get'], pagination_class=AttendeePagination)
+    def attendees(self, request, pk=None):
+        """Все участники мероприятия (реакция 'going') по возрастанию id, постранично по курсору."""
+        if not pk.isdigit() or not Event.objects.filter(pk=pk).exists():
+            raise NotFound('Мероприятие не найдено')
+        reactions = (
+            Reaction.objects.filter(event_id=pk, type='going')
+            .select_related('user')
+            .only('user__username', 'user__avatar')
+        )
+        page = self.paginate_queryset(reactions)
+        return self.get_paginated_response(SimpleUserSerializer([reaction.user for reaction in page], many=True).data)
+
+    @action(detail=False, methods=['post'], url_path='import', permission_classes=[IsAuthenticated, IsAdminOrStaff])
+    def import_events(self, request):
+        """Потоковая загрузка мероприятий: тело запроса в CSV (text/csv) или NDJSON (application/x-ndjson)."""
+        content_type = request.content_type.split(';')[0].strip()
+        import_format = {
+            'text/csv': 'csv', 'application/x-ndjson': 'ndjson', 'application/jsonl': 'ndjson',
+        }.get(content_type)
+        if import_format is None:
+            raise ValidationError('Ожидается тело text/csv или application/x-ndjson')
+
+        errors = []
+
+        def on_error(number, row_errors):
+            if len(errors) < settings.EVENT_IMPORT_ERRORS_LIMIT:
+                errors.append({'line': number, 'errors': row_errors})
+
+        # Тело читается построчно, не загружаясь в память целиком
+        lines = codecs.iterdecode(request._request, 'utf-8')
+        importer = EventImporter(request.user, settings.EVENT_IMPORT_BATCH_SIZE, on_error).run(read_rows(lines, import_format))
+        return Response({'created': importer.created, 'failed': importer.failed, 'errors': errors})
 
     def perform_create(self, serializer):
-        serializer.save(creator=self.request.user)
+        event = serializer.save(creator=self.request.user)
+        realtime.publish_change('event.created', event)
+
+    def perform_update(self, serializer):
+        event = serializer.save(version=F('version') + 1)
+        event.refresh_from_db(fields=['version'])
+        realtime.publish_change('event.updated', event)
+
+    def perform_destroy(self, instance):
+        realtime.publish_change('event.deleted', instance)
+        instance.delete()
 
     def create(self, request, *args, **kwargs):
         try:
@@ -190,23 +522,28 @@ class EventApiView(viewsets.ModelViewSet):
     def get_serializer_context(self):
         context = super().get_serializer_context()
         context['request'] = self.request
+        context['fields'] = self.get_requested_fields()
         return context
 
 
-class ReactionApiView(viewsets.ModelViewSet):
+class ReactionApiView(ReplicaRoutingMixin, viewsets.ModelViewSet):
+    # Реакции читаются из основной базы, но запись закрепляет за ней пользователя
+    read_from_replica = False
     queryset = Reaction.objects.none()
     serializer_class = ReactionSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = PrimaryKeyPagination
 
     def get_queryset(self):
         return Reaction.objects.filter(user=self.request.user)
 
-    def perform_create(self, serializer):
-        Reaction.objects.filter(
-            user=self.request.user,
-            event=serializer.validated_data['event']
-        ).delete()
-        serializer.save(user=self.request.user)
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            previous_type = self.lock_reaction(serializer.instance)
+            reaction = serializer.save()
+            event = reaction.event
+            Reaction.apply_change(reaction.event_id, previous_type, reaction.type, (event.latitude, event.longitude))
+            realtime.publish_change('reaction', event)
 
     def get_object(self):
         reaction = super().get_object()
@@ -216,21 +553,91 @@ class ReactionApiView(viewsets.ModelViewSet):
         return reaction
 
     def create(self, request, *args, **kwargs):
-        try:
-            Reaction.objects.filter(
-                user=request.user,
-                event_id=request.data['event']
-            ).delete()
+        serializer = ReactionWriteSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({'error': str(serializer.errors)}, status=400)
 
-            return super().create(request, *args, **kwargs)
-        except Exception as e:
-            return Response({'error': str(e)}, status=400)
+        reaction_type = serializer.validated_data['type']
+        [(reaction, previous_type)] = self.save_reactions(
+            {serializer.validated_data['event']: reaction_type}
+        )
+        created = previous_type is None
+        return Response(
+            ReactionSerializer(reaction).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        )
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """Записывает список реакций [{event, type}, ...] в одной транзакции."""
+        if not isinstance(request.data, list):
+            raise ValidationError('Ожидается список реакций')
+        if len(request.data) > settings.REACTIONS_BATCH_LIMIT:
+            raise ValidationError(f'Не больше {settings.REACTIONS_BATCH_LIMIT} реакций за запрос')
+        serializer = ReactionWriteSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+
+        # При повторе мероприятия в списке действует последняя реакция
+        reactions = {item['event']: item['type'] for item in serializer.validated_data}
+        saved = self.save_reactions(reactions)
+        return Response([ReactionSerializer(reaction).data for reaction, _ in saved])
+
+    def save_reactions(self, reactions):
+        """Записывает реакции {event_id: type}, возвращает [(reaction, previous_type)]."""
+        with transaction.atomic():
+            # Мероприятия блокируются до конца транзакции (в порядке id), чтобы
+            # их не удалили между проверкой и записью реакций; going_count
+            # этих строк apply_changes всё равно обновит
+            events = (
+                Event.objects.select_for_update(no_key=True).only('event_id', 'latitude', 'longitude')
+                .order_by('event_id').in_bulk(list(reactions))
+            )
+            missing = sorted(set(reactions) - set(events))
+            if missing:
+                raise NotFound(f"Мероприятия не найдены: {', '.join(map(str, missing))}")
+
+            written = Reaction.objects.upsert(self.request.user.pk, reactions)
+            changes = {
+                event_id: (previous_type, reactions[event_id])
+                for event_id, (_, previous_type) in written.items()
+                if previous_type != reactions[event_id]
+            }
+            Reaction.apply_changes(
+                changes, {event_id: (events[event_id].latitude, events[event_id].longitude) for event_id in changes}
+            )
+            for event_id in changes:
+                realtime.publish_change('reaction', events[event_id])
+
+        return [
+            (Reaction(reaction_id=reaction_id, user=self.request.user, event=events[event_id],
+                      type=reactions[event_id]), previous_type)
+            for event_id, (reaction_id, previous_type) in written.items()
+        ]
+
+    @staticmethod
+    def lock_reaction(reaction):
+        """Блокирует строку реакции до конца транзакции и возвращает её текущий тип.
+
+        get_object() читает реакцию вне транзакции: два одновременных PUT
+        или DELETE иначе оба применили бы к going_count одну и ту же дельту.
+        """
+        previous_type = (
+            Reaction.objects.select_for_update().filter(pk=reaction.pk).values_list('type', flat=True).first()
+        )
+        if previous_type is None:
+            raise NotFound()
+        return previous_type
 
     def destroy(self, request, *args, **kwargs):
         reaction = self.get_object()
         if reaction.user != request.user:
             raise PermissionDenied("Вы можете удалять только свои реакции")
-        reaction.delete()
+        with transaction.atomic():
+            previous_type = self.lock_reaction(reaction)
+            reaction.delete()
+            event = reaction.event
+            Reaction.apply_change(reaction.event_id, previous_type, None, (event.latitude, event.longitude))
+            realtime.publish_change('reaction', event)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -240,14 +647,276 @@ class LogoutApiView(APIView):
     def post(self, request):
         try:
             refresh_token = request.data.get("refresh_token")
-            token = RefreshToken(refresh_token)
+            token = BloomRefreshToken(refresh_token)
             token.blacklist()
+            invalidate_user(request.user.pk)
             return Response({"message": "Успешный выход"}, status=200)
         except TokenError as e:
             return Response({"error": str(e)}, status=400)
 class LogoutView(View):
 
     def post(self, request):
+        invalidate_user(request.user.pk)
         logout(request)
         request.session.flush()
         return redirect('/login/')
+
+
+class EventStreamView(View):
+    """Server-Sent Events с изменениями мероприятий в видимой области.
+
+    EventSource не умеет передавать заголовки, поэтому токен приходит
+    параметром ?token=. Работает только под ASGI (tsp.asgi).
+    """
+
+    async def get(self, request):
+        authentication = CachedJWTAuthentication()
+        try:
+            validated_token = authentication.get_validated_token(request.GET.get('token', ''))
+            await authentication.aget_user(validated_token)
+        except (InvalidToken, AuthenticationFailed):
+            return JsonResponse({'error': 'Invalid token'}, status=401)
+
+        bbox = None
+        if request.GET.get('bbox'):
+            try:
+                bbox = geo.parse_bbox(request.GET['bbox'])
+            except ValueError as e:
+                return JsonResponse({'bbox': str(e)}, status=400)
+
+        response = StreamingHttpResponse(self.stream(bbox), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    async def stream(self, bbox):
+        broker = realtime.get_broker()
+        subscription = broker.subscribe(bbox)
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    message = await asyncio.wait_for(
+                        subscription.queue.get(), timeout=settings.REALTIME_KEEPALIVE
+                    )
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+                if subscription.overflowed:
+                    yield 'event: reset\ndata: {}\n\n'
+                    return
+                yield f'data: {json.dumps(message)}\n\n'
+        finally:
+            broker.unsubscribe(subscription)
+
+
+class AsyncApiView(View):
+    """Async-представление API: запрос и ответ через парсеры и рендереры DRF, ошибки API - как у APIView."""
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Как у APIView: API аутентифицируется токеном, а не сессией
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.request = Request(request, parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES])
+        try:
+            return await self.handle(request, *args, **kwargs)
+        except APIException as e:
+            return self.render(e.detail if isinstance(e.detail, (dict, list)) else {'detail': e.detail},
+                               status=e.status_code)
+
+    async def handle(self, request, *args, **kwargs):
+        return await super().dispatch(request, *args, **kwargs)
+
+    def render(self, data, status=status.HTTP_200_OK):
+        renderers = [renderer() for renderer in api_settings.DEFAULT_RENDERER_CLASSES if renderer.format != 'api']
+        try:
+            renderer, media_type = DefaultContentNegotiation().select_renderer(self.request, renderers)
+        except NotAcceptable:
+            renderer, media_type = renderers[0], renderers[0].media_type
+        content_type = f'{media_type}; charset={renderer.charset}' if renderer.charset else media_type
+        response = HttpResponse(renderer.render(data, media_type, {}), status=status, content_type=content_type)
+        patch_vary_headers(response, ('Accept',))
+        return response
+
+
+class AsyncReadView(AsyncApiView):
+    """Async-версия чтения для горячих эндпоинтов API.
+
+    Под ASGI GET и HEAD обрабатываются на event loop через async ORM и
+    не занимают поток, пока ждут базу. Остальные методы уходят в
+    синхронное DRF-представление sync_view. Аутентификация та же, что у
+    DRF (JWT из JWTAuthMiddleware), проверяется IsAuthenticated; чтение
+    идёт с реплики, как у ReplicaRoutingMixin.
+    """
+    sync_view = None
+
+    async def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') and self.sync_view is not None:
+            return await sync_to_async(self.sync_view)(request, *args, **kwargs)
+        return await super().dispatch(request, *args, **kwargs)
+
+    async def handle(self, request, *args, **kwargs):
+        auth = getattr(request, 'jwt_auth', None)
+        if auth is None:
+            try:
+                auth = await CachedJWTAuthentication().aauthenticate(request)
+            except (InvalidToken, AuthenticationFailed) as e:
+                raise NotAuthenticated(e.detail)
+        if auth is None or not auth[0].is_authenticated:
+            raise NotAuthenticated()
+        request.jwt_auth = auth
+        self.request.user, self.request.auth = auth
+        with replica_reads(request):
+            return await super().handle(request, *args, **kwargs)
+
+
+class LoginAsyncView(AsyncApiView):
+    """Вход по паролю: пара JWT {refresh, access}.
+
+    Пароль проверяется в пуле main.hashing через await, поэтому всплеск
+    входов не занимает потоки, которые обслуживают остальной API.
+    """
+
+    async def post(self, request):
+        serializer = LoginSerializer(data=self.request.data)
+        serializer.is_valid(raise_exception=True)
+        username, password = serializer.validated_data['username'], serializer.validated_data['password']
+
+        user = await User.objects.filter(username=username).afirst()
+        if user is None:
+            # Как ModelBackend: хеш считается и для неизвестного имени, чтобы
+            # время ответа не выдавало, существует ли пользователь
+            await hashing.amake_password(password)
+            raise self.no_active_account()
+        valid, must_update = await hashing.acheck_password(password, user.password)
+        if not valid or not user.is_active:
+            raise self.no_active_account()
+        if must_update:
+            user.password = await hashing.amake_password(password)
+            await user.asave(update_fields=['password'])
+
+        refresh = await sync_to_async(RefreshToken.for_user)(user)
+        return self.render({'refresh': str(refresh), 'access': str(refresh.access_token)})
+
+    @staticmethod
+    def no_active_account():
+        return AuthenticationFailed(
+            TokenObtainSerializer.default_error_messages['no_active_account'], 'no_active_account'
+        )
+
+
+class RegistrationAsyncView(AsyncApiView):
+    """Регистрация: хеш пароля считается в пуле main.hashing через await."""
+
+    async def post(self, request):
+        serializer = UserRegistrationSerializer(data=self.request.data)
+        # Проверки уникальности имени и email ходят в базу
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+        encoded_password = await hashing.amake_password(serializer.validated_data['password'])
+        await sync_to_async(serializer.save)(encoded_password=encoded_password)
+        return self.render({"message": "Пользователь успешно зарегистрировался!"}, status=status.HTTP_201_CREATED)
+
+
+class AsyncEventView(AsyncReadView):
+    def get_viewset(self, action, **kwargs):
+        """EventApiView для фильтров, валидаторов и сериализатора, без его синхронного dispatch."""
+        return EventApiView(request=self.request, action=action, args=(), kwargs=kwargs, format_kwarg=None)
+
+
+class EventListAsyncView(AsyncEventView):
+    sync_view = staticmethod(EventApiView.as_view({'get': 'list', 'post': 'create'}, basename='events', detail=False))
+
+    async def get(self, request):
+        viewset = self.get_viewset('list')
+        etag = await viewset.aget_list_validators(EventPagination())
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+
+        paginator = EventPagination()
+        page = await paginator.apaginate_queryset(viewset.get_queryset(), self.request)
+        data = paginator.get_paginated_response(viewset.get_serializer(page, many=True).data).data
+        return viewset.set_validators(self.render(data), etag, None)
+
+
+class EventDetailAsyncView(AsyncEventView):
+    sync_view = staticmethod(EventApiView.as_view(
+        {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'},
+        basename='events', detail=True,
+    ))
+
+    async def get(self, request, pk):
+        viewset = self.get_viewset('retrieve', pk=pk)
+        etag, last_modified = await viewset.aget_detail_validators()
+        if etag is None:
+            raise NotFound()
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        event = await viewset.get_queryset().filter(pk=pk).afirst()
+        if event is None:
+            raise NotFound()
+        return viewset.set_validators(self.render(viewset.get_serializer(event).data), etag, last_modified)
+
+
+class EventMarkersAsyncView(AsyncEventView):
+    async def get(self, request):
+        viewset = self.get_viewset('markers')
+        etag = await viewset.aget_list_validators(MarkerPagination())
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+
+        paginator = MarkerPagination()
+        rows = await paginator.apaginate_queryset(viewset.marker_rows(), self.request)
+        return viewset.set_validators(self.render(viewset.markers_data(rows, paginator)), etag, None)
+
+
+class CategoryListAsyncView(AsyncReadView):
+    sync_view = staticmethod(
+        CategoryApiView.as_view({'get': 'list', 'post': 'create'}, basename='categories', detail=False)
+    )
+
+    async def get(self, request):
+        # Справочник обычно уже в памяти, в базу идёт только перечитывание
+        categories = await sync_to_async(category_cache.all)()
+        return self.render(CategorySerializer(categories, many=True).data)
+
+
+class CategoryDetailAsyncView(AsyncReadView):
+    sync_view = staticmethod(CategoryApiView.as_view(
+        {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'},
+        basename='categories', detail=True,
+    ))
+
+    async def get(self, request, pk):
+        category = await sync_to_async(category_cache.get)(pk)
+        if category is None:
+            return self.render({'detail': 'Категория не найдена'}, status=status.HTTP_404_NOT_FOUND)
+        return self.render(CategorySerializer(category).data)
+
+
+class EventTileAsyncView(AsyncReadView):
+    """Мероприятия тайла карты z/x/y; тайл берётся из кэша, без обращения к базе."""
+
+    async def get(self, request, z, x, y):
+        if not settings.TILE_MIN_ZOOM <= z <= settings.TILE_MAX_ZOOM:
+            raise ValidationError({'z': f'Масштаб должен быть от {settings.TILE_MIN_ZOOM} до {settings.TILE_MAX_ZOOM}'})
+        if not (x < 2 ** z and y < 2 ** z):
+            raise NotFound('Тайл вне карты')
+
+        cache = tiles.tile_cache()
+        key = await tiles.acurrent_key(z, x, y)
+        data = await cache.aget(key)
+        if data is None:
+            limit = settings.TILE_MAX_EVENTS
+            events = [event async for event in tiles.tile_events(z, x, y)[:limit + 1]]
+            serializer = EventSerializer(events[:limit], many=True,
+                                         context={'request': self.request, 'fields': tiles.TILE_FIELDS})
+            # В плотном тайле клиенту стоит приблизить карту или взять кластеры
+            data = {'z': z, 'x': x, 'y': y, 'truncated': len(events) > limit, 'results': serializer.data}
+            await cache.aset(key, data, settings.TILE_CACHE_TIMEOUT)
+        return self.render(data)
@@ -6,7 +6,9 @@ import sys
 
 def main():
     """Run administrative tasks."""
-    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tsp.settings')
+    # Тесты запускаются со своими настройками (зеркальная реплика)
+    settings_module = 'tsp.test_settings' if sys.argv[1:2] == ['test'] else 'tsp.settings'
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc:
@@ -2,6 +2,11 @@ let eventForm = null;
 let eventModal = null;
 let map;
 let currentEvents = [];
+let changesCursor = null;
+let eventStream = null;
+
+// На более мелких масштабах вместо меток показываем кластеры
+const CLUSTER_MAX_ZOOM = 12;
 
 function initYandexMap() {
     ymaps.ready(() => {
@@ -17,9 +22,37 @@ function initYandexMap() {
         loadEvents(map);
         initLogoutButton();
         initModal(map);
+
+        // Подгружаем мероприятия только для видимой области
+        let boundsTimer = null;
+        map.events.add('boundschange', function() {
+            clearTimeout(boundsTimer);
+            boundsTimer = setTimeout(() => {
+                loadEvents(map);
+                subscribeToChanges(map);
+            }, 300);
+        });
+        subscribeToChanges(map);
     });
 }
 
+// Сервер присылает короткие уведомления об изменениях в видимой области,
+// после чего карта забирает только дельту через /api/events/changes/
+function subscribeToChanges(map) {
+    if (typeof EventSource === 'undefined') return;
+    if (eventStream) eventStream.close();
+
+    const token = encodeURIComponent(getJWTToken());
+    eventStream = new EventSource(`/stream/events/?token=${token}&bbox=${getMapBBox(map)}`);
+
+    let syncTimer = null;
+    eventStream.onmessage = () => {
+        clearTimeout(syncTimer);
+        syncTimer = setTimeout(() => syncEvents(map), 200);
+    };
+    eventStream.addEventListener('reset', () => loadEvents(map));
+}
+
 function initEventBalloons(map) {
     // Обработчик клика по метке
     map.geoObjects.events.add('click', function(e) {
@@ -128,6 +161,13 @@ function initModal(map) {
     });
 }
 
+function getMapBBox(map) {
+    const bounds = map.getBounds();
+    return [bounds[0][0], bounds[0][1], bounds[1][0], bounds[1][1]]
+        .map(value => value.toFixed(6))
+        .join(',');
+}
+
 function loadEvents(map) {
     const token = getJWTToken();
     if (!token) {
@@ -135,22 +175,109 @@ function loadEvents(map) {
         return;
     }
 
-    fetch('/api/events/', {
+    if (map.getZoom() < CLUSTER_MAX_ZOOM) {
+        loadClusters(map);
+        return;
+    }
+
+    // Курсор берём до загрузки списка, чтобы не пропустить изменения между запросами
+    fetchChanges(null, token)
+    .then(changes => {
+        changesCursor = changes.cursor;
+        return fetchAllPages(`/api/events/?page_size=500&bbox=${getMapBBox(map)}`, token);
+    })
+    .then(events => {
+        currentEvents = events;
+        addEventsToMap(map, events);
+    })
+    .catch(error => {
+        console.error('Ошибка:', error);
+        document.getElementById('status').textContent = error.message;
+    });
+}
+
+function fetchChanges(since, token) {
+    let url = `/api/events/changes/?bbox=${getMapBBox(map)}`;
+    if (since) url += `&since=${encodeURIComponent(since)}`;
+
+    return fetch(url, {
         headers: {
             'Authorization': `Bearer ${token}`,
             'Content-Type': 'application/json'
         }
+    }).then(response => {
+        if (!response.ok) throw new Error('Ошибка загрузки изменений');
+        return response.json();
+    });
+}
+
+// Применяет к карте только изменения с момента прошлой загрузки
+function syncEvents(map) {
+    const token = getJWTToken();
+    if (!token) return;
+
+    if (!changesCursor || map.getZoom() < CLUSTER_MAX_ZOOM) {
+        loadEvents(map);
+        return;
+    }
+
+    fetchChanges(changesCursor, token)
+    .then(changes => {
+        if (changes.reset) {
+            loadEvents(map);
+            return;
+        }
+        changesCursor = changes.cursor;
+
+        const events = new Map(currentEvents.map(event => [event.event_id, event]));
+        changes.deleted.forEach(eventId => events.delete(eventId));
+        changes.updated.forEach(event => events.set(event.event_id, event));
+        addEventsToMap(map, Array.from(events.values()));
     })
-    .then(response => {
+    .catch(error => {
+        console.error('Ошибка:', error);
+        document.getElementById('status').textContent = error.message;
+    });
+}
+
+// Проходит по страницам курсорной пагинации, пока сервер отдаёт ссылку next
+async function fetchAllPages(url, token) {
+    const results = [];
+    while (url) {
+        const response = await fetch(url, {
+            headers: {
+                'Authorization': `Bearer ${token}`,
+                'Content-Type': 'application/json'
+            }
+        });
         if (response.status === 500) {
             throw new Error('Серверная ошибка. Проверьте логи сервера');
         }
         if (!response.ok) throw new Error('Ошибка загрузки мероприятий');
+
+        const page = await response.json();
+        results.push(...page.results);
+        url = page.next;
+    }
+    return results;
+}
+
+function loadClusters(map) {
+    const zoom = Math.round(map.getZoom());
+
+    fetch(`/api/events/clusters/?zoom=${zoom}&bbox=${getMapBBox(map)}`, {
+        headers: {
+            'Authorization': `Bearer ${getJWTToken()}`,
+            'Content-Type': 'application/json'
+        }
+    })
+    .then(response => {
+        if (!response.ok) throw new Error('Ошибка загрузки кластеров');
         return response.json();
     })
-    .then(events => {
-        currentEvents = events;
-        addEventsToMap(map, events);
+    .then(clusters => {
+        currentEvents = [];
+        addClustersToMap(map, clusters);
     })
     .catch(error => {
         console.error('Ошибка:', error);
@@ -158,6 +285,32 @@ function loadEvents(map) {
     });
 }
 
+function addClustersToMap(map, clusters) {
+    if (!map || !map.geoObjects) return;
+    map.geoObjects.removeAll();
+
+    clusters.forEach(cluster => {
+        const coords = [cluster.latitude, cluster.longitude];
+        const placemark = new ymaps.Placemark(
+            coords,
+            {
+                iconContent: cluster.count,
+                hintContent: `Мероприятий: ${cluster.count}`
+            },
+            {
+                preset: 'islands#redCircleIcon',
+                openBalloonOnClick: false
+            }
+        );
+        // Клик по кластеру приближает карту
+        placemark.events.add('click', () => {
+            map.setCenter(coords, Math.min(map.getZoom() + 2, CLUSTER_MAX_ZOOM), { duration: 300 });
+        });
+
+        map.geoObjects.add(placemark);
+    });
+}
+
 function createEvent(map) {
     const token = getJWTToken();
     if (!token) return;
@@ -188,8 +341,8 @@ function createEvent(map) {
         eventModal.style.display = 'none';
         eventForm.reset();
 
-        // Полностью перезагружаем мероприятия с сервера
-        loadEvents(map);
+        // Забираем с сервера только изменения
+        syncEvents(map);
     })
     .catch(error => {
         console.error('Ошибка:', error);
@@ -301,6 +454,9 @@ function updateBalloonContent(event) {
                         ${(event.going_users || []).map(user => `
                             <option>${typeof user === 'object' ? user.username : user}</option>
                         `).join('')}
+                        ${(event.going_count || 0) > (event.going_users || []).length ? `
+                            <option disabled>и ещё ${event.going_count - (event.going_users || []).length}</option>
+                        ` : ''}
                     </select>
                 </div>
 
@@ -381,7 +537,7 @@ function handleDeleteEvent(eventId) {
         if (response.status === 204) {
             // Обновляем список мероприятий
             currentEvents = currentEvents.filter(e => e.event_id != eventId);
-            loadEvents(map);
+            syncEvents(map);
             map.balloon.close();
             alert('Мероприятие успешно удалено!');
         } else if (response.status === 403) {
@@ -458,7 +614,7 @@ function handleReaction(eventId, reactionType) {
     .then(data => {
         // 3. Обновляем реакцию в найденном объекте события
         currentEvent.user_reaction = reactionType;
-        loadEvents(map);
+        syncEvents(map);
 
         // Обновляем балун
         const balloon = map.balloon;
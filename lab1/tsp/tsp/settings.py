@@ -9,6 +9,7 @@ https://docs.djangoproject.com/en/4.2/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
+import importlib.util
 from datetime import timedelta
 from pathlib import Path
 # from decouple import config
@@ -50,14 +51,28 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'main.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
             'rest_framework.permissions.IsAuthenticated',
-    )
-
+    ),
+    # JSON через orjson (см. main/renderers.py)
+    'DEFAULT_RENDERER_CLASSES': [
+        'main.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'main.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
+# MessagePack (Accept: application/msgpack), если установлен пакет msgpack
+if importlib.util.find_spec('msgpack'):
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].append('main.renderers.MessagePackRenderer')
+    REST_FRAMEWORK['DEFAULT_PARSER_CLASSES'].append('main.renderers.MessagePackParser')
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
@@ -66,10 +81,92 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),  # Формат заголовка
 }
 
+# Кэши аутентификации (main.authentication), в памяти каждого процесса
+AUTH_TOKEN_CACHE_SIZE = 10000  # проверенных access-токенов
+AUTH_USER_CACHE_SIZE = 10000
+AUTH_USER_CACHE_TTL = 30       # секунд; сохранение пользователя сбрасывает запись сразу
+
+# Bloom-фильтр черного списка refresh-токенов (main.blacklist). Истёкшие
+# записи черного списка удаляет manage.py prune_token_blacklist
+TOKEN_BLACKLIST_BLOOM_REBUILD = 300       # секунд между перестроениями фильтра из базы
+TOKEN_BLACKLIST_BLOOM_ERROR_RATE = 0.01   # доля ложных срабатываний (они проверяются в базе)
+
+# Версии справочников (main.caches) и недавно отозванные refresh-токены
+# (main.blacklist) хранятся в кэше 'default'. При нескольких процессах он
+# должен быть общим (Redis/Memcached), иначе изменения справочников увидит
+# только процесс, который их внёс. С LocMemCache черный список токенов
+# проверяется в базе при каждом обновлении
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Тайлы мероприятий (main.tiles); для нескольких процессов - общий
+    # кэш (Redis/Memcached) или FileBasedCache на общем диске
+    'tiles': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tiles',
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+}
 
+# Мероприятия по тайлам карты (/api/tiles/<z>/<x>/<y>/). На меньших
+# масштабах карта показывает кластеры (/api/events/clusters/)
+TILE_CACHE_ALIAS = 'tiles'
+TILE_MIN_ZOOM = 10
+TILE_MAX_ZOOM = 18
+TILE_CACHE_TIMEOUT = 600  # секунд; запись мероприятия или реакции сбрасывает тайл сразу
+TILE_MAX_EVENTS = 500     # больше в тайле не отдаётся, ответ помечается truncated
+
+# Синхронизация изменений мероприятий (/api/events/changes/)
+EVENT_CHANGES_RETENTION = timedelta(days=7)   # сколько хранятся записи об удалениях
+EVENT_CHANGES_OVERLAP = timedelta(seconds=2)  # запас на транзакции, завершившиеся позже курсора
+EVENT_CHANGES_LIMIT = 1000                    # больше изменений - клиенту проще перезагрузить список
+
+# Замеры запросов (Server-Timing и /metrics): доля запросов в выборке
+# и адреса, которым доступен /metrics (по умолчанию только локальные,
+# пустой список - никому): метрики раскрывают задержки и нагрузку API
+METRICS_SAMPLE_RATE = 1.0
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+# Поиск ближайших мероприятий (/api/events/nearby/), радиусы в км
+EVENTS_NEARBY_LIMIT = 20
+EVENTS_NEARBY_MAX_LIMIT = 100
+EVENTS_NEARBY_START_RADIUS_KM = 1
+EVENTS_NEARBY_MAX_RADIUS_KM = 50
+
+# Мероприятия, прошедшие больше этого срока назад, manage.py archive_events
+# переносит в архивные таблицы
+EVENT_ARCHIVE_AFTER = timedelta(days=30)
+
+# Полнотекстовый поиск (/api/events/search/)
+EVENT_SEARCH_LIMIT = 20
+EVENT_SEARCH_MAX_LIMIT = 100
+
+# Загрузка мероприятий (/api/events/import/ и manage.py import_events)
+EVENT_IMPORT_BATCH_SIZE = 1000
+EVENT_IMPORT_ERRORS_LIMIT = 100  # сколько ошибочных строк возвращать в ответе
+
+# Сколько участников встраивается в going_users мероприятия; полный
+# список - /api/events/<id>/attendees/ с постраничной выдачей
+EVENT_GOING_USERS_PREVIEW = 5
+
+# Сколько реакций можно записать одним запросом /api/reactions/batch/
+REACTIONS_BATCH_LIMIT = 500
+
+# Push-уведомления об изменениях (/stream/events/, только под ASGI).
+# Для нескольких процессов: 'main.realtime.RedisBroker' и REALTIME_REDIS_URL
+REALTIME_BROKER = 'main.realtime.InMemoryBroker'
+REALTIME_REDIS_URL = 'redis://localhost:6379/0'
+REALTIME_QUEUE_SIZE = 100   # сообщений в очереди одного клиента
+REALTIME_KEEPALIVE = 15     # секунд между keepalive-комментариями
+
+
+# Все свои middleware поддерживают async: под ASGI (tsp.asgi) цепочка до
+# async-представлений не занимает поток на время запроса
 MIDDLEWARE = [
+    'main.metrics.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'main.middleware.AsyncWhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -94,6 +191,13 @@ PASSWORD_HASHERS = [
     'django.contrib.auth.hashers.PBKDF2PasswordHasher',
 ]
 
+# Пул процессов для хеширования паролей (main/hashing.py); 0 - считать в
+# рабочем процессе. QUEUE - сколько хешей может ждать одновременно,
+# остальные запросы сразу получают 503
+PASSWORD_HASHING_WORKERS = 2
+PASSWORD_HASHING_QUEUE = 16
+PASSWORD_HASHING_TIMEOUT = 10  # секунд
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -174,9 +278,35 @@ DATABASES = {
         'PASSWORD': '12345',
         'HOST': 'db',
         'PORT': '5432',
-    }
+        # Приложение работает под ASGI, где постоянные соединения
+        # (CONN_MAX_AGE > 0) не переиспользуются: каждый запрос выполняет ORM
+        # в своём потоке. Соединения берутся из пула psycopg 3
+        # (psycopg[pool]), пул сам проверяет их перед выдачей
+        'CONN_MAX_AGE': 0,
+        'OPTIONS': {
+            'pool': {'min_size': 2, 'max_size': 10, 'timeout': 10},
+        },
+    },
+    # Реплика только для чтения, например потоковая реплика PostgreSQL:
+    # 'replica': {
+    #     'ENGINE': 'django.db.backends.postgresql',
+    #     'NAME': 'tsp_db',
+    #     'USER': 'fess',
+    #     'PASSWORD': '12345',
+    #     'HOST': 'db-replica',
+    #     'PORT': '5432',
+    #     'CONN_MAX_AGE': 0,
+    #     'OPTIONS': {'pool': {'min_size': 2, 'max_size': 10, 'timeout': 10}},
+    #     'TEST': {'MIRROR': 'default'},
+    # },
 }
 
+# Чтение мероприятий и категорий идёт на перечисленные реплики
+# (main.routers), все остальные запросы - в основную базу
+DATABASE_ROUTERS = ['main.routers.ReplicaRouter']
+DATABASE_REPLICAS = []  # например, ['replica']; нужен общий кэш 'default', например Redis
+DATABASE_REPLICA_PIN = 5  # секунд после своей записи пользователь читает из основной базы
+
 # DATABASES = {
 #     'default': {
 #         'ENGINE': 'django.db.backends.postgresql',
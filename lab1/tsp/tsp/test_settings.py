@@ -0,0 +1,13 @@
+"""Настройки для тестов (manage.py test выбирает их по умолчанию).
+
+Реплика 'replica' в тестах - зеркало основной базы, поэтому тесты
+маршрутизации чтения работают без настоящей репликации. Остальные
+тесты читают из основной базы: DATABASE_REPLICAS остаётся пустым.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES
+
+DATABASES = {
+    **DATABASES,
+    'replica': {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}},
+}
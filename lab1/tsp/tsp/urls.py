@@ -4,10 +4,13 @@ from django.views.generic import RedirectView
 from main.views import (
     UserApiView, CategoryApiView,
     EventApiView, ReactionApiView,
-    UserRegistrationView, CustomTokenObtainPairView,
+    LoginAsyncView, RegistrationAsyncView, CustomTokenRefreshView,
     LogoutView, EventsTemplateView,
-    LoginTemplateView, RegisterTemplateView
+    LoginTemplateView, RegisterTemplateView,
+    EventStreamView, EventListAsyncView, EventDetailAsyncView, EventMarkersAsyncView,
+    CategoryListAsyncView, CategoryDetailAsyncView, EventTileAsyncView,
 )
+from main.metrics import metrics_view
 from rest_framework.routers import DefaultRouter
 from django.views.decorators.csrf import csrf_exempt
 
@@ -21,12 +24,24 @@ router.register(r'reactions', ReactionApiView, basename='reactions')
 urlpatterns = [
     path('', RedirectView.as_view(url='/login/', permanent=False)),
     path('admin/', admin.site.urls),
+    # Чтение списков мероприятий, меток и категорий - async-представления
+    # (под ASGI не занимают поток на время запросов к базе); остальные
+    # методы по тем же адресам они передают представлениям DRF
+    path('api/events/', EventListAsyncView.as_view(), name='events-list'),
+    path('api/events/markers/', EventMarkersAsyncView.as_view(), name='events-markers'),
+    path('api/events/<int:pk>/', EventDetailAsyncView.as_view(), name='events-detail'),
+    path('api/categories/', CategoryListAsyncView.as_view(), name='categories-list'),
+    path('api/categories/<int:pk>/', CategoryDetailAsyncView.as_view(), name='categories-detail'),
+    path('api/tiles/<int:z>/<int:x>/<int:y>/', EventTileAsyncView.as_view(), name='event-tile'),
     path('api/', include(router.urls)),
-    path('api/auth/login/', CustomTokenObtainPairView.as_view(), name='api-login'),
-    path('api/auth/register/', UserRegistrationView.as_view(), name='api-register'),
+    path('api/auth/login/', LoginAsyncView.as_view(), name='api-login'),
+    path('api/auth/refresh/', CustomTokenRefreshView.as_view(), name='api-refresh'),
+    path('api/auth/register/', RegistrationAsyncView.as_view(), name='api-register'),
     path('login/', LoginTemplateView.as_view(), name='login'),
     path('register/', RegisterTemplateView.as_view(), name='register'),
     path('map/', EventsTemplateView.as_view(), name='map'),
     path('logout/', csrf_exempt(LogoutView.as_view()), name='logout'),
+    path('stream/events/', EventStreamView.as_view(), name='event-stream'),
+    path('metrics', metrics_view, name='metrics'),
 
 ]
\ No newline at end of file